@@ -1,10 +1,23 @@
 # -*- coding: utf-8 -*-
 from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Body
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from typing import List, Optional, Dict, Any
+from app.core.config import settings
 from app.services.sync_service import SyncService
 from app.services.rag_service import RAGService
 from app.services.email_service import EmailService
-from app.models.schemas import Doc, Repo, Member, DocSummary, Activity
+from app.services.answer_cache import get_answer_cache
+from app.services.embedding_cache import get_query_embedding_cache
+from app.services.search_cache import get_search_cache
+from app.services.keyword_index import get_keyword_index
+from app.services.typeahead import get_typeahead_index
+from app.services.near_duplicates import get_duplicate_index
+from app.services.model_providers import get_model_metrics
+from app.services import reindex, related_docs, vector_gc
+from beanie.operators import In
+from app.models.schemas import Doc, Repo, Member, DocSummary, RelatedDocView, Activity
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -113,7 +126,7 @@ async def get_docs(
     # 排除 body 内容以减少传输量，详情请单独查询
     return await query.project(DocSummary).skip(skip).limit(limit).to_list()
 
-@router.get("/docs/{slug}", response_model=Doc, summary="获取文档详情")
+@router.get("/docs/{slug}", response_model=Doc, response_model_exclude={"plain_text"}, summary="获取文档详情")
 async def get_doc_detail(slug: str):
     """
     根据 slug 获取文档详情
@@ -123,14 +136,72 @@ async def get_doc_detail(slug: str):
         raise HTTPException(status_code=404, detail="Document not found")
     return doc
 
+@router.get("/docs/{slug}/related", response_model=List[RelatedDocView], summary="相关文档")
+async def get_related_docs(slug: str, limit: int = Query(5, ge=1, le=50)):
+    """
+    读取离线计算的相关文档 (按文档级向量的余弦相似度降序，每天定时更新)
+    尚未计算过的新文档返回空列表
+    """
+    results = await related_docs.get_related(slug, min(limit, settings.RELATED_DOCS_TOP_K))
+    if results is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return results
+
+async def run_related_docs_task():
+    """后台相关文档计算任务包装器"""
+    try:
+        await related_docs.RelatedDocsBuilder(RAGService()).run()
+    except Exception as e:
+        logger.error(f"Related docs build failed: {e}")
+
+@router.post("/ai/related-docs", summary="重新计算相关文档")
+async def trigger_related_docs(background_tasks: BackgroundTasks):
+    """
+    重新计算文档级向量与相关文档列表 (每天也会定时执行一次)，结果见 GET /ai/related-docs/status
+    """
+    if related_docs.is_running() or reindex.is_running():
+        raise HTTPException(status_code=409, detail="计算或重建任务正在进行中")
+    background_tasks.add_task(run_related_docs_task)
+    return {"message": "相关文档计算已在后台启动"}
+
+@router.get("/ai/related-docs/status", summary="相关文档计算报告")
+async def related_docs_status():
+    return related_docs.get_related_report() or {"status": "idle"}
+
 @router.get("/search", response_model=List[Doc], summary="全文搜索")
-async def search_docs(q: str = Query(..., min_length=1)):
+async def search_docs(q: str = Query(..., min_length=1), limit: int = 50):
     """
-    基于 MongoDB 文本索引进行全文搜索
+    全文搜索：优先使用进程内 BM25 索引 (支持中文)，索引未就绪时回退到 MongoDB 文本索引
+    返回完整的 Doc 结构，仅排除 body 字段
     """
+    collection = Doc.get_pymongo_collection()
+    keyword_index = get_keyword_index()
+    if keyword_index.ready:
+        hit_ids = [doc_id for doc_id, _ in keyword_index.search(q, limit=limit)]
+        if not hit_ids:
+            return []
+        raws = await collection.find({"yuque_id": {"$in": hit_ids}}, projection={"body": 0}).to_list(None)
+        docs_map = {raw["yuque_id"]: Doc.model_validate(raw) for raw in raws}
+        return [docs_map[doc_id] for doc_id in hit_ids if doc_id in docs_map]
+
     # 使用 $text 操作符进行搜索
     # 注意：需要在 Doc 模型中定义 text 索引
-    return await Doc.find({"$text": {"$search": q}}).project(exclude=Doc.body).to_list()
+    raws = await collection.find({"$text": {"$search": q}}, projection={"body": 0}).limit(limit).to_list(None)
+    return [Doc.model_validate(raw) for raw in raws]
+
+@router.get("/search/suggest", summary="搜索输入联想")
+async def suggest(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    types: Optional[str] = None,
+    repo_id: Optional[int] = None
+):
+    """
+    输入联想：匹配文档标题、知识库名与成员名 (支持拼音全拼 / 首字母)
+    使用进程内前缀索引，不访问 MongoDB；types 为逗号分隔的 doc / repo / member，默认全部
+    """
+    kinds = {t.strip() for t in types.split(",") if t.strip()} if types else None
+    return get_typeahead_index().suggest(q, limit=limit, types=kinds, repo_id=repo_id)
 
 # --- AI / RAG Endpoints ---
 
@@ -154,6 +225,110 @@ async def chat_rag(
     rag = RAGService()
     return await rag.chat(query, repo_id=repo_id, session_id=session_id)
 
+@router.post("/chat/rag/stream", summary="RAG 智能问答 (流式)")
+async def chat_rag_stream(
+    query: str = Body(..., embed=True),
+    repo_id: Optional[int] = Body(None, embed=True),
+    session_id: Optional[str] = Body(None, embed=True),
+    format: str = Query("ndjson", pattern="^(ndjson|sse)$", description="ndjson: 每行一个 JSON 事件; sse: text/event-stream")
+):
+    """
+    流式问答：先返回检索来源，再逐段返回回答
+    事件类型: sources / token / done / error (见 RAGService.chat_stream)
+    """
+    rag = RAGService()
+
+    async def event_stream():
+        async for event in rag.chat_stream(query, repo_id=repo_id, session_id=session_id):
+            data = json.dumps(jsonable_encoder(event), ensure_ascii=False)
+            if format == "sse":
+                yield f"event: {event['type']}\ndata: {data}\n\n"
+            else:
+                yield data + "\n"
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    # 关闭 Nginx 代理缓冲，保证逐段下发
+    return StreamingResponse(
+        event_stream(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def run_reindex_task(keep_previous: bool):
+    """后台向量集合重建任务包装器"""
+    try:
+        await reindex.Reindexer(RAGService()).run(keep_previous=keep_previous)
+    except Exception as e:
+        logger.error(f"Reindex failed: {e}")
+
+@router.post("/ai/reindex", summary="重建向量集合 (蓝绿切换)")
+async def trigger_reindex(background_tasks: BackgroundTasks, keep_previous: bool = Query(True, description="保留上一个版本的集合用于回滚")):
+    """
+    按当前配置 (Embedding 模型 / 维度 / 量化 / 混合检索) 重建向量集合，完成后原子切换别名，重建期间检索不受影响
+    进度见 GET /ai/reindex/status
+    """
+    if reindex.is_running() or vector_gc.is_running():
+        raise HTTPException(status_code=409, detail="重建或回收任务正在进行中")
+    background_tasks.add_task(run_reindex_task, keep_previous)
+    return {"message": "向量集合重建已在后台启动"}
+
+@router.get("/ai/reindex/status", summary="向量集合重建进度")
+async def reindex_status():
+    return reindex.get_reindex_progress() or {"status": "idle"}
+
+@router.post("/ai/reindex/rollback", summary="向量集合切回上一个版本")
+async def reindex_rollback():
+    if reindex.is_running():
+        raise HTTPException(status_code=409, detail="重建任务正在进行中")
+    collection = reindex.rollback(RAGService())
+    if not collection:
+        raise HTTPException(status_code=404, detail="没有可回滚的旧版本集合")
+    return {"collection": collection}
+
+async def run_vector_gc_task(dry_run: bool):
+    """后台孤儿向量回收任务包装器"""
+    try:
+        await vector_gc.OrphanVectorCollector(RAGService(), dry_run=dry_run).run()
+    except Exception as e:
+        logger.error(f"Vector GC failed: {e}")
+
+@router.post("/ai/vector-gc", summary="回收孤儿向量")
+async def trigger_vector_gc(background_tasks: BackgroundTasks, dry_run: bool = Query(False, description="只统计不删除")):
+    """
+    对账 Qdrant 与 MongoDB，删除已不存在文档的向量 (每天也会定时执行一次)
+    结果见 GET /ai/vector-gc/status
+    """
+    if vector_gc.is_running() or reindex.is_running():
+        raise HTTPException(status_code=409, detail="回收或重建任务正在进行中")
+    background_tasks.add_task(run_vector_gc_task, dry_run)
+    return {"message": "孤儿向量回收已在后台启动"}
+
+@router.get("/ai/vector-gc/status", summary="孤儿向量回收报告")
+async def vector_gc_status():
+    return vector_gc.get_gc_report() or {"status": "idle"}
+
+@router.get("/ai/duplicates", summary="近似重复文档")
+async def list_duplicates(
+    repo_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500, description="最多返回的簇数")
+):
+    """
+    按 SimHash 聚合的近似重复文档簇 (按簇大小降序)，每簇内按 yuque_id 升序
+    指定 repo_id 时返回包含该知识库文档的簇 (簇内可能有其他知识库的文档)
+    """
+    index = get_duplicate_index()
+    clusters = index.clusters(repo_id=repo_id)[:limit]
+    doc_ids = [doc_id for cluster in clusters for doc_id in cluster]
+    docs = await Doc.find(In(Doc.yuque_id, doc_ids)).project(DocSummary).to_list() if doc_ids else []
+    docs_map = {d.yuque_id: d for d in docs}
+    return {
+        **index.stats(),
+        "items": [
+            {"size": len(cluster), "docs": [docs_map[doc_id] for doc_id in cluster if doc_id in docs_map]}
+            for cluster in clusters
+        ],
+    }
+
 @router.post("/ai/explain", summary="AI 助读/解释")
 async def ai_explain(text: str = Body(..., embed=True)):
     """
@@ -162,6 +337,25 @@ async def ai_explain(text: str = Body(..., embed=True)):
     rag = RAGService()
     return await rag.explain(text)
 
+@router.get("/ai/cache/stats", summary="AI 缓存命中率")
+async def ai_cache_stats():
+    """
+    查看进程内 AI 相关缓存的容量与命中率
+    """
+    return {
+        "query_embedding": get_query_embedding_cache().stats(),
+        "search_result": get_search_cache().stats(),
+        "answer": get_answer_cache().stats(),
+        "keyword_index": get_keyword_index().stats()
+    }
+
+@router.get("/ai/models/stats", summary="AI 模型调用统计")
+async def ai_model_stats():
+    """
+    按 类型:提供方 (如 embedding:openai / chat:openai) 查看进程内的调用次数、token 数与耗时分位数
+    """
+    return get_model_metrics().stats()
+
 @router.post("/email/test", summary="发送测试邮件")
 async def send_test_email(to_email: str = Body(..., embed=True)):
     """
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -14,6 +16,112 @@ class Settings(BaseSettings):
     OPENAI_BASE_URL: str = "https://api.chatanywhere.tech/v1" # 支持兼容接口
     QDRANT_URL: str = "http://localhost:6333"
     QDRANT_COLLECTION_NAME: str = "yuque_docs"
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
+    CHAT_MODEL: str = "gpt-4o" # 或 gpt-3.5-turbo
+    # 模型提供方 (见 app/services/model_providers.py)
+    # openai: 远程接口；local: 本地 ONNX 句向量模型 (CPU 推理，需 pip install onnxruntime tokenizers，
+    # 且须设置 EMBEDDING_DIMENSIONS 为模型输出维度)；fake: 确定性假向量 / 固定回答，用于测试与离线开发
+    # 切换 Embedding 提供方会改变向量空间，需像修改维度一样指向新集合并全量同步
+    EMBEDDING_PROVIDER: str = "openai"
+    LLM_PROVIDER: str = "openai" # openai / fake
+    LOCAL_EMBEDDING_MODEL_DIR: str = "" # 包含 model.onnx 与 tokenizer.json 的目录
+    LOCAL_EMBEDDING_BATCH_SIZE: int = 32
+    LOCAL_EMBEDDING_MAX_LENGTH: int = 512 # 超出的 token 截断
+    LOCAL_EMBEDDING_POOLING: str = "mean" # mean / cls，取决于模型
+    LOCAL_EMBEDDING_QUERY_PREFIX: str = "" # 查询指令前缀 (bge / e5 等模型需要)
+    # 开启后集合使用 dense + sparse 命名向量，搜索由 Qdrant 一次完成混合召回与融合
+    # (需新建集合；已有的旧集合会自动回退到客户端混合检索)
+    QDRANT_HYBRID_SEARCH: bool = False
+
+    # 向量压缩 (降低 Qdrant 内存占用)
+    # 维度变更需要重新向量化：调用 POST /ai/reindex 重建到新版本集合后切换别名 (见 reindex.py)；
+    # 量化 / 磁盘存储配置在启动时原地更新到已有集合
+    EMBEDDING_DIMENSIONS: int = 0 # text-embedding-3 的 dimensions 参数 (如 512)，0 表示模型默认维度
+    QDRANT_QUANTIZATION: str = "" # "" 不量化 / scalar (int8，约 1/4 内存) / binary (1 bit，约 1/32 内存)
+    QDRANT_QUANTIZATION_RESCORE: bool = True # 量化召回后用原始向量重打分
+    QDRANT_QUANTIZATION_OVERSAMPLING: float = 2.0 # 重打分前多取的候选倍数
+    QDRANT_VECTORS_ON_DISK: bool = False # 原始向量放磁盘 (配合量化时内存只保留量化向量)
+    QDRANT_HNSW_ON_DISK: bool = False
+    QDRANT_SLIM_PAYLOAD: bool = False # 点上只存 ID 与过滤字段，切片正文从 doc_chunks 补齐 (见 slim_payload.py)，已有的点需重建集合后才会瘦身
+
+    # 结构感知切片 (见 chunker.py)：修改后需重建向量集合 (POST /ai/reindex) 才会作用于已有文档
+    CHUNK_SIZE: int = 1000 # 切片最大字符数
+    CHUNK_OVERLAP: int = 200 # 超长段落切分时相邻片段的重叠字符数
+
+    # 文档摘要 (见 summarizer.py)：同步时按内容指纹计算一次，存入 Doc.summary
+    SUMMARY_MAX_CHARS: int = 200
+    SUMMARY_LLM_ENABLED: bool = False # 额外调用 LLM 生成摘要 (后台队列逐篇生成，替换抽取式摘要)
+    SUMMARY_LLM_INPUT_CHARS: int = 6000 # 送入 LLM 的正文最大字符数
+
+    # 向量集合蓝绿重建：QDRANT_COLLECTION_NAME 为别名，重建写入新的版本化集合后原子切换
+    REINDEX_BATCH_SIZE: int = 50 # 每批从 MongoDB 读取的文档数
+    REINDEX_CONCURRENCY: int = 4 # 同时切片 / 向量化的批次数
+    REINDEX_MAX_FAILURE_RATIO: float = 0.01 # 失败文档占比超过该值时放弃切换，保留现有集合
+
+    # 孤儿向量回收 (见 vector_gc.py)：每天定时对账 Qdrant 与 MongoDB，删除已不存在文档的向量
+    VECTOR_GC_ENABLED: bool = True
+    VECTOR_GC_HOUR: int = 4 # 每天执行的时间 (北京时间，小时)，避开 03:00 的全量同步
+    VECTOR_GC_PAGE_SIZE: int = 1000 # 每页滚动的点数
+
+    # 近似重复文档 (见 near_duplicates.py)：同步时计算 SimHash，搜索 / 问答按重复簇折叠结果
+    DUPLICATE_COLLAPSE: bool = True
+    DUPLICATE_MAX_DISTANCE: int = 3 # SimHash 汉明距离不超过该值视为重复 (须小于分段数 4)
+    DUPLICATE_MIN_CHARS: int = 200 # 去除空白后短于该长度的文档不参与检测 (空模板 / 占位文档)
+
+    # 相关文档 (见 related_docs.py)：每天定时由切片向量求均值得到文档级向量，离线计算 kNN 邻居列表
+    RELATED_DOCS_ENABLED: bool = True
+    RELATED_DOCS_HOUR: int = 5 # 每天执行的时间 (北京时间，小时)，在全量同步与孤儿向量回收之后
+    RELATED_DOCS_TOP_K: int = 10 # 每篇文档保存的邻居数
+    RELATED_DOCS_BATCH_SIZE: int = 1024 # 分块矩阵乘法每块的行数 (峰值内存约 行数 x 文档数 x 4 字节)
+    RELATED_DOCS_COLLECTION_SUFFIX: str = "_doc_vectors" # 文档级向量集合名 = QDRANT_COLLECTION_NAME + 后缀
+
+    # 查询向量缓存 (search / chat 共用)
+    EMBEDDING_CACHE_SIZE: int = 2048 # 0 表示关闭缓存
+    EMBEDDING_CACHE_TTL: int = 60 * 60 * 24 * 7 # 7 days
+    EMBEDDING_CACHE_PATH: str = "" # 持久化文件路径，为空则仅保存在内存
+
+    # 混合检索结果缓存 (按知识库 generation 失效)
+    SEARCH_CACHE_SIZE: int = 512 # 0 表示关闭缓存
+    SEARCH_CACHE_TTL: int = 300 # 兜底过期时间 (秒)
+
+    # 回答缓存 (首轮问答与 AI 解释)：精确命中 + 语义命中 (检索到相同文档的相似问题)，引用文档变更时失效
+    ANSWER_CACHE_SIZE: int = 1024 # 0 表示关闭缓存
+    ANSWER_CACHE_TTL: int = 60 * 60 * 24 # 兜底过期时间 (秒)
+    ANSWER_CACHE_SIMILARITY: float = 0.95 # 语义命中的余弦相似度阈值，设为 1 只做精确命中
+
+    # 混合检索融合参数 (用 benchmarks/bench_retrieval.py 评估后再调整)
+    SEARCH_RRF_K: int = 60
+    SEARCH_KEYWORD_WEIGHT: float = 1.5 # 关键词路相对向量路的权重
+    SEARCH_CANDIDATE_MULTIPLIER: int = 2 # 每路召回 limit 的倍数
+    SEARCH_MIN_CANDIDATES: int = 50
+
+    # 关键词索引 (BM25) 快照文件，为空则每次启动从 MongoDB 重建
+    KEYWORD_INDEX_PATH: str = ""
+
+    # 对话历史：只带最近若干轮 (且不超过 token 预算)，更早的轮次折叠进会话摘要
+    CHAT_HISTORY_MAX_TURNS: int = 6
+    CHAT_HISTORY_TOKEN_BUDGET: int = 2000
+    CHAT_SUMMARY_TOKEN_BUDGET: int = 500
+
+    # 多轮问答的推测检索：问题改写 (一次 LLM 调用) 与按原问题的检索并行，
+    # 改写结果与原问题几乎相同时直接复用检索结果；明显自成一体的问题 (无指代、不过短) 跳过改写
+    CHAT_SPECULATIVE_RETRIEVAL: bool = True
+    CHAT_REWRITE_REUSE_SIMILARITY: float = 0.8 # 改写前后问题的词集合 Jaccard 相似度不低于该值时复用
+
+    # 问答多查询扩展：复合问题拆成若干子查询，与原问题并发检索后按切片 RRF 融合
+    # "" 关闭；"keywords" 按标点与连接词拆分 (无模型调用)；"llm" 由 LLM 拆分 (与原问题的检索并行)
+    CHAT_QUERY_EXPANSION: Literal["", "keywords", "llm"] = "" # 取值在启动时校验
+    CHAT_EXPANSION_MAX_QUERIES: int = 3 # 子查询数上限 (不含原问题)
+
+    # 问答上下文：命中切片及其相邻内容，总量不超过 token 预算
+    CHAT_CONTEXT_TOKEN_BUDGET: int = 3000
+    CHAT_CONTEXT_MAX_DOCS: int = 3
+
+    # MMR 多样性重排 (按接口配置；lambda 越小越强调多样性，设为 1 关闭重排)
+    CHAT_RETRIEVAL_K: int = 6 # 重排后交给上下文构建的切片数
+    CHAT_MMR_FETCH_K: int = 10 # 从 Qdrant 取回的候选切片数
+    CHAT_MMR_LAMBDA: float = 0.5
+    SEARCH_MMR_LAMBDA: float = 0.7 # 候选数沿用搜索的 candidate_limit，重排后保留 limit 个
 
     # Security
     SECRET_KEY: str = "your-secret-key-please-change-in-production"
@@ -1,10 +1,11 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
 
 from app.core.config import settings
-from app.models.schemas import User, Repo, Doc, Member, Comment, ChatSession, ChatMessage, Activity
+from app.models.schemas import User, Repo, Doc, DocChunk, RelatedDocs, Member, Comment, ChatSession, ChatMessage, Activity
 from app.api.routes import router as api_router
 from app.api.webhook import router as webhook_router
 from app.api.auth import router as auth_router
@@ -24,19 +25,38 @@ async def lifespan(app: FastAPI):
     # 2. 初始化 Beanie (ODM)
     await init_beanie(
         database=client[settings.MONGO_DB_NAME],
-        document_models=[User, Repo, Doc, Member, Comment, ChatSession, ChatMessage, Activity],
+        document_models=[User, Repo, Doc, DocChunk, RelatedDocs, Member, Comment, ChatSession, ChatMessage, Activity],
         allow_index_dropping=True
     )
     
-    # 3. 启动定时任务调度器
+    # 3. 加载关键词索引快照 (或从 MongoDB 重建)、构建输入联想 / 近似重复索引、补齐缺失的文档摘要，在后台进行不阻塞启动
+    from app.services.keyword_index import warmup_keyword_index, save_keyword_index
+    warmup_task = asyncio.create_task(warmup_keyword_index())
+    from app.services.typeahead import rebuild_typeahead_index
+    typeahead_task = asyncio.create_task(rebuild_typeahead_index())
+    from app.services.near_duplicates import rebuild_duplicate_index
+    duplicate_task = asyncio.create_task(rebuild_duplicate_index())
+    from app.services.summarizer import backfill_summaries
+    summary_task = asyncio.create_task(backfill_summaries())
+
+    # 4. 启动定时任务调度器
     from app.services.scheduler import SchedulerService
     scheduler_service = SchedulerService()
     scheduler_service.start()
     
     yield
     
-    # 4. 关闭清理
+    # 5. 关闭清理
     scheduler_service.stop()
+    warmup_task.cancel()
+    typeahead_task.cancel()
+    duplicate_task.cancel()
+    summary_task.cancel()
+    await save_keyword_index()
+
+    # 持久化查询向量缓存 (未配置 EMBEDDING_CACHE_PATH 时为空操作)
+    from app.services.embedding_cache import get_query_embedding_cache
+    get_query_embedding_cache().save()
     # client.close()
 
 app = FastAPI(
@@ -93,6 +93,8 @@ class ChatSession(Document):
     """
     user_id: Optional[str] = None # 关联的用户ID (可选)
     title: Optional[str] = None # 会话标题
+    summary: Optional[str] = None # 早期轮次的滚动摘要
+    summary_until: Optional[datetime] = None # 已折叠进摘要的最后一条消息时间
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -111,6 +113,9 @@ class ChatMessage(Document):
 
     class Settings:
         name = "chat_messages"
+        indexes = [
+            [("session_id", 1), ("created_at", 1)] # 按会话取最近消息
+        ]
 
 class Doc(Document):
     """
@@ -136,6 +141,11 @@ class Doc(Document):
     cover: Optional[str] = None
     body: Optional[str] = None # Markdown 或 Lake 格式
     body_html: Optional[str] = None # HTML 格式
+    plain_text: Optional[str] = None # 去除标记后的纯文本 (同步时计算，供检索摘要/索引使用)
+    summary: Optional[str] = None # 预先计算的摘要 (见 summarizer.py)，供动态流 / 搜索结果 / 问答引用展示
+    summary_fingerprint: Optional[str] = None # 生成摘要时的内容指纹，内容未变时不重复计算
+    summary_source: Optional[str] = None # extractive / llm
+    simhash: Optional[int] = None # 纯文本的 64 位 SimHash (同步时计算，见 near_duplicates.py)，正文过短时为空
     format: Optional[str] = None # lake, markdown, html
     word_count: int = 0
     
@@ -182,6 +192,7 @@ class DocSummary(BaseModel):
     depth: int = 0
     description: Optional[str] = None
     cover: Optional[str] = None
+    summary: Optional[str] = None
     format: Optional[str] = None
     word_count: int = 0
     likes_count: int = 0
@@ -195,6 +206,92 @@ class DocSummary(BaseModel):
     user_id: Optional[int] = None
     last_editor_id: Optional[int] = None
 
+class DocSearchView(BaseModel):
+    """
+    关键词检索视图模型 (仅包含生成结果卡片所需字段，plain_text 为截断后的前缀)
+    """
+    yuque_id: Optional[int] = None
+    slug: str
+    repo_id: int
+    title: str
+    description: Optional[str] = None
+    updated_at: Optional[datetime] = None
+    plain_text: Optional[str] = None
+    summary: Optional[str] = None
+
+class DocContextView(BaseModel):
+    """
+    问答上下文视图模型 (不读取带标记的 body，正文使用清洗后的 plain_text)
+    """
+    yuque_id: Optional[int] = None
+    slug: str
+    title: str
+    user_id: Optional[int] = None
+    updated_at: Optional[datetime] = None
+    plain_text: Optional[str] = None
+    summary: Optional[str] = None
+
+class DocIndexView(BaseModel):
+    """
+    向量化视图模型 (重建索引时批量读取，不含 body_html 等大字段；plain_text 缺失时才回退到 body)
+    """
+    yuque_id: Optional[int] = None
+    slug: str
+    repo_id: int
+    title: str
+    body: Optional[str] = None
+    plain_text: Optional[str] = None
+    user_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class DocChunk(Document):
+    """
+    文档切片 (结构感知切片的结果，见 chunker.py)
+    text_start / text_end 为切片在 Doc.plain_text 中的位置；point_id 为对应的 Qdrant 点 ID，
+    由 doc_id 与内容哈希确定，正文未变的切片在更新 / 重建时直接复用
+    """
+    doc_id: int = Indexed()
+    repo_id: Optional[int] = None
+    seq: int # 切片在文档中的顺序
+    heading: str = "" # 所在标题路径，如 "部署 > Docker"
+    kind: str = "text" # text / code / table
+    text: str
+    text_start: int
+    text_end: int
+    hash: str # 向量化内容 (文档标题、标题路径与切片正文) 的 sha1
+    point_id: str
+    source_hash: str # 生成切片时标题、正文与切片参数的 sha1，用于判断切片是否过期
+    chunker_version: int
+
+    class Settings:
+        name = "doc_chunks"
+        indexes = [
+            [("doc_id", 1), ("seq", 1)],
+            "point_id" # 精简 payload 的检索结果按点 ID 补齐正文
+        ]
+
+class RelatedNeighbor(BaseModel):
+    doc_id: int
+    score: float
+
+class RelatedDocs(Document):
+    """
+    相关文档 (定时任务按文档级向量离线计算的 kNN 邻居列表，见 related_docs.py)
+    文档页按 slug 单次索引查询即可取到，不需要实时向量检索
+    """
+    doc_id: int = Indexed(unique=True)
+    slug: str = Indexed()
+    neighbors: List[RelatedNeighbor] = []
+    computed_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "doc_related"
+
+class RelatedDocView(DocSummary):
+    """相关文档接口返回的视图 (文档列表字段 + 相似度)"""
+    score: float
+
 class Comment(Document):
     """
     语雀评论模型
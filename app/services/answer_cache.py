@@ -0,0 +1,261 @@
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict, defaultdict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.text_utils import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+def docs_fingerprint(docs: Iterable) -> str:
+    """上下文文档指纹：文档 id + 更新时间，任一引用文档被编辑后指纹随之变化"""
+    parts = sorted(f"{d.yuque_id}:{d.updated_at.isoformat() if d.updated_at else ''}" for d in docs)
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class AnswerKey:
+    """
+    回答缓存键
+    - kind: "chat" / "explain"
+    - question: chat 为归一化后的问题，explain 为原文 (仅 NFKC、去末尾空白)
+    - fingerprint: 上下文文档指纹 (explain 为空)
+    - vector: 问题向量，提供时才参与语义命中
+    - doc_ids: 引用的文档，任一文档变更时条目失效
+    """
+    __slots__ = ("kind", "repo_id", "fingerprint", "question", "vector", "doc_ids")
+
+    def __init__(self, kind: str, question: str, repo_id: Optional[int] = None, fingerprint: str = "",
+                 vector: Optional[List[float]] = None, doc_ids: Iterable[int] = ()):
+        self.kind = kind
+        self.repo_id = repo_id
+        self.fingerprint = fingerprint
+        # explain 的文本多为代码片段，大小写与缩进有意义，只做 NFKC 并去掉末尾空白
+        if kind == "explain":
+            self.question = unicodedata.normalize("NFKC", question or "").rstrip()
+        else:
+            self.question = normalize_query(question)
+        self.vector = vector
+        self.doc_ids = tuple(doc_ids)
+
+    @property
+    def bucket(self) -> Tuple[str, Optional[int], str]:
+        return (self.kind, self.repo_id, self.fingerprint)
+
+    @property
+    def exact(self) -> Tuple[str, Optional[int], str, str]:
+        return (*self.bucket, self.question)
+
+
+class AnswerCache:
+    """
+    LLM 回答缓存 (LRU + TTL)
+    - 精确命中: (类型, repo_id, 上下文文档指纹, 归一化问题)
+    - 语义命中: 同一 (类型, repo_id, 指纹) 下问题向量的余弦相似度不低于阈值，
+      即检索到了同样的文档、问法不同的问题 (每个分组只有少量问题，直接矩阵运算比较)
+    - 失效: 引用文档变更时按文档 id 删除 (指纹本身也会变化)；TTL 兜底
+    - 合并: 相同精确键的并发请求只调用一次 LLM，其余请求等待其结果
+    """
+    def __init__(self, max_size: int = 1024, ttl: int = 24 * 3600, similarity: float = 0.95):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity = similarity
+        # exact key -> (写入时间, 回答, 问题向量, 引用文档)
+        self._entries: "OrderedDict[tuple, Tuple[float, str, Optional[np.ndarray], Tuple[int, ...]]]" = OrderedDict()
+        self._buckets: Dict[tuple, Set[tuple]] = defaultdict(set)
+        self._by_doc: Dict[int, Set[tuple]] = defaultdict(set)
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _remove(self, exact: tuple):
+        entry = self._entries.pop(exact, None)
+        if entry is None:
+            return
+        bucket = self._buckets.get(exact[:3])
+        if bucket is not None:
+            bucket.discard(exact)
+            if not bucket:
+                del self._buckets[exact[:3]]
+        for doc_id in entry[3]:
+            keys = self._by_doc.get(doc_id)
+            if keys is not None:
+                keys.discard(exact)
+                if not keys:
+                    del self._by_doc[doc_id]
+
+    def _expired(self, created_at: float) -> bool:
+        return bool(self.ttl) and time.time() - created_at > self.ttl
+
+    def _semantic_lookup(self, key: AnswerKey) -> Optional[str]:
+        candidates = [k for k in self._buckets.get(key.bucket, ()) if self._entries[k][2] is not None]
+        if not candidates:
+            return None
+        matrix = np.stack([self._entries[k][2] for k in candidates])
+        query = np.asarray(key.vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if not norm:
+            return None
+        scores = matrix @ (query / norm)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        exact = candidates[best]
+        created_at, answer, _, _ = self._entries[exact]
+        if self._expired(created_at):
+            self._remove(exact)
+            return None
+        self._entries.move_to_end(exact)
+        return answer
+
+    def get(self, key: AnswerKey) -> Optional[str]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key.exact)
+            if entry is not None:
+                if self._expired(entry[0]):
+                    self._remove(key.exact)
+                else:
+                    self._entries.move_to_end(key.exact)
+                    self.hits += 1
+                    return entry[1]
+            if key.vector is not None and self.similarity < 1:
+                answer = self._semantic_lookup(key)
+                if answer is not None:
+                    self.hits += 1
+                    self.semantic_hits += 1
+                    return answer
+            self.misses += 1
+            return None
+
+    def put(self, key: AnswerKey, answer: str):
+        if not self.enabled or not answer:
+            return
+        vector = None
+        if key.vector is not None:
+            vector = np.asarray(key.vector, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            vector = vector / norm if norm else None
+        with self._lock:
+            self._remove(key.exact)
+            self._entries[key.exact] = (time.time(), answer, vector, key.doc_ids)
+            self._buckets[key.bucket].add(key.exact)
+            for doc_id in key.doc_ids:
+                self._by_doc[doc_id].add(key.exact)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_doc(self, doc_id: int):
+        """文档变更：引用了该文档的回答全部失效"""
+        with self._lock:
+            keys = self._by_doc.pop(doc_id, set())
+            for exact in list(keys):
+                self._remove(exact)
+            if keys:
+                self.invalidations += 1
+
+    # --- 并发合并 ---
+
+    async def wait(self, key: AnswerKey) -> Optional[str]:
+        """
+        先查缓存，未命中时若有相同请求正在生成则等待其结果
+        返回 None 表示需要调用方自己生成 (此时应调用 claim 登记)
+        """
+        answer = self.get(key)
+        if answer is not None:
+            return answer
+        future = self._inflight.get(key.exact)
+        if future is None:
+            return None
+        self.coalesced += 1
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            # 领头请求失败或被取消，由当前请求自行生成
+            return None
+
+    def claim(self, key: AnswerKey):
+        """登记为该键的生成方 (同一事件循环内 wait 与 claim 之间没有 await，不会重复登记)"""
+        if self.enabled and key.exact not in self._inflight:
+            future = asyncio.get_running_loop().create_future()
+            # 没有等待方时也标记异常已读取，避免 "exception was never retrieved" 日志
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._inflight[key.exact] = future
+
+    def resolve(self, key: AnswerKey, answer: Optional[str] = None, error: Optional[BaseException] = None):
+        """生成结束：写入缓存并唤醒等待方；失败时 answer 为 None"""
+        if answer is not None and error is None:
+            self.put(key, answer)
+        future = self._inflight.pop(key.exact, None)
+        if future is None or future.done():
+            return
+        if answer is not None and error is None:
+            future.set_result(answer)
+        else:
+            future.set_exception(error or RuntimeError("answer generation failed"))
+
+    async def get_or_generate(self, key: AnswerKey, generate: Callable[[], Awaitable[str]]) -> str:
+        answer = await self.wait(key)
+        if answer is not None:
+            return answer
+        self.claim(key)
+        try:
+            answer = await generate()
+        except BaseException as e:
+            self.resolve(key, error=e)
+            raise
+        self.resolve(key, answer)
+        return answer
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._by_doc.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_answer_cache: Optional[AnswerCache] = None
+
+
+def get_answer_cache() -> AnswerCache:
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = AnswerCache(
+            max_size=settings.ANSWER_CACHE_SIZE,
+            ttl=settings.ANSWER_CACHE_TTL,
+            similarity=settings.ANSWER_CACHE_SIMILARITY,
+        )
+    return _answer_cache
+
+
+def invalidate_doc(doc_id: int):
+    get_answer_cache().invalidate_doc(doc_id)
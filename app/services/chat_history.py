@@ -0,0 +1,137 @@
+import logging
+from datetime import datetime
+from typing import List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from app.core.config import settings
+from app.models.schemas import ChatMessage, ChatSession
+from app.services.token_counter import count_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 单次折叠最多处理的消息数 (历史很长的旧会话分多轮追平)
+FOLD_BATCH = 20
+# 折叠时每条消息最多保留的 token 数
+FOLD_MESSAGE_TOKENS = 300
+
+# 正在折叠的会话 (ChatHistoryManager 随 RAGService 每个请求新建，需在进程内共享，
+# 避免同一会话的并发请求重复调用 LLM、互相覆盖摘要)
+_compacting_sessions = set()
+
+SUMMARY_PROMPT = """你负责维护一段对话的滚动摘要。请将“已有摘要”与“新增对话”合并为一份新的摘要：
+保留用户关注的问题、已确认的结论、提到的文档与关键名词，省略寒暄与重复内容。
+只输出摘要正文，不超过 {max_tokens} 个 token。
+
+已有摘要：
+{summary}
+
+新增对话：
+{transcript}"""
+
+
+class ChatHistoryManager:
+    """
+    有界的对话历史
+    - 读取：只按 (session_id, created_at) 索引取尚未折叠的最近 N 轮，并裁剪到 token 预算
+    - 摘要：超出窗口的早期轮次增量折叠进 ChatSession.summary，作为系统消息放在历史最前面
+    这样每轮对话的读取量与 prompt 长度都与会话长度无关
+    """
+    def __init__(self, llm, max_turns: Optional[int] = None, token_budget: Optional[int] = None,
+                 summary_budget: Optional[int] = None):
+        self.llm = llm
+        self.max_turns = max_turns or settings.CHAT_HISTORY_MAX_TURNS
+        self.token_budget = token_budget or settings.CHAT_HISTORY_TOKEN_BUDGET
+        self.summary_budget = summary_budget or settings.CHAT_SUMMARY_TOKEN_BUDGET
+
+    @property
+    def window(self) -> int:
+        """保留的原始消息条数 (一问一答为一轮)"""
+        return self.max_turns * 2
+
+    @staticmethod
+    async def _get_session(session_id: str) -> Optional[ChatSession]:
+        try:
+            return await ChatSession.get(session_id)
+        except Exception:
+            # 非法的 ObjectId
+            return None
+
+    @staticmethod
+    def _unsummarized(session_id: str, session: Optional[ChatSession]):
+        query = ChatMessage.find(ChatMessage.session_id == session_id)
+        if session and session.summary_until:
+            query = query.find(ChatMessage.created_at > session.summary_until)
+        return query
+
+    async def load(self, session_id: str) -> List[BaseMessage]:
+        """返回用于 prompt 的历史消息 (摘要 + 预算内的最近消息)"""
+        session = await self._get_session(session_id)
+        recent = await self._unsummarized(session_id, session).sort("-created_at").limit(self.window).to_list()
+
+        # 从最新的消息往前装入 token 预算
+        kept = []
+        used = 0
+        for msg in recent:
+            tokens = count_tokens(msg.content)
+            if used + tokens > self.token_budget:
+                if not kept:
+                    # 最新一条本身就超出预算时截断保留
+                    kept.append((msg.role, truncate_tokens(msg.content, self.token_budget)))
+                break
+            kept.append((msg.role, msg.content))
+            used += tokens
+        kept.reverse()
+
+        history: List[BaseMessage] = []
+        if session and session.summary:
+            history.append(SystemMessage(content=f"Summary of the earlier conversation:\n{session.summary}"))
+        for role, content in kept:
+            if role == "user":
+                history.append(HumanMessage(content=content))
+            else:
+                history.append(AIMessage(content=content))
+        return history
+
+    async def compact(self, session_id: str):
+        """
+        将超出窗口的早期轮次折叠进会话摘要 (每轮对话保存后在后台调用)
+        只按整轮折叠，边界总落在 AI 回答上
+        """
+        if session_id in _compacting_sessions:
+            return
+        _compacting_sessions.add(session_id)
+        try:
+            session = await self._get_session(session_id)
+            if session is None:
+                return
+            pending = await self._unsummarized(session_id, session) \
+                .sort("+created_at").limit(self.window + FOLD_BATCH).to_list()
+            to_fold = pending[:max(0, len(pending) - self.window)]
+            while to_fold and to_fold[-1].role == "user":
+                to_fold.pop()
+            if not to_fold:
+                return
+
+            transcript = "\n".join(
+                f"{'User' if m.role == 'user' else 'Assistant'}: {truncate_tokens(m.content, FOLD_MESSAGE_TOKENS)}"
+                for m in to_fold
+            )
+            chain = ChatPromptTemplate.from_template(SUMMARY_PROMPT) | self.llm | StrOutputParser()
+            summary = await chain.ainvoke({
+                "summary": session.summary or "(无)",
+                "transcript": transcript,
+                "max_tokens": self.summary_budget,
+            })
+            await session.set({
+                ChatSession.summary: truncate_tokens(summary.strip(), self.summary_budget),
+                ChatSession.summary_until: to_fold[-1].created_at,
+                ChatSession.updated_at: datetime.utcnow(),
+            })
+            logger.info(f"Folded {len(to_fold)} messages into summary of session {session_id}")
+        except Exception as e:
+            logger.error(f"Failed to compact chat history of session {session_id}: {e}")
+        finally:
+            _compacting_sessions.discard(session_id)
@@ -0,0 +1,114 @@
+"""
+文档切片存储 (doc_chunks 集合)
+切片在向量化时生成并持久化：
+- 切片的 Qdrant 点 ID 由 doc_id 与内容哈希确定，文档更新时只需向量化新增 / 变化的切片
+- 标题、正文与切片参数都未变化时，重建索引直接复用已存储的切片，不再解析正文
+- 切片偏移指向 Doc.plain_text，问答上下文据此定位与扩展 (见 ContextBuilder)
+"""
+import uuid
+import hashlib
+from typing import Dict, Iterable, List, Tuple
+
+from beanie.operators import In
+
+from app.core.config import settings
+from app.models.schemas import Doc, DocChunk
+from app.services.chunker import CHUNKER_VERSION, StructuredChunker, chunk_hash
+
+# 点 ID 的 uuid5 命名空间 (固定值，修改会导致所有切片重新向量化)
+_POINT_NAMESPACE = uuid.UUID("6f1c2a8e-4b7d-5e0a-9c3f-2d8b1e7a4c60")
+
+
+def point_id(doc_id: int, content_hash: str) -> str:
+    return str(uuid.uuid5(_POINT_NAMESPACE, f"{doc_id}:{content_hash}"))
+
+
+def chunk_content(title: str, heading: str, text: str) -> str:
+    """向量化内容：首行为 "# 文档标题 > 标题路径"，之后是切片正文"""
+    header = f"{title} > {heading}" if heading else title
+    return f"# {header}\n\n{text}"
+
+
+def source_hash(doc) -> str:
+    raw = "\0".join([
+        str(CHUNKER_VERSION), str(settings.CHUNK_SIZE), str(settings.CHUNK_OVERLAP), doc.title or "", doc.body or ""
+    ])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def is_current(rows: List[DocChunk], doc) -> bool:
+    """已存储的切片是否仍对应文档当前的标题与正文"""
+    if not rows:
+        return False
+    expected = source_hash(doc)
+    return all(row.source_hash == expected and row.chunker_version == CHUNKER_VERSION for row in rows)
+
+
+def build_chunks(doc) -> Tuple[str, List[DocChunk]]:
+    """
+    解析正文并切片 (纯 CPU，重建索引时在线程池中执行)
+    返回 (纯文本, 切片)；doc 需要 yuque_id / repo_id / title / body 字段
+    """
+    chunker = StructuredChunker(settings.CHUNK_SIZE, settings.CHUNK_OVERLAP)
+    plain_text, chunks = chunker.chunk(doc.body)
+    source = source_hash(doc)
+
+    rows: List[DocChunk] = []
+    seen: Dict[str, int] = {}
+    for chunk in chunks:
+        text = plain_text[chunk.start:chunk.end]
+        if not text.strip():
+            continue
+        content_hash = chunk_hash(chunk_content(doc.title, chunk.heading, text))
+        # 同一文档中内容完全相同的切片 (如重复的代码块) 需要不同的点 ID
+        occurrence = seen.get(content_hash, 0)
+        seen[content_hash] = occurrence + 1
+        if occurrence:
+            content_hash = chunk_hash(f"{content_hash}:{occurrence}")
+        rows.append(DocChunk(
+            doc_id=doc.yuque_id,
+            repo_id=doc.repo_id,
+            seq=len(rows),
+            heading=chunk.heading,
+            kind=chunk.kind,
+            text=text,
+            text_start=chunk.start,
+            text_end=chunk.end,
+            hash=content_hash,
+            point_id=point_id(doc.yuque_id, content_hash),
+            source_hash=source,
+            chunker_version=CHUNKER_VERSION,
+        ))
+    return plain_text, rows
+
+
+async def get_chunks(doc_id: int) -> List[DocChunk]:
+    return await DocChunk.find(DocChunk.doc_id == doc_id).sort("+seq").to_list()
+
+
+async def get_chunks_for(doc_ids: Iterable[int]) -> Dict[int, List[DocChunk]]:
+    """批量读取多篇文档的切片 (按 seq 排序)"""
+    grouped: Dict[int, List[DocChunk]] = {}
+    rows = await DocChunk.find(In(DocChunk.doc_id, list(doc_ids))).sort("+doc_id", "+seq").to_list()
+    for row in rows:
+        grouped.setdefault(row.doc_id, []).append(row)
+    return grouped
+
+
+async def save_chunks(doc, plain_text: str, rows: List[DocChunk]):
+    """
+    替换文档的全部切片
+    切片偏移指向本次解析出的纯文本；与已存储的 plain_text 不一致时 (旧规则生成) 一并更新
+    """
+    if (doc.plain_text or "") != plain_text:
+        await Doc.get_pymongo_collection().update_one(
+            {"yuque_id": doc.yuque_id}, {"$set": {"plain_text": plain_text or None}}
+        )
+        doc.plain_text = plain_text or None
+    await DocChunk.find(DocChunk.doc_id == doc.yuque_id).delete()
+    if rows:
+        await DocChunk.insert_many(rows)
+
+
+async def delete_chunks(doc_id: int):
+    await DocChunk.find(DocChunk.doc_id == doc_id).delete()
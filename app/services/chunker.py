@@ -0,0 +1,287 @@
+"""
+结构感知的正文解析与切片
+- 解析 Lake / HTML / Markdown 正文为块序列：标题、段落、代码块、表格
+- 纯文本 (Doc.plain_text) 由块序列渲染而来，切片的 text_start / text_end 是其中的精确偏移
+- 切片以块为单位打包：代码块与表格不从中间切开 (超长时按行切分)，标题处优先断开，
+  每个切片记录所在的标题路径，向量化时与文档标题一起作为前缀
+"""
+import re
+import json
+import hashlib
+from typing import List, Optional, Tuple
+from urllib.parse import unquote
+
+from bs4 import BeautifulSoup, NavigableString
+from bs4.element import Comment, Declaration, Doctype, ProcessingInstruction
+
+from app.services.text_utils import compact_whitespace, html_to_text
+
+# 切片规则变化时递增，已存储的切片会在下次写入 / 重建时重新生成
+CHUNKER_VERSION = 1
+
+_MD_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_MD_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+_MD_TABLE_SEPARATOR_RE = re.compile(r"^\s*\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?\s*$")
+_SENTENCE_END_RE = re.compile(r"(?<=[。！？!?；;\n])|(?<=\. )")
+
+_HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+# 只作为容器、需要继续向下解析的标签
+_CONTAINER_TAGS = {"html", "body", "div", "section", "article", "ul", "ol", "blockquote", "li", "details"}
+_SKIP_STRINGS = (Comment, Declaration, Doctype, ProcessingInstruction)
+
+
+class Block:
+    __slots__ = ("kind", "text", "level")
+
+    def __init__(self, kind: str, text: str, level: int = 0):
+        self.kind = kind # heading / text / code / table
+        self.text = text
+        self.level = level
+
+    def __repr__(self):
+        return f"Block({self.kind!r}, {self.text[:20]!r})"
+
+
+class Chunk:
+    __slots__ = ("seq", "start", "end", "heading", "kind")
+
+    def __init__(self, seq: int, start: int, end: int, heading: str, kind: str):
+        self.seq = seq
+        self.start = start
+        self.end = end
+        self.heading = heading # 标题路径，如 "部署 > Docker"
+        self.kind = kind # text / code / table (混合内容为 text)
+
+
+def _lake_code(card) -> Optional[str]:
+    """Lake 代码块卡片：value 为 "data:" + URL 编码的 JSON，代码在 code 字段"""
+    value = card.get("value") or ""
+    try:
+        data = json.loads(unquote(value[5:] if value.startswith("data:") else value))
+        return data.get("code") or None
+    except Exception:
+        return None
+
+
+def _table_text(table) -> str:
+    rows = []
+    for tr in table.find_all("tr"):
+        cells = [compact_whitespace(cell.get_text(" ")) for cell in tr.find_all(["td", "th"])]
+        if any(cells):
+            rows.append(" | ".join(cells))
+    return "\n".join(rows)
+
+
+def _html_blocks(node, blocks: List[Block]):
+    for child in node.children:
+        if isinstance(child, NavigableString):
+            if not isinstance(child, _SKIP_STRINGS):
+                text = compact_whitespace(str(child))
+                if text:
+                    blocks.append(Block("text", text))
+            continue
+        name = child.name
+        if name in _HEADING_TAGS:
+            text = compact_whitespace(child.get_text())
+            if text:
+                blocks.append(Block("heading", text, _HEADING_TAGS[name]))
+        elif name == "pre":
+            code = child.get_text().strip("\n")
+            if code.strip():
+                blocks.append(Block("code", code))
+        elif name == "card":
+            if child.get("name") == "codeblock":
+                code = _lake_code(child)
+                if code and code.strip():
+                    blocks.append(Block("code", code.strip("\n")))
+        elif name == "table":
+            text = _table_text(child)
+            if text:
+                blocks.append(Block("table", text))
+        elif name in _CONTAINER_TAGS and child.find(list(_HEADING_TAGS) + ["p", "pre", "card", "table", "li", "div"]):
+            _html_blocks(child, blocks)
+        elif name not in ("script", "style", "meta"):
+            text = compact_whitespace(child.get_text())
+            if text:
+                blocks.append(Block("text", text))
+
+
+def _markdown_paragraph(lines: List[str]) -> str:
+    text = "\n".join(lines)
+    # 段落中可能夹杂行内 HTML
+    if "<" in text:
+        text = html_to_text(text, separator="")
+    return compact_whitespace(text)
+
+
+def _markdown_blocks(body: str) -> List[Block]:
+    blocks: List[Block] = []
+    paragraph: List[str] = []
+
+    def flush():
+        if paragraph:
+            text = _markdown_paragraph(paragraph)
+            if text:
+                blocks.append(Block("text", text))
+            paragraph.clear()
+
+    lines = body.replace("\r\n", "\n").split("\n")
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        fence = _MD_FENCE_RE.match(line)
+        if fence:
+            flush()
+            code_lines = []
+            i += 1
+            while i < len(lines) and not lines[i].strip().startswith(fence.group(1)):
+                code_lines.append(lines[i])
+                i += 1
+            code = "\n".join(code_lines).strip("\n")
+            if code.strip():
+                blocks.append(Block("code", code))
+            i += 1
+            continue
+        heading = _MD_HEADING_RE.match(line)
+        if heading:
+            flush()
+            if heading.group(2):
+                blocks.append(Block("heading", heading.group(2), len(heading.group(1))))
+        elif line.strip().startswith("|"):
+            flush()
+            rows = []
+            while i < len(lines) and lines[i].strip().startswith("|"):
+                if not _MD_TABLE_SEPARATOR_RE.match(lines[i]):
+                    cells = [c.strip() for c in lines[i].strip().strip("|").split("|")]
+                    rows.append(" | ".join(cells))
+                i += 1
+            if rows:
+                blocks.append(Block("table", "\n".join(rows)))
+            continue
+        elif not line.strip():
+            flush()
+        else:
+            paragraph.append(line)
+        i += 1
+    flush()
+    return blocks
+
+
+def parse_blocks(body: Optional[str]) -> List[Block]:
+    """解析正文：以 "<" 开头的视为 Lake / HTML，否则按 Markdown 解析"""
+    if not body or not body.strip():
+        return []
+    if body.lstrip().startswith("<"):
+        try:
+            blocks: List[Block] = []
+            _html_blocks(BeautifulSoup(body, "html.parser"), blocks)
+            return blocks
+        except Exception:
+            return [Block("text", compact_whitespace(body))]
+    return _markdown_blocks(body)
+
+
+def render_blocks(blocks: List[Block]) -> Tuple[str, List[Tuple[int, int]]]:
+    """渲染纯文本 (块之间空一行)，同时返回每个块在文本中的 [start, end)"""
+    parts, spans, offset = [], [], 0
+    for block in blocks:
+        if parts:
+            offset += 2
+        spans.append((offset, offset + len(block.text)))
+        parts.append(block.text)
+        offset += len(block.text)
+    return "\n\n".join(parts), spans
+
+
+def chunk_hash(content: str) -> str:
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+class StructuredChunker:
+    """
+    按块打包切片 (偏移均指向 render_blocks 渲染出的纯文本，切片内容即 plain_text[start:end])
+    - 相邻块合并直到接近 chunk_size；遇到标题且当前切片已超过 chunk_size 的 1/4 时断开
+    - 超长的代码块 / 表格按行切分；超长段落按句切分，相邻片段保留 overlap 个字符的重叠
+    """
+    def __init__(self, chunk_size: int = 1000, overlap: int = 200):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+
+    def chunk(self, body: Optional[str]) -> Tuple[str, List[Chunk]]:
+        blocks = parse_blocks(body)
+        text, spans = render_blocks(blocks)
+        chunks: List[Chunk] = []
+        headings: List[Tuple[int, str]] = []
+        current: Optional[List] = None # [start, end, heading, kinds]
+
+        def flush():
+            nonlocal current
+            if current:
+                kinds = current[3]
+                kind = next(iter(kinds)) if len(kinds) == 1 else "text"
+                chunks.append(Chunk(len(chunks), current[0], current[1], current[2], kind))
+            current = None
+
+        def heading_path() -> str:
+            return " > ".join(title for _, title in headings)
+
+        for block, (start, end) in zip(blocks, spans):
+            if block.kind == "heading":
+                if current and current[1] - current[0] >= self.chunk_size // 4:
+                    flush()
+                while headings and headings[-1][0] >= block.level:
+                    headings.pop()
+                headings.append((block.level, block.text))
+
+            if current and end - current[0] <= self.chunk_size:
+                current[1] = end
+                current[3].add(block.kind if block.kind != "heading" else "text")
+                continue
+
+            flush()
+            if end - start <= self.chunk_size:
+                current = [start, end, heading_path(), {block.kind if block.kind != "heading" else "text"}]
+                continue
+            # 单个块超长
+            for piece_start, piece_end in self._split_block(text, start, end, block.kind):
+                # 切分点处的换行不计入切片
+                while piece_end > piece_start and text[piece_end - 1].isspace():
+                    piece_end -= 1
+                while piece_start < piece_end and text[piece_start].isspace():
+                    piece_start += 1
+                if piece_start < piece_end:
+                    chunks.append(Chunk(len(chunks), piece_start, piece_end, heading_path(), block.kind))
+        flush()
+        return text, chunks
+
+    def _split_block(self, text: str, start: int, end: int, kind: str) -> List[Tuple[int, int]]:
+        # 代码 / 表格按行，其余按句；切分点为片段结束位置
+        if kind in ("code", "table"):
+            cuts = [m.end() for m in re.finditer(r"\n", text[start:end])]
+            overlap = 0
+        else:
+            cuts = [m.start() for m in _SENTENCE_END_RE.finditer(text[start:end]) if m.start() > 0]
+            overlap = self.overlap
+        cuts = [start + c for c in cuts] + [end]
+
+        pieces, piece_start, last_cut = [], start, start
+        for cut in cuts:
+            if cut - piece_start > self.chunk_size and last_cut > piece_start:
+                pieces.append((piece_start, last_cut))
+                piece_start = self._overlap_start(cuts, last_cut, overlap, piece_start)
+            while cut - piece_start > self.chunk_size:
+                # 没有合适切分点 (超长行 / 超长句)，硬切
+                pieces.append((piece_start, piece_start + self.chunk_size))
+                piece_start += self.chunk_size - overlap
+            last_cut = cut
+        if piece_start < end:
+            pieces.append((piece_start, end))
+        return pieces
+
+    @staticmethod
+    def _overlap_start(cuts: List[int], boundary: int, overlap: int, floor: int) -> int:
+        """下一片段的起点：在不超过 overlap 的范围内回退到最早的切分点"""
+        if overlap <= 0:
+            return boundary
+        candidates = [c for c in cuts if boundary - overlap <= c < boundary and c > floor]
+        return candidates[0] if candidates else boundary
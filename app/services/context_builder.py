@@ -0,0 +1,180 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from beanie.operators import In
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.models.schemas import Doc, DocContextView
+from app.services.token_counter import count_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 每轮向两侧扩展的字符数 (与向量切分的 chunk_size 一致，即扩展一个相邻切片)
+EXPAND_STEP = 1000
+
+
+def chunk_span(chunk: Document, text: str) -> Optional[Tuple[int, int]]:
+    """
+    切片在文档纯文本中的位置 [start, end)
+    新写入的切片带有 text_start / text_end；旧切片退回按内容查找
+    """
+    start = chunk.metadata.get("text_start")
+    end = chunk.metadata.get("text_end")
+    if start is not None and end is not None and 0 <= start < end <= len(text):
+        return start, end
+
+    content = chunk.page_content.strip()
+    if not content:
+        # 精简 payload 的切片不带正文，只能按位置定位
+        return None
+    pos = text.find(content)
+    if pos == -1 and content.startswith("# "):
+        # 首个切片带有 "# 标题" 行
+        content = content.partition("\n\n")[2].strip()
+        pos = text.find(content) if content else -1
+    if pos == -1:
+        return None
+    return pos, pos + len(content)
+
+
+def merge_spans(spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class _Section:
+    """单篇文档的上下文片段"""
+    def __init__(self, doc: DocContextView, spans: List[Tuple[int, int]], loose_chunks: List[str]):
+        self.doc = doc
+        self.text = doc.plain_text or ""
+        self.candidates = merge_spans(spans)
+        self.windows: List[Tuple[int, int]] = []
+        self.loose_chunks = loose_chunks # 无法在纯文本中定位的切片，原样使用
+
+    def header(self) -> str:
+        # Try to get author name if possible, otherwise use ID
+        author_info = f"{self.doc.user_id} (ID)"
+        return f"=== Document: {self.doc.title} ===\nAuthor: {author_info}\nUpdate: {self.doc.updated_at}\nContent:\n"
+
+    def render(self) -> str:
+        parts = []
+        for start, end in self.windows:
+            piece = self.text[start:end].strip()
+            if start > 0:
+                piece = "..." + piece
+            if end < len(self.text):
+                piece = piece + "..."
+            parts.append(piece)
+        parts.extend(self.loose_chunks)
+        return self.header() + "\n\n".join(parts) + "\n========================="
+
+
+class ContextBuilder:
+    """
+    问答上下文构建：以检索命中的切片为中心，向两侧扩展相邻内容直到 token 预算用完
+    - 正文使用同步时清洗好的 plain_text，不再把整篇带标记的 body 截断后塞进 prompt
+    - 先按相关性放入所有命中切片，再轮流向两侧各扩展一个切片的长度
+    """
+    def __init__(self, token_budget: Optional[int] = None, max_docs: Optional[int] = None,
+                 expand_step: int = EXPAND_STEP):
+        self.token_budget = token_budget or settings.CHAT_CONTEXT_TOKEN_BUDGET
+        self.max_docs = max_docs or settings.CHAT_CONTEXT_MAX_DOCS
+        self.expand_step = expand_step
+
+    async def build(self, results: List[Tuple[Document, float]]) -> Tuple[str, List[DocContextView]]:
+        """
+        results 为按相关性排序的 (切片, 分数)
+        返回 (上下文文本, 按相关性排序的文档)
+        """
+        # 1. 按相关性选出文档，并收集每篇文档的命中切片
+        hits: Dict[int, List[Document]] = {}
+        for chunk, _ in results:
+            doc_id = chunk.metadata.get("doc_id")
+            if not doc_id:
+                continue
+            if doc_id not in hits:
+                if len(hits) >= self.max_docs:
+                    continue
+                hits[doc_id] = []
+            hits[doc_id].append(chunk)
+        if not hits:
+            return "", []
+
+        docs = await Doc.find(In(Doc.yuque_id, list(hits))).project(DocContextView).to_list()
+        docs_map = {d.yuque_id: d for d in docs}
+        ordered_docs = [docs_map[doc_id] for doc_id in hits if doc_id in docs_map]
+
+        sections = []
+        for doc in ordered_docs:
+            text = doc.plain_text or ""
+            spans, loose_chunks = [], []
+            for chunk in hits[doc.yuque_id]:
+                span = chunk_span(chunk, text) if text else None
+                if span:
+                    spans.append(span)
+                elif chunk.page_content:
+                    loose_chunks.append(chunk.page_content)
+            sections.append(_Section(doc, spans, loose_chunks))
+
+        remaining = self.token_budget - sum(count_tokens(s.header()) for s in sections)
+        remaining = self._place_hits(sections, remaining)
+        self._expand(sections, remaining)
+
+        return "\n\n".join(s.render() for s in sections), ordered_docs
+
+    def _place_hits(self, sections: List[_Section], remaining: int) -> int:
+        """按相关性放入命中切片，预算不足时截断最后一个"""
+        for section in sections:
+            loose_chunks = []
+            for chunk_text in section.loose_chunks:
+                chunk_text = truncate_tokens(chunk_text, remaining)
+                if chunk_text:
+                    loose_chunks.append(chunk_text)
+                    remaining -= count_tokens(chunk_text)
+            section.loose_chunks = loose_chunks
+
+            for start, end in section.candidates:
+                if remaining <= 0:
+                    break
+                piece = truncate_tokens(section.text[start:end], remaining)
+                if piece:
+                    section.windows.append((start, start + len(piece)))
+                    remaining -= count_tokens(piece)
+        return remaining
+
+    def _expand(self, sections: List[_Section], remaining: int):
+        """轮流向两侧扩展，每次一个切片的长度，直到预算用完或无处可扩"""
+        progressed = True
+        while remaining > 0 and progressed:
+            progressed = False
+            for section in sections:
+                windows = section.windows
+                for i, (start, end) in enumerate(windows):
+                    # 不越过相邻窗口，避免重复计费
+                    lower = windows[i - 1][1] if i > 0 else 0
+                    upper = windows[i + 1][0] if i + 1 < len(windows) else len(section.text)
+
+                    new_end = min(upper, end + self.expand_step)
+                    if new_end > end and remaining > 0:
+                        piece = truncate_tokens(section.text[end:new_end], remaining)
+                        if piece:
+                            end += len(piece)
+                            remaining -= count_tokens(piece)
+                            progressed = True
+
+                    new_start = max(lower, start - self.expand_step)
+                    if new_start < start and remaining > 0:
+                        cost = count_tokens(section.text[new_start:start])
+                        if cost <= remaining:
+                            start = new_start
+                            remaining -= cost
+                            progressed = True
+
+                    windows[i] = (start, end)
+                section.windows = merge_spans(windows)
@@ -0,0 +1,82 @@
+"""
+文档写入事件
+同步 / Webhook / 清理路径在写入或删除 MongoDB 文档后统一调用，
+由这里维护依赖文档内容的进程内数据 (搜索缓存、回答缓存、关键词索引、输入联想索引、近似重复索引等)
+以及按内容指纹预先计算的文档摘要
+注意: 这些数据都在进程内，多 worker 部署时每个进程只能看到自己处理的写入
+"""
+import logging
+from typing import Optional
+
+from app.models.schemas import Doc, Member, Repo
+from app.services.search_cache import invalidate_repo
+from app.services.answer_cache import invalidate_doc as invalidate_answers
+from app.services.keyword_index import index_doc, reindex_stored_doc, unindex_doc
+from app.services.reindex import note_doc_changed
+from app.services import near_duplicates, typeahead
+from app.services.summarizer import summarize_doc
+
+logger = logging.getLogger(__name__)
+
+
+async def doc_saved(doc: Optional[Doc]):
+    """文档新增/更新后调用"""
+    if not doc:
+        return
+    try:
+        index_doc(doc)
+    except Exception as e:
+        logger.error(f"Failed to index doc {doc.yuque_id}: {e}")
+    try:
+        await summarize_doc(doc)
+    except Exception as e:
+        logger.error(f"Failed to summarize doc {doc.yuque_id}: {e}")
+    typeahead.index_doc(doc)
+    near_duplicates.index_doc(doc)
+    invalidate_repo(doc.repo_id)
+    invalidate_answers(doc.yuque_id)
+    note_doc_changed(doc.yuque_id)
+
+
+async def doc_removed(doc: Doc):
+    """文档从 MongoDB 删除后调用"""
+    try:
+        unindex_doc(doc.yuque_id)
+    except Exception as e:
+        logger.error(f"Failed to unindex doc {doc.yuque_id}: {e}")
+    typeahead.unindex_doc(doc.yuque_id)
+    near_duplicates.unindex_doc(doc.yuque_id)
+    invalidate_repo(doc.repo_id)
+    invalidate_answers(doc.yuque_id)
+    note_doc_changed(doc.yuque_id)
+
+
+def repo_changed(repo_id: int):
+    """知识库结构批量变化 (例如 TOC 结构同步) 后调用"""
+    invalidate_repo(repo_id)
+
+
+async def doc_outline_saved(doc: Doc, previous: Optional[dict] = None):
+    """
+    TOC 结构同步更新了文档标题 / 位置 (正文未变) 后调用
+    previous 为更新前的 title / repo_id，有变化时关键词索引按已保存的正文重新索引该文档
+    """
+    typeahead.index_doc(doc, keep_weight=True)
+    if previous and any(previous.get(k) != getattr(doc, k) for k in ("title", "repo_id")):
+        try:
+            await reindex_stored_doc(doc.yuque_id)
+        except Exception as e:
+            logger.error(f"Failed to reindex renamed doc {doc.yuque_id}: {e}")
+
+
+def repo_saved(repo: Repo):
+    typeahead.index_repo(repo)
+
+
+def repo_removed(repo_id: int):
+    typeahead.unindex_repo(repo_id)
+    invalidate_repo(repo_id)
+
+
+def member_saved(member: Member):
+    typeahead.index_member(member)
@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import settings
+from app.services.text_utils import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    查询向量缓存 (LRU + TTL)
+    - 键为归一化后的查询文本，按模型 namespace 隔离
+    - 支持持久化到 JSON 文件，重启后热数据不丢失
+    - 线程安全：LangChain 的同步 embed_query 会在线程池中执行
+    """
+    def __init__(self, max_size: int = 2048, ttl: int = 7 * 24 * 3600,
+                 persist_path: Optional[str] = None, namespace: str = ""):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.namespace = namespace
+        # key -> (写入时间戳, 向量)
+        self._data: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _key(self, text: str) -> str:
+        return normalize_query(text)
+
+    def get(self, text: str) -> Optional[List[float]]:
+        if not self.enabled:
+            return None
+        key = self._key(text)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            created_at, vector = entry
+            if self.ttl and time.time() - created_at > self.ttl:
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, text: str, vector: List[float]):
+        if not self.enabled or not vector:
+            return
+        key = self._key(text)
+        with self._lock:
+            self._data[key] = (time.time(), list(vector))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def load(self):
+        """从磁盘恢复缓存 (namespace 不一致时丢弃，避免混用不同模型的向量)"""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            if payload.get("namespace") != self.namespace:
+                logger.info(f"Embedding cache namespace changed, ignore snapshot: {self.persist_path}")
+                return
+            now = time.time()
+            with self._lock:
+                for key, created_at, vector in payload.get("entries", []):
+                    if self.ttl and now - created_at > self.ttl:
+                        continue
+                    self._data[key] = (created_at, vector)
+                while len(self._data) > self.max_size:
+                    self._data.popitem(last=False)
+            logger.info(f"Loaded {len(self._data)} cached query embeddings from {self.persist_path}")
+        except Exception as e:
+            logger.warning(f"Failed to load embedding cache from {self.persist_path}: {e}")
+
+    def save(self):
+        """持久化到磁盘 (先写临时文件再原子替换)"""
+        if not self.persist_path or not self.enabled:
+            return
+        try:
+            with self._lock:
+                entries = [[key, created_at, vector] for key, (created_at, vector) in self._data.items()]
+            directory = os.path.dirname(self.persist_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.persist_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"namespace": self.namespace, "entries": entries}, f)
+            os.replace(tmp_path, self.persist_path)
+            logger.info(f"Saved {len(entries)} cached query embeddings to {self.persist_path}")
+        except Exception as e:
+            logger.warning(f"Failed to save embedding cache to {self.persist_path}: {e}")
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Embeddings 包装器：仅缓存查询向量 (embed_query)，文档向量化直接透传
+    search 与 chat 共用同一个 VectorStore，因此共享同一份缓存
+    """
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.cache.get(text)
+        if vector is not None:
+            return vector
+        vector = self.embeddings.embed_query(text)
+        self.cache.put(text, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = self.cache.get(text)
+        if vector is not None:
+            return vector
+        vector = await self.embeddings.aembed_query(text)
+        self.cache.put(text, vector)
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """多条查询：未命中缓存的部分一次批量计算"""
+        vectors = [self.cache.get(t) for t in texts]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            batch = getattr(self.embeddings, "embed_queries", None)
+            texts_missing = [texts[i] for i in missing]
+            computed = batch(texts_missing) if batch else [self.embeddings.embed_query(t) for t in texts_missing]
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+                self.cache.put(texts[i], vector)
+        return vectors
+
+
+_query_embedding_cache: Optional[EmbeddingCache] = None
+
+
+def _namespace() -> str:
+    namespace = f"{settings.EMBEDDING_MODEL}:{settings.EMBEDDING_DIMENSIONS or 'default'}"
+    if settings.EMBEDDING_PROVIDER != "openai":
+        # 不同提供方的向量不能混用 (openai 保持原有格式，已有快照继续有效)
+        namespace = f"{settings.EMBEDDING_PROVIDER}:{namespace}"
+    return namespace
+
+
+def get_query_embedding_cache() -> EmbeddingCache:
+    """
+    进程内共享的查询向量缓存 (RAGService 每个请求都会新建，缓存需挂在模块级)
+    """
+    global _query_embedding_cache
+    if _query_embedding_cache is None:
+        _query_embedding_cache = EmbeddingCache(
+            max_size=settings.EMBEDDING_CACHE_SIZE,
+            ttl=settings.EMBEDDING_CACHE_TTL,
+            persist_path=settings.EMBEDDING_CACHE_PATH or None,
+            namespace=_namespace(),
+        )
+        _query_embedding_cache.load()
+    return _query_embedding_cache
@@ -2,6 +2,7 @@ import logging
 from datetime import datetime
 from bs4 import BeautifulSoup
 from app.models.schemas import Activity, Member, Doc, Repo
+from app.services.summarizer import content_fingerprint
 from typing import Optional
 
 logger = logging.getLogger(__name__)
@@ -77,10 +78,21 @@ class FeedService:
                     author_name = "未知用户"
                     author_avatar = None
 
-            # 4. 生成摘要 (清洗 HTML)
+            # 4. 生成摘要: 优先使用同步时预先计算的文档摘要，没有时再清洗 HTML
+            # 只有摘要指纹与本次 payload 内容一致时才复用 (拉取详情失败时库里的摘要可能是旧的)
             summary = ""
+            stored_summary = None
+            if not summary_override and not is_comment and doc_id and payload_data.body:
+                stored = await Doc.get_pymongo_collection().find_one(
+                    {"yuque_id": doc_id}, projection={"summary": 1, "summary_fingerprint": 1}
+                )
+                fingerprint = content_fingerprint(payload_data.title, payload_data.body)
+                if stored and stored.get("summary_fingerprint") == fingerprint:
+                    stored_summary = stored.get("summary")
             if summary_override:
                 summary = summary_override
+            elif stored_summary:
+                summary = stored_summary[:100] + "..." if len(stored_summary) > 100 else stored_summary
             elif payload_data.body_html:
                 soup = BeautifulSoup(payload_data.body_html, "html.parser")
                 text = soup.get_text(separator=" ", strip=True)
@@ -0,0 +1,406 @@
+import os
+import asyncio
+import bisect
+import math
+import time
+import pickle
+import logging
+from array import array
+from datetime import datetime
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.models.schemas import Doc
+from app.services.text_utils import tokenize, extract_plain_text
+
+logger = logging.getLogger(__name__)
+
+
+class KeywordIndex:
+    """
+    进程内 BM25 倒排索引 (混合检索的关键词召回路)
+
+    - 分词: 中文 bigram + 英文单词 (见 text_utils.tokenize)，替代无中文分词能力的 MongoDB $text
+    - 存储: 文档表与倒排表均为 array 紧凑数组 (posting = 文档序号 uint32 + 词频 uint16)
+    - 增量: 更新/删除只打墓碑标记，墓碑比例过高时整体压缩
+    - 打分: 查询时将 posting 视为 NumPy 数组向量化计算 BM25
+    注意: 只在事件循环线程中读写，不加锁
+    """
+    SNAPSHOT_VERSION = 1
+    TITLE_BOOST = 3 # 标题词额外计入的词频
+    COMPACT_RATIO = 0.3 # 墓碑比例超过该值时压缩
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ready = False
+        self.saved_at: Optional[float] = None
+        self._reset()
+
+    def _reset(self):
+        # 文档表 (按序号寻址)
+        self._doc_ids = array("q")
+        self._repo_ids = array("q")
+        self._lengths = array("I")
+        self._alive = bytearray()
+        self._ordinals: Dict[int, int] = {}
+        # 倒排表: term -> (文档序号, 词频)
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._ordinals)
+
+    def __contains__(self, doc_id: int) -> bool:
+        return doc_id in self._ordinals
+
+    def add(self, doc_id: int, repo_id: int, title: str, text: str):
+        """新增或替换一个文档"""
+        self.remove(doc_id, compact=False)
+
+        counts = Counter(tokenize(text))
+        for term in tokenize(title):
+            counts[term] += self.TITLE_BOOST
+        if not counts:
+            return
+
+        ordinal = len(self._doc_ids)
+        length = sum(counts.values())
+        self._doc_ids.append(doc_id)
+        self._repo_ids.append(repo_id or 0)
+        self._lengths.append(length)
+        self._alive.append(1)
+        for term, tf in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = (array("I"), array("H"))
+                self._postings[term] = postings
+            postings[0].append(ordinal)
+            postings[1].append(min(tf, 0xFFFF))
+        self._ordinals[doc_id] = ordinal
+        self._total_length += length
+        self._maybe_compact()
+
+    def add_doc(self, doc: Doc, text: Optional[str] = None):
+        if not doc.yuque_id:
+            return
+        if text is None:
+            text = f"{doc.description or ''}\n{doc.plain_text or extract_plain_text(doc.body)}"
+        self.add(doc.yuque_id, doc.repo_id, doc.title or "", text)
+
+    def remove(self, doc_id: int, compact: bool = True) -> bool:
+        ordinal = self._ordinals.pop(doc_id, None)
+        if ordinal is None:
+            return False
+        self._alive[ordinal] = 0
+        self._total_length -= self._lengths[ordinal]
+        if compact:
+            self._maybe_compact()
+        return True
+
+    def _dead_count(self) -> int:
+        return len(self._doc_ids) - len(self._ordinals)
+
+    def _maybe_compact(self):
+        total = len(self._doc_ids)
+        if total >= 1000 and self._dead_count() / total > self.COMPACT_RATIO:
+            self.compact()
+
+    def compact(self):
+        """丢弃墓碑并重新编号 (df 统计随之恢复精确)"""
+        if not self._dead_count():
+            return
+        remap = {}
+        doc_ids, repo_ids, lengths = array("q"), array("q"), array("I")
+        for old, alive in enumerate(self._alive):
+            if alive:
+                remap[old] = len(doc_ids)
+                doc_ids.append(self._doc_ids[old])
+                repo_ids.append(self._repo_ids[old])
+                lengths.append(self._lengths[old])
+
+        postings = {}
+        for term, (ordinals, tfs) in self._postings.items():
+            new_ordinals, new_tfs = array("I"), array("H")
+            for ordinal, tf in zip(ordinals, tfs):
+                new = remap.get(ordinal)
+                if new is not None:
+                    new_ordinals.append(new)
+                    new_tfs.append(tf)
+            if new_ordinals:
+                postings[term] = (new_ordinals, new_tfs)
+
+        self._doc_ids, self._repo_ids, self._lengths = doc_ids, repo_ids, lengths
+        self._alive = bytearray(b"\x01" * len(doc_ids))
+        self._ordinals = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        self._postings = postings
+        logger.info(f"Keyword index compacted: {len(doc_ids)} docs, {len(postings)} terms")
+
+    def search(self, query: str, limit: int = 50, repo_id: Optional[int] = None) -> List[Tuple[int, float]]:
+        """BM25 检索，返回 [(doc_id, score)]，按分数降序"""
+        terms = set(tokenize(query))
+        live_count = len(self._ordinals)
+        if not terms or not live_count:
+            return []
+
+        avgdl = self._total_length / live_count
+        lengths = np.frombuffer(self._lengths, dtype=np.uint32)
+        norm = self.k1 * (1 - self.b + self.b * lengths / avgdl)
+        scores = np.zeros(len(self._doc_ids), dtype=np.float64)
+
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            ordinals = np.frombuffer(postings[0], dtype=np.uint32)
+            tfs = np.frombuffer(postings[1], dtype=np.uint16).astype(np.float64)
+            # df 含墓碑，压缩后恢复精确，对排序影响可以忽略
+            df = len(ordinals)
+            idf = math.log(1 + (live_count - df + 0.5) / (df + 0.5))
+            if idf <= 0:
+                continue
+            # 同一 term 的 posting 中文档序号唯一，可以直接花式索引累加
+            scores[ordinals] += idf * tfs * (self.k1 + 1) / (tfs + norm[ordinals])
+
+        mask = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+        if repo_id:
+            mask &= np.frombuffer(self._repo_ids, dtype=np.int64) == repo_id
+        scores[~mask] = 0
+
+        candidates = np.flatnonzero(scores > 0)
+        if not len(candidates):
+            return []
+        if len(candidates) > limit:
+            top = np.argpartition(-scores[candidates], limit - 1)[:limit]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(self._doc_ids[i]), float(scores[i])) for i in candidates]
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "docs": len(self._ordinals),
+            "tombstones": self._dead_count(),
+            "terms": len(self._postings),
+            "postings": sum(len(p[0]) for p in self._postings.values()),
+        }
+
+    def snapshot(self) -> dict:
+        """
+        在事件循环中调用：压缩后取快照视图，之后可在线程中写入 (write_snapshot)
+        文档表直接复制；倒排表只浅复制字典，写入时各 posting 按快照时的文档数截断
+        (新文档的序号总在末尾，只追加；压缩会整体替换数组而不修改旧数组，所以截断后与文档表一致)
+        """
+        self.compact()
+        self.saved_at = time.time()
+        return {
+            "version": self.SNAPSHOT_VERSION,
+            "saved_at": self.saved_at,
+            "doc_ids": array("q", self._doc_ids),
+            "repo_ids": array("q", self._repo_ids),
+            "lengths": array("I", self._lengths),
+            "postings": dict(self._postings),
+        }
+
+    @staticmethod
+    def write_snapshot(payload: dict, path: str):
+        """序列化并写临时文件原子替换 (可在线程中执行)"""
+        doc_count = len(payload["doc_ids"])
+        postings = {}
+        for term, (ordinals, tfs) in payload["postings"].items():
+            end = bisect.bisect_left(ordinals, doc_count)
+            if end:
+                postings[term] = (ordinals[:end], tfs[:end])
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({**payload, "postings": postings}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def save(self, path: str):
+        """保存快照 (先压缩，再写临时文件原子替换)"""
+        self.write_snapshot(self.snapshot(), path)
+
+    def load(self, path: str) -> bool:
+        if not path or not os.path.exists(path):
+            return False
+        try:
+            with open(path, "rb") as f:
+                payload = pickle.load(f)
+            if payload.get("version") != self.SNAPSHOT_VERSION:
+                logger.info(f"Keyword index snapshot version mismatch, ignore: {path}")
+                return False
+            self._reset()
+            self._doc_ids = payload["doc_ids"]
+            self._repo_ids = payload["repo_ids"]
+            self._lengths = payload["lengths"]
+            self._postings = payload["postings"]
+            self._alive = bytearray(b"\x01" * len(self._doc_ids))
+            self._ordinals = {doc_id: i for i, doc_id in enumerate(self._doc_ids)}
+            self._total_length = sum(self._lengths)
+            self.saved_at = payload.get("saved_at")
+            return True
+        except Exception as e:
+            logger.warning(f"Failed to load keyword index snapshot {path}: {e}")
+            self._reset()
+            return False
+
+
+_keyword_index: Optional[KeywordIndex] = None
+# 重建期间被写入路径触碰过的文档 ID (None 表示当前没有在重建)
+_touched_during_build: Optional[Set[int]] = None
+
+_INDEX_PROJECTION = {"yuque_id": 1, "repo_id": 1, "title": 1, "description": 1, "plain_text": 1}
+
+
+def get_keyword_index() -> KeywordIndex:
+    global _keyword_index
+    if _keyword_index is None:
+        _keyword_index = KeywordIndex()
+    return _keyword_index
+
+
+def _index_raw_doc(index: KeywordIndex, raw: dict):
+    text = f"{raw.get('description') or ''}\n{raw.get('plain_text') or ''}"
+    index.add(raw["yuque_id"], raw.get("repo_id"), raw.get("title") or "", text)
+
+
+async def backfill_plain_text() -> int:
+    """为旧数据补齐 Doc.plain_text (升级后首次启动时执行，之后为空操作)"""
+    collection = Doc.get_pymongo_collection()
+    query = {"plain_text": None, "body": {"$nin": [None, ""]}}
+    updated = 0
+    async for raw in collection.find(query, projection={"body": 1}):
+        await collection.update_one(
+            {"_id": raw["_id"]},
+            # 解析 HTML / Lake 正文是 CPU 操作，放到线程中执行，避免启动期间阻塞请求
+            {"$set": {"plain_text": await asyncio.to_thread(extract_plain_text, raw["body"])}}
+        )
+        updated += 1
+    if updated:
+        logger.info(f"Backfilled plain_text for {updated} docs")
+    return updated
+
+
+def index_doc(doc: Doc):
+    """写入路径调用：增量更新单个文档"""
+    if not doc.yuque_id:
+        return
+    if _touched_during_build is not None:
+        _touched_during_build.add(doc.yuque_id)
+    get_keyword_index().add_doc(doc)
+
+
+async def reindex_stored_doc(doc_id: Optional[int]):
+    """
+    按 MongoDB 中已保存的内容重新索引 (TOC 改名 / 移动：写入路径手上只有结构字段，没有正文)
+    倒排表不保存原文，无法只替换标题词，因此整篇重建该文档的 posting
+    """
+    if not doc_id or doc_id not in get_keyword_index():
+        return
+    raw = await Doc.get_pymongo_collection().find_one({"yuque_id": doc_id}, projection=_INDEX_PROJECTION)
+    if _touched_during_build is not None:
+        _touched_during_build.add(doc_id)
+    if raw:
+        _index_raw_doc(get_keyword_index(), raw)
+
+
+def unindex_doc(doc_id: Optional[int]):
+    """删除路径调用"""
+    if not doc_id:
+        return
+    if _touched_during_build is not None:
+        _touched_during_build.add(doc_id)
+    get_keyword_index().remove(doc_id)
+
+
+async def _replay_touched(index: KeywordIndex):
+    """重放重建期间发生的写入，直到没有新的写入为止"""
+    global _touched_during_build
+    collection = Doc.get_pymongo_collection()
+    while _touched_during_build:
+        doc_ids = list(_touched_during_build)
+        _touched_during_build = set()
+        found = set()
+        async for raw in collection.find({"yuque_id": {"$in": doc_ids}}, projection=_INDEX_PROJECTION):
+            _index_raw_doc(index, raw)
+            found.add(raw["yuque_id"])
+        for doc_id in doc_ids:
+            if doc_id not in found:
+                index.remove(doc_id)
+
+
+async def rebuild_keyword_index() -> KeywordIndex:
+    """从 MongoDB 全量重建索引，完成后原子替换当前索引"""
+    global _keyword_index, _touched_during_build
+    started = time.perf_counter()
+    _touched_during_build = set()
+    index = KeywordIndex()
+    try:
+        cursor = Doc.get_pymongo_collection().find({"yuque_id": {"$ne": None}}, projection=_INDEX_PROJECTION)
+        async for raw in cursor:
+            _index_raw_doc(index, raw)
+            if len(index) % 200 == 0:
+                # 读取的是预先计算的 plain_text，但分词与写入倒排表仍是 CPU 操作，定期让出事件循环
+                await asyncio.sleep(0)
+        await _replay_touched(index)
+        index.compact()
+        index.ready = True
+        # 从 _replay_touched 返回到这里之间没有 await，不会丢失写入
+        _keyword_index = index
+    finally:
+        _touched_during_build = None
+    logger.info(f"Keyword index rebuilt: {len(index)} docs in {time.perf_counter() - started:.2f}s")
+    return index
+
+
+async def _catch_up(index: KeywordIndex):
+    """快照加载后补齐快照之后的变化 (新增/更新/删除)"""
+    collection = Doc.get_pymongo_collection()
+    live_ids = set(await collection.distinct("yuque_id"))
+    removed = [doc_id for doc_id in list(index._ordinals) if doc_id not in live_ids]
+    for doc_id in removed:
+        index.remove(doc_id)
+
+    updated = 0
+    since = datetime.utcfromtimestamp(index.saved_at or 0)
+    query = {"yuque_id": {"$ne": None}, "last_synced_at": {"$gt": since}}
+    async for raw in collection.find(query, projection=_INDEX_PROJECTION):
+        _index_raw_doc(index, raw)
+        updated += 1
+    logger.info(f"Keyword index caught up: {updated} updated, {len(removed)} removed")
+
+
+async def warmup_keyword_index():
+    """
+    启动时调用：优先加载快照并补齐增量，否则从 MongoDB 全量重建
+    索引未就绪期间，关键词召回会回退到 MongoDB $text
+    """
+    index = get_keyword_index()
+    try:
+        await backfill_plain_text()
+        if index.load(settings.KEYWORD_INDEX_PATH):
+            await _catch_up(index)
+            index.ready = True
+            logger.info(f"Keyword index loaded from snapshot: {len(index)} docs")
+        else:
+            await rebuild_keyword_index()
+    except Exception as e:
+        logger.error(f"Keyword index warmup failed, falling back to $text: {e}", exc_info=True)
+
+
+async def save_keyword_index():
+    """保存快照 (未配置 KEYWORD_INDEX_PATH 时为空操作)；序列化与写文件在线程中执行"""
+    index = get_keyword_index()
+    if not settings.KEYWORD_INDEX_PATH or not index.ready:
+        return
+    try:
+        await asyncio.to_thread(KeywordIndex.write_snapshot, index.snapshot(), settings.KEYWORD_INDEX_PATH)
+        logger.info(f"Keyword index snapshot saved: {len(index)} docs")
+    except Exception as e:
+        logger.error(f"Failed to save keyword index snapshot: {e}")
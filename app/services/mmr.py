@@ -0,0 +1,43 @@
+from typing import List, Sequence
+
+import numpy as np
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def mmr_rerank(query_vector: Sequence[float], vectors: Sequence[Sequence[float]],
+               k: int, lambda_mult: float = 0.5) -> List[int]:
+    """
+    最大边际相关 (Maximal Marginal Relevance) 重排，返回入选候选的下标 (按入选顺序)
+    每一步选择 lambda * 与查询的相似度 - (1 - lambda) * 与已选结果的最大相似度 最高的候选，
+    近似重复的切片 (例如同一文档的相邻切片) 会被压到后面
+    - 余弦相似度全部以矩阵运算完成：与查询的相似度一次算出，
+      与已选集合的最大相似度在每次入选后用一次矩阵-向量乘法增量更新
+    - lambda_mult = 1 时等价于按相似度排序
+    """
+    n = len(vectors)
+    if n == 0 or k <= 0:
+        return []
+    candidates = _normalize(np.asarray(vectors, dtype=np.float32))
+    query = _normalize(np.asarray(query_vector, dtype=np.float32))
+
+    relevance = candidates @ query
+    redundancy = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    selected: List[int] = []
+
+    for _ in range(min(k, n)):
+        if selected:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, candidates @ candidates[best])
+    return selected
@@ -0,0 +1,339 @@
+import os
+import time
+import zlib
+import logging
+import threading
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.outputs import LLMResult
+
+from app.core.config import settings
+from app.services.text_utils import tokenize
+from app.services.token_counter import count_tokens, estimate_tokens
+from app.services.vector_config import FAKE_EMBEDDING_DIMENSIONS
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_PROVIDERS = ("openai", "local", "fake")
+LLM_PROVIDERS = ("openai", "fake")
+
+FAKE_LLM_RESPONSE = "（离线模式：未配置大模型，这是固定的占位回答）"
+
+
+class ModelMetrics:
+    """
+    模型调用统计：按 (类型, 提供方) 累计调用次数、条数、token 数、错误数与耗时分位数
+    线程安全：同步的 embed 调用会在线程池中执行
+    """
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"calls": 0, "items": 0, "tokens": 0, "errors": 0, "seconds": 0.0}
+        )
+        # 最近 window 次调用的耗时 (毫秒)，用于分位数
+        self._latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.window))
+
+    def record(self, kind: str, provider: str, seconds: float, items: int = 1, tokens: int = 0, error: bool = False):
+        key = f"{kind}:{provider}"
+        with self._lock:
+            counter = self._counters[key]
+            counter["calls"] += 1
+            counter["items"] += items
+            counter["tokens"] += tokens
+            counter["errors"] += int(error)
+            counter["seconds"] += seconds
+            self._latencies[key].append(seconds * 1000)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._latencies.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = {}
+            for key, counter in self._counters.items():
+                latencies = sorted(self._latencies[key])
+                result[key] = {
+                    "calls": int(counter["calls"]),
+                    "items": int(counter["items"]),
+                    "tokens": int(counter["tokens"]),
+                    "errors": int(counter["errors"]),
+                    "avg_ms": round(counter["seconds"] * 1000 / counter["calls"], 2) if counter["calls"] else 0.0,
+                    "p50_ms": round(latencies[len(latencies) // 2], 2) if latencies else 0.0,
+                    "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 2) if latencies else 0.0,
+                }
+            return result
+
+
+_model_metrics = ModelMetrics()
+
+
+def get_model_metrics() -> ModelMetrics:
+    return _model_metrics
+
+
+class InstrumentedEmbeddings(Embeddings):
+    """
+    Embeddings 包装器：记录每次调用的耗时、条数与 token 数
+    token 数只对按 token 计费的 OpenAI 统计，且按字符估算：LangChain 的 embed 接口不返回 usage，
+    而对全量重建 / 批量写入的每条文本跑 tiktoken 代价太高；本地与离线模型不计 token
+    """
+    def __init__(self, embeddings: Embeddings, provider: str, metrics: Optional[ModelMetrics] = None):
+        self.embeddings = embeddings
+        self.provider = provider
+        self.metrics = metrics or get_model_metrics()
+
+    def _record(self, started: float, texts: List[str], error: bool):
+        tokens = sum(estimate_tokens(t) for t in texts) if self.provider == "openai" else 0
+        self.metrics.record("embedding", self.provider, time.perf_counter() - started,
+                            items=len(texts), tokens=tokens, error=error)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        started, error = time.perf_counter(), True
+        try:
+            vectors = self.embeddings.embed_documents(texts)
+            error = False
+            return vectors
+        finally:
+            self._record(started, texts, error)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        started, error = time.perf_counter(), True
+        try:
+            vectors = await self.embeddings.aembed_documents(texts)
+            error = False
+            return vectors
+        finally:
+            self._record(started, texts, error)
+
+    def embed_query(self, text: str) -> List[float]:
+        started, error = time.perf_counter(), True
+        try:
+            vector = self.embeddings.embed_query(text)
+            error = False
+            return vector
+        finally:
+            self._record(started, [text], error)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """一次调用计算多条查询向量 (多查询检索)；底层不支持批量时逐条计算"""
+        started, error = time.perf_counter(), True
+        try:
+            batch = getattr(self.embeddings, "embed_queries", None)
+            if batch is None and self.provider == "openai":
+                # OpenAI 的查询向量与文档向量相同 (embed_query 即单条 embed_documents)
+                batch = self.embeddings.embed_documents
+            vectors = batch(texts) if batch else [self.embeddings.embed_query(t) for t in texts]
+            error = False
+            return vectors
+        finally:
+            self._record(started, texts, error)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        started, error = time.perf_counter(), True
+        try:
+            vector = await self.embeddings.aembed_query(text)
+            error = False
+            return vector
+        finally:
+            self._record(started, [text], error)
+
+
+class ModelMetricsCallback(BaseCallbackHandler):
+    """LangChain 回调：记录对话模型每次调用的耗时与 token 用量 (优先取接口返回的 usage)"""
+    def __init__(self, provider: str, metrics: Optional[ModelMetrics] = None):
+        self.provider = provider
+        self.metrics = metrics or get_model_metrics()
+        self._started: Dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id: UUID, **kwargs: Any):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            self.metrics.record("chat", self.provider, time.perf_counter() - started,
+                                tokens=_total_tokens(response))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            self.metrics.record("chat", self.provider, time.perf_counter() - started, error=True)
+
+
+def _total_tokens(response: LLMResult) -> int:
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage.get("total_tokens"):
+        return usage["total_tokens"]
+    # 流式输出时 usage 挂在消息上 (usage_metadata)，都没有则按输出文本估算
+    total = 0
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            usage_metadata = getattr(message, "usage_metadata", None)
+            total += usage_metadata["total_tokens"] if usage_metadata else count_tokens(generation.text)
+    return total
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    确定性的假向量：分词后把每个词 (带符号) 哈希到固定维度并归一化，词重叠越多越相似
+    不需要网络与模型文件，同一输入永远得到同一向量，用于测试、离线基准与本地开发
+    """
+    def __init__(self, dim: int = FAKE_EMBEDDING_DIMENSIONS):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in tokenize(text):
+            h = zlib.crc32(token.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    本地 CPU 句向量模型 (ONNX Runtime)，无需网络请求
+    model_dir 需包含 model.onnx 与 tokenizer.json (HuggingFace 导出格式，如 bge-small-zh / e5 系列)
+    - 按长度排序后分批推理，减少 padding 开销
+    - pooling: mean (按 attention mask 平均) 或 cls；输出统一 L2 归一化
+    - query_prefix: 部分模型要求查询带指令前缀 (如 bge 的 "为这个句子生成表示以用于检索相关文章：")
+    """
+    def __init__(self, model_dir: str, batch_size: int = 32, max_length: int = 512,
+                 pooling: str = "mean", query_prefix: str = ""):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise RuntimeError(
+                "EMBEDDING_PROVIDER=local requires onnxruntime and tokenizers: pip install onnxruntime tokenizers"
+            ) from e
+        if pooling not in ("mean", "cls"):
+            raise ValueError(f"Unknown LOCAL_EMBEDDING_POOLING: {pooling} (expected mean or cls)")
+
+        self.batch_size = batch_size
+        self.pooling = pooling
+        self.query_prefix = query_prefix
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.session = ort.InferenceSession(os.path.join(model_dir, "model.onnx"),
+                                            providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+        }
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        output = self.session.run(None, feeds)[0]
+
+        if output.ndim == 3: # (batch, seq, dim) 的 token 向量，需要池化
+            if self.pooling == "cls":
+                output = output[:, 0]
+            else:
+                mask = attention_mask[..., None].astype(np.float32)
+                output = (output * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(output, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return output / norms
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._embed_batch([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([self.query_prefix + text])[0].tolist()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents([self.query_prefix + t for t in texts])
+
+
+def _create_base_embeddings(provider: str) -> Embeddings:
+    if provider == "openai":
+        # 延迟导入，只用本地 / 假模型时不加载 OpenAI 客户端
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            model=settings.EMBEDDING_MODEL, # 或其他兼容模型
+            dimensions=settings.EMBEDDING_DIMENSIONS or None # text-embedding-3 支持降维
+        )
+    if provider == "local":
+        if not settings.LOCAL_EMBEDDING_MODEL_DIR or not settings.EMBEDDING_DIMENSIONS:
+            raise ValueError("EMBEDDING_PROVIDER=local requires LOCAL_EMBEDDING_MODEL_DIR and EMBEDDING_DIMENSIONS")
+        return OnnxEmbeddings(
+            settings.LOCAL_EMBEDDING_MODEL_DIR,
+            batch_size=settings.LOCAL_EMBEDDING_BATCH_SIZE,
+            max_length=settings.LOCAL_EMBEDDING_MAX_LENGTH,
+            pooling=settings.LOCAL_EMBEDDING_POOLING,
+            query_prefix=settings.LOCAL_EMBEDDING_QUERY_PREFIX,
+        )
+    if provider == "fake":
+        return HashingEmbeddings(settings.EMBEDDING_DIMENSIONS or FAKE_EMBEDDING_DIMENSIONS)
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER: {provider} (expected one of {EMBEDDING_PROVIDERS})")
+
+
+# 本地模型加载较慢，按提供方在进程内复用 (RAGService 每个请求都会新建)
+_embeddings: Dict[str, Embeddings] = {}
+_embeddings_lock = threading.Lock()
+
+
+def get_embeddings(provider: Optional[str] = None) -> Embeddings:
+    """按 EMBEDDING_PROVIDER 创建 (并复用) 带调用统计的 Embeddings"""
+    provider = provider or settings.EMBEDDING_PROVIDER
+    with _embeddings_lock:
+        if provider not in _embeddings:
+            _embeddings[provider] = InstrumentedEmbeddings(_create_base_embeddings(provider), provider)
+        return _embeddings[provider]
+
+
+def create_chat_model(provider: Optional[str] = None, temperature: float = 0.3) -> BaseChatModel:
+    """按 LLM_PROVIDER 创建对话模型，挂载调用统计回调"""
+    provider = provider or settings.LLM_PROVIDER
+    callbacks = [ModelMetricsCallback(provider)]
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            model=settings.CHAT_MODEL,
+            temperature=temperature,
+            callbacks=callbacks,
+        )
+    if provider == "fake":
+        from langchain_core.language_models.fake_chat_models import FakeListChatModel
+        return FakeListChatModel(responses=[FAKE_LLM_RESPONSE], callbacks=callbacks)
+    raise ValueError(f"Unknown LLM_PROVIDER: {provider} (expected one of {LLM_PROVIDERS})")
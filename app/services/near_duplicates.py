@@ -0,0 +1,249 @@
+"""
+近似重复文档检测 (SimHash)
+团队经常复制模板、周报，内容几乎相同的文档会挤占检索结果。这里：
+- 同步时对清洗后的纯文本计算 64 位 SimHash (字符 4-gram 加权)，存入 Doc.simhash
+- 进程内维护分段索引：64 位切成 4 段 x 16 位，汉明距离 <= 3 的两篇文档至少有一段完全相同 (抽屉原理)，
+  只需比较同段候选；距离在阈值内的文档之间连边，连通分量即重复簇
+- 搜索 / 问答按簇折叠结果 (每簇只保留得分最高的一篇)，只查进程内索引，不需要额外的向量查询
+注意: 与关键词索引一样在进程内，多 worker 部署时每个进程只能看到自己处理的写入
+"""
+import time
+import asyncio
+import hashlib
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.models.schemas import Doc
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 4
+BANDS = 4
+BAND_BITS = 64 // BANDS
+_MASK = (1 << 64) - 1
+_BAND_MASK = (1 << BAND_BITS) - 1
+# 按块累计每一位的加权投票，单块位矩阵约 SIMHASH_BLOCK x 64 字节，内存与文档长度无关
+SIMHASH_BLOCK = 4096
+
+
+def text_simhash(text: Optional[str]) -> Optional[int]:
+    """
+    纯文本的 SimHash，以有符号 64 位整数返回 (MongoDB 只支持有符号 int64)
+    去除空白后过短的文本 (DUPLICATE_MIN_CHARS) 返回 None，避免空模板 / 占位文档互相判为重复
+    长文档计算需要数百毫秒，写入路径通过 asyncio.to_thread 调用
+    """
+    normalized = "".join((text or "").lower().split())
+    if len(normalized) < settings.DUPLICATE_MIN_CHARS:
+        return None
+    counts = Counter(normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1))
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in counts),
+        dtype="<u8", count=len(counts),
+    )
+    weights = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+    # 每位的投票 = Σ w·(2·bit - 1) = 2·Σ w·bit - Σ w
+    ones = np.zeros(64, dtype=np.float64)
+    for start in range(0, len(hashes), SIMHASH_BLOCK):
+        block = hashes[start:start + SIMHASH_BLOCK]
+        bits = np.unpackbits(block.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+        ones += weights[start:start + SIMHASH_BLOCK] @ bits
+    value = sum(1 << i for i in np.flatnonzero(2 * ones > weights.sum()).tolist())
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hamming(a: int, b: int) -> int:
+    return ((a ^ b) & _MASK).bit_count()
+
+
+class NearDuplicateIndex:
+    def __init__(self, max_distance: Optional[int] = None):
+        self.max_distance = settings.DUPLICATE_MAX_DISTANCE if max_distance is None else max_distance
+        if self.max_distance >= BANDS:
+            raise ValueError(f"DUPLICATE_MAX_DISTANCE must be < {BANDS}")
+        self.ready = False
+        self._entries: Dict[int, Tuple[int, Optional[int]]] = {} # doc_id -> (simhash, repo_id)
+        self._bands: List[Dict[int, Set[int]]] = [{} for _ in range(BANDS)]
+        self._edges: Dict[int, Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _band_keys(simhash: int) -> List[int]:
+        value = simhash & _MASK
+        return [(value >> (i * BAND_BITS)) & _BAND_MASK for i in range(BANDS)]
+
+    def add(self, doc_id: int, simhash: Optional[int], repo_id: Optional[int] = None):
+        self.remove(doc_id)
+        if simhash is None:
+            return
+        candidates = set()
+        for band, key in zip(self._bands, self._band_keys(simhash)):
+            bucket = band.setdefault(key, set())
+            candidates |= bucket
+            bucket.add(doc_id)
+        for other in candidates:
+            if hamming(simhash, self._entries[other][0]) <= self.max_distance:
+                self._edges.setdefault(doc_id, set()).add(other)
+                self._edges.setdefault(other, set()).add(doc_id)
+        self._entries[doc_id] = (simhash, repo_id)
+
+    def remove(self, doc_id: int):
+        entry = self._entries.pop(doc_id, None)
+        if entry is None:
+            return
+        for band, key in zip(self._bands, self._band_keys(entry[0])):
+            bucket = band.get(key)
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    del band[key]
+        for other in self._edges.pop(doc_id, ()):
+            neighbors = self._edges.get(other)
+            if neighbors is not None:
+                neighbors.discard(doc_id)
+                if not neighbors:
+                    del self._edges[other]
+
+    def cluster(self, doc_id: int) -> Set[int]:
+        """文档所在的重复簇 (包含自身)；不重复的文档返回只含自身的集合"""
+        seen = {doc_id}
+        stack = [doc_id]
+        while stack:
+            for other in self._edges.get(stack.pop(), ()):
+                if other not in seen:
+                    seen.add(other)
+                    stack.append(other)
+        return seen
+
+    def clusters(self, repo_id: Optional[int] = None, min_size: int = 2) -> List[List[int]]:
+        """所有重复簇 (按大小降序)；指定 repo_id 时只返回包含该知识库文档的簇"""
+        result, visited = [], set()
+        for doc_id in self._edges:
+            if doc_id in visited:
+                continue
+            members = self.cluster(doc_id)
+            visited |= members
+            if len(members) < min_size:
+                continue
+            if repo_id and not any(self._entries[m][1] == repo_id for m in members):
+                continue
+            result.append(sorted(members))
+        result.sort(key=lambda members: (-len(members), members[0]))
+        return result
+
+    def collapse(self, doc_ids: Iterable[int]) -> List[int]:
+        """按顺序保留每个重复簇第一次出现的文档 (调用方传入按得分排好序的列表)"""
+        kept, covered = [], set()
+        for doc_id in doc_ids:
+            if doc_id in covered:
+                continue
+            kept.append(doc_id)
+            covered |= self.cluster(doc_id) if doc_id in self._edges else {doc_id}
+        return kept
+
+    def stats(self) -> dict:
+        clusters = self.clusters()
+        return {
+            "ready": self.ready,
+            "docs": len(self._entries),
+            "clusters": len(clusters),
+            "duplicate_docs": sum(len(c) for c in clusters),
+        }
+
+
+_index: Optional[NearDuplicateIndex] = None
+# 重建期间被写入路径触碰过的文档 ID (None 表示当前没有在重建)
+_touched_during_build: Optional[Set[int]] = None
+
+_PROJECTION = {"yuque_id": 1, "repo_id": 1, "simhash": 1}
+
+
+def get_duplicate_index() -> NearDuplicateIndex:
+    global _index
+    if _index is None:
+        _index = NearDuplicateIndex()
+    return _index
+
+
+def collapse_duplicates(doc_ids: List[int]) -> List[int]:
+    """检索路径调用：未开启折叠或索引未就绪时原样返回"""
+    index = get_duplicate_index()
+    if not settings.DUPLICATE_COLLAPSE or not index.ready:
+        return doc_ids
+    return index.collapse(doc_ids)
+
+
+def index_doc(doc: Doc):
+    """写入路径调用 (doc_events)"""
+    if not doc.yuque_id:
+        return
+    if _touched_during_build is not None:
+        _touched_during_build.add(doc.yuque_id)
+    get_duplicate_index().add(doc.yuque_id, doc.simhash, doc.repo_id)
+
+
+def unindex_doc(doc_id: Optional[int]):
+    if not doc_id:
+        return
+    if _touched_during_build is not None:
+        _touched_during_build.add(doc_id)
+    get_duplicate_index().remove(doc_id)
+
+
+async def _backfill_simhash(index: NearDuplicateIndex) -> int:
+    """为旧数据补齐 Doc.simhash (过短的文档每次启动都会重新检查，但读取量很小)"""
+    collection = Doc.get_pymongo_collection()
+    query = {"simhash": None, "yuque_id": {"$ne": None}, "plain_text": {"$nin": [None, ""]}}
+    updated = 0
+    async for raw in collection.find(query, projection={"yuque_id": 1, "repo_id": 1, "plain_text": 1}):
+        simhash = await asyncio.to_thread(text_simhash, raw["plain_text"])
+        if simhash is None:
+            continue
+        await collection.update_one({"_id": raw["_id"]}, {"$set": {"simhash": simhash}})
+        index.add(raw["yuque_id"], simhash, raw.get("repo_id"))
+        updated += 1
+        if updated % 200 == 0:
+            await asyncio.sleep(0)
+    if updated:
+        logger.info(f"Backfilled simhash for {updated} docs")
+    return updated
+
+
+async def _replay_touched(index: NearDuplicateIndex):
+    global _touched_during_build
+    collection = Doc.get_pymongo_collection()
+    while _touched_during_build:
+        doc_ids = list(_touched_during_build)
+        _touched_during_build = set()
+        found = set()
+        async for raw in collection.find({"yuque_id": {"$in": doc_ids}}, projection=_PROJECTION):
+            index.add(raw["yuque_id"], raw.get("simhash"), raw.get("repo_id"))
+            found.add(raw["yuque_id"])
+        for doc_id in doc_ids:
+            if doc_id not in found:
+                index.remove(doc_id)
+
+
+async def rebuild_duplicate_index() -> NearDuplicateIndex:
+    """从 MongoDB 读取已存的 SimHash 重建索引 (启动时在后台执行)，完成后原子替换当前索引"""
+    global _index, _touched_during_build
+    started = time.perf_counter()
+    _touched_during_build = set()
+    index = NearDuplicateIndex()
+    try:
+        cursor = Doc.get_pymongo_collection().find({"simhash": {"$ne": None}}, projection=_PROJECTION)
+        async for raw in cursor:
+            index.add(raw["yuque_id"], raw["simhash"], raw.get("repo_id"))
+        await _backfill_simhash(index)
+        await _replay_touched(index)
+        index.ready = True
+        _index = index
+    finally:
+        _touched_during_build = None
+    logger.info(f"Near-duplicate index rebuilt: {index.stats()} in {time.perf_counter() - started:.2f}s")
+    return index
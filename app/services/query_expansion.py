@@ -0,0 +1,84 @@
+"""
+问答多查询扩展 (CHAT_QUERY_EXPANSION)
+复合问题 (如 "怎么部署服务，以及如何备份数据库") 按整句只做一次向量检索时，查询向量偏向其中一个方面，
+另一方面的文档容易召回不到。开启后把问题拆成 2~N 个子查询：
+- keywords: 按标点与多字连接词拆分，无模型调用
+- llm: 由 LLM 拆分，与按原问题的检索并行，不增加串行延迟
+原问题与各子查询的查询向量一次批量计算，各路检索并发执行，结果按切片做 RRF 融合 (见 RAGService._chat_retrieve)
+"""
+import re
+from typing import Dict, List, Sequence, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from app.services.text_utils import tokenize
+
+# 只按不会出现在单个概念内部的分隔拆分；"和" "与" "及" 常出现在名词短语中 (如 "权限与角色")，不作为分隔
+_SPLIT_RE = re.compile(r"[，,；;。？?！!\n]+|以及|并且|而且|还有|另外|同时|\s+and\s+", re.IGNORECASE)
+_SEGMENT_STRIP = " \t、:：\"'“”"
+# 过短的片段 (如 "呢" "怎么办") 单独检索没有意义
+_MIN_SUB_QUERY_TOKENS = 2
+
+# LLM 输出行首的编号或列表符号
+_LIST_MARKER_RE = re.compile(r"^\s*(?:[-*•]|\d+\s*[.、)）])\s*")
+
+
+def _dedupe(queries: List[str], original: str, max_queries: int) -> List[str]:
+    """去重、去掉与原问题相同的项；不足两个子查询时不扩展"""
+    subs = []
+    for q in queries:
+        if q and q != original.strip() and q not in subs:
+            subs.append(q)
+    return subs[:max_queries] if len(subs) >= 2 else []
+
+
+def keyword_sub_queries(query: str, max_queries: int) -> List[str]:
+    """按标点与连接词把复合问题拆成子查询；问题不可拆分时返回空列表"""
+    segments = [s.strip(_SEGMENT_STRIP) for s in _SPLIT_RE.split(query or "")]
+    return _dedupe([s for s in segments if len(tokenize(s)) >= _MIN_SUB_QUERY_TOKENS], query, max_queries)
+
+
+_EXPANSION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """把用户的问题拆分为用于检索知识库的独立子问题，每行一个，最多 {max_queries} 个。\
+每个子问题必须能脱离原问题单独理解 (补全省略的主语)。不要回答问题，不要编号，不要输出其他内容。\
+如果问题只涉及一个方面，原样输出问题本身。"""),
+    ("human", "{input}"),
+])
+
+
+async def llm_sub_queries(llm: BaseChatModel, query: str, max_queries: int) -> List[str]:
+    """由 LLM 拆分子查询；问题只涉及一个方面时返回空列表"""
+    chain = _EXPANSION_PROMPT | llm | StrOutputParser()
+    text = await chain.ainvoke({"input": query, "max_queries": max_queries})
+    lines = [_LIST_MARKER_RE.sub("", line).strip() for line in text.splitlines()]
+    return _dedupe(lines, query, max_queries)
+
+
+def embed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """一次调用计算多条查询向量；模型不支持批量查询时逐条计算"""
+    batch = getattr(embeddings, "embed_queries", None)
+    if batch is not None:
+        return batch(texts)
+    return [embeddings.embed_query(t) for t in texts]
+
+
+def rrf_fuse(
+    result_lists: Sequence[List[Tuple[Document, float]]], k: int, limit: int
+) -> List[Tuple[Document, float]]:
+    """
+    多路检索结果按切片做 RRF 融合 (score = Σ 1 / (rank + k)，与混合搜索相同)
+    同分时先出现的列表 (原问题) 优先；返回的分数为 RRF 分数
+    """
+    scores: Dict[object, float] = {}
+    chunks: Dict[object, Document] = {}
+    for results in result_lists:
+        for rank, (chunk, _) in enumerate(results):
+            key = chunk.metadata.get("_id") or (chunk.metadata.get("doc_id"), chunk.metadata.get("seq"))
+            chunks.setdefault(key, chunk)
+            scores[key] = scores.get(key, 0.0) + 1 / (rank + k)
+    order = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [(chunks[key], scores[key]) for key in order]
@@ -0,0 +1,39 @@
+import re
+import unicodedata
+
+from app.services.text_utils import tokenize
+
+# 指代 / 省略的常见表达：出现时问题通常依赖上文，需要改写成独立问题
+_CONTEXT_DEPENDENT_ZH = (
+    "它", "他们", "她们", "它们", "这个", "那个", "这些", "那些", "这里", "那里", "这样", "那样",
+    "这种", "那种", "上面", "上述", "前面", "刚才", "之前", "上一", "其中", "其他的",
+)
+_CONTEXT_DEPENDENT_EN = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|their|he|she|him|her|above|previous|former|latter)\b"
+)
+# 以追问/承接词开头
+_FOLLOW_UP_PREFIXES = ("那", "还有", "另外", "然后", "所以", "而且", "并且")
+_FOLLOW_UP_EN = re.compile(r"^(and|also|then|so|what about|how about|why)\b")
+
+# 过短的问题 (如 "为什么？" "还有呢") 几乎总是依赖上文
+_MIN_SELF_CONTAINED_TOKENS = 4
+
+
+def needs_rewrite(query: str) -> bool:
+    """
+    启发式判断问题是否依赖对话上下文 (宁可多改写：误判为独立问题会拿错误的问题去检索)
+    """
+    text = unicodedata.normalize("NFKC", query or "").strip().lower()
+    if len(tokenize(text)) < _MIN_SELF_CONTAINED_TOKENS:
+        return True
+    if any(word in text for word in _CONTEXT_DEPENDENT_ZH) or _CONTEXT_DEPENDENT_EN.search(text):
+        return True
+    return text.startswith(_FOLLOW_UP_PREFIXES) or bool(_FOLLOW_UP_EN.match(text))
+
+
+def query_similarity(a: str, b: str) -> float:
+    """两个问题的词 (中文 bigram) 集合 Jaccard 相似度"""
+    left, right = set(tokenize(a)), set(tokenize(b))
+    if not left and not right:
+        return 1.0
+    return len(left & right) / len(left | right)
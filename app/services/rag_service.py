@@ -1,229 +1,591 @@
 import os
-import re
 import asyncio
 # 强制禁用本地连接的代理，防止 502 Bad Gateway
 os.environ["NO_PROXY"] = "localhost,127.0.0.1"
 
 import logging
-from typing import List, Optional
-from bs4 import BeautifulSoup
+from typing import List, Optional, Tuple
 from qdrant_client import QdrantClient, models
-from langchain_qdrant import QdrantVectorStore
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_qdrant import QdrantVectorStore, RetrievalMode
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.messages import HumanMessage, AIMessage
+from beanie.operators import In
 
 from app.core.config import settings
-from app.models.schemas import Doc, ChatSession, ChatMessage, Member, User
-from beanie.operators import In
+from app.models.schemas import Doc, DocChunk, DocSearchView, DocSummary, ChatSession, ChatMessage, Member, User
+from app.services.answer_cache import AnswerKey, docs_fingerprint, get_answer_cache
+from app.services.embedding_cache import CachedQueryEmbeddings, get_query_embedding_cache
+from app.services.search_cache import get_search_cache, invalidate_repo
+from app.services.keyword_index import get_keyword_index
+from app.services.near_duplicates import collapse_duplicates
+from app.services.sparse_embeddings import LexicalSparseEmbeddings
+from app.services.chunker import CHUNKER_VERSION
+from app.services.chunk_store import build_chunks, chunk_content, delete_chunks, get_chunks, save_chunks
+from app.services.snippet import get_snippet_engine
+from app.services.slim_payload import SlimQdrantVectorStore, slim_metadata
+from app.services.chat_history import ChatHistoryManager
+from app.services.context_builder import ContextBuilder
+from app.services.mmr import mmr_rerank
+from app.services.query_expansion import embed_queries, keyword_sub_queries, llm_sub_queries, rrf_fuse
+from app.services.query_rewrite import needs_rewrite, query_similarity
+from app.services.model_providers import create_chat_model, get_embeddings
+from app.services.vector_config import (
+    dense_vector_params, hnsw_config, point_alias, quantization_config, search_params,
+    sync_collection_config, versioned_collection_name
+)
 
 logger = logging.getLogger(__name__)
 
+# 原生混合检索模式下的命名向量
+DENSE_VECTOR_NAME = "dense"
+SPARSE_VECTOR_NAME = "sparse"
+
+# 关键词路生成摘要时最多读取的纯文本长度
+SNIPPET_SOURCE_CHARS = 2000
+
+# 已同步过存储配置的集合 (RAGService 每个请求都会新建，只需在进程内做一次)
+_synced_collections = set()
+
+# 后台任务需保留引用，否则可能在执行完之前被回收
+_background_tasks = set()
+
+
+def _spawn(coro):
+    task = asyncio.get_running_loop().create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
 class RAGService:
     """
     RAG 服务：负责文档向量化、存储、检索和问答
     """
-    def __init__(self):
-        # 1. 初始化 Embedding 模型
-        self.embeddings = OpenAIEmbeddings(
-            api_key=settings.OPENAI_API_KEY,
-            base_url=settings.OPENAI_BASE_URL,
-            model="text-embedding-3-small" # 或其他兼容模型
-        )
+    def __init__(self, embeddings: Optional[Embeddings] = None, llm: Optional[BaseChatModel] = None,
+                 client: Optional[QdrantClient] = None):
+        """
+        embeddings / llm / client 默认按配置创建，可注入替代实现 (如离线基准中的假向量与内存 Qdrant)
+        """
+        # 1. 初始化 Embedding 模型 (提供方见 EMBEDDING_PROVIDER)
+        # 查询向量走进程内 LRU 缓存，热门查询无需重复请求 Embedding API
+        self.embeddings = embeddings or CachedQueryEmbeddings(get_embeddings(), get_query_embedding_cache())
         
-        # 2. 初始化 LLM
-        self.llm = ChatOpenAI(
-            api_key=settings.OPENAI_API_KEY,
-            base_url=settings.OPENAI_BASE_URL,
-            model="gpt-4o", # 或 gpt-3.5-turbo
-            temperature=0.3
-        )
+        # 2. 初始化 LLM (提供方见 LLM_PROVIDER)
+        self.llm = llm or create_chat_model(temperature=0.3)
+        self.history = ChatHistoryManager(self.llm)
+        self.context_builder = ContextBuilder()
 
         # 3. 初始化 Qdrant 客户端和 VectorStore
-        print(f"Connecting to Qdrant at: {settings.QDRANT_URL}")
-        self.client = QdrantClient(url=settings.QDRANT_URL)
+        if client is None:
+            print(f"Connecting to Qdrant at: {settings.QDRANT_URL}")
+            client = QdrantClient(url=settings.QDRANT_URL)
+        self.client = client
         self.collection_name = settings.QDRANT_COLLECTION_NAME
+        self.hybrid_mode = settings.QDRANT_HYBRID_SEARCH
         
         # 检查并创建集合 (如果不存在)
         if not self.client.collection_exists(self.collection_name):
-            print(f"Collection '{self.collection_name}' does not exist. Creating it...")
-            self.client.create_collection(
-                collection_name=self.collection_name,
-                vectors_config=models.VectorParams(
-                    size=1536,  # text-embedding-3-small 的维度
-                    distance=models.Distance.COSINE
-                )
+            # QDRANT_COLLECTION_NAME 作为别名，指向带版本号的实体集合，便于之后蓝绿重建 (见 reindex.py)
+            target = versioned_collection_name(self.collection_name)
+            print(f"Collection '{self.collection_name}' does not exist. Creating '{target}'...")
+            self._create_collection(target)
+            point_alias(self.client, self.collection_name, target)
+            print(f"Collection '{target}' created successfully (alias '{self.collection_name}').")
+        elif self.hybrid_mode and not self._collection_has_sparse(self.collection_name):
+            # 旧集合只有匿名 dense 向量，需要重建后才能使用原生混合检索
+            logger.warning(
+                f"Collection '{self.collection_name}' has no '{SPARSE_VECTOR_NAME}' sparse vectors, "
+                "falling back to client-side hybrid search. Rebuild it (POST /ai/reindex) to enable it."
             )
-            print(f"Collection '{self.collection_name}' created successfully.")
+            self.hybrid_mode = False
+        if self.collection_name not in _synced_collections:
+            # 每个进程只做一次：将量化 / 磁盘存储配置同步到已有集合
+            try:
+                sync_collection_config(
+                    self.client, self.collection_name,
+                    DENSE_VECTOR_NAME if self._collection_has_named_dense(self.collection_name) else None
+                )
+            except Exception as e:
+                logger.error(f"Failed to sync collection config: {e}")
+            _synced_collections.add(self.collection_name)
+        self.search_params = search_params()
 
         # 使用 LangChain 的 VectorStore 抽象
-        self.vector_store = QdrantVectorStore(
+        self.vector_store = self._make_vector_store(self.collection_name, self.hybrid_mode)
+
+    def _make_vector_store(self, collection_name: str, hybrid: bool) -> QdrantVectorStore:
+        # 精简 payload：点上只存 ID 与过滤字段 (见 slim_payload.py)
+        store_class = SlimQdrantVectorStore if settings.QDRANT_SLIM_PAYLOAD else QdrantVectorStore
+        if hybrid:
+            # 原生混合检索：dense + sparse 命名向量，写入时同时生成两种向量
+            return store_class(
+                client=self.client,
+                collection_name=collection_name,
+                embedding=self.embeddings,
+                sparse_embedding=LexicalSparseEmbeddings(),
+                retrieval_mode=RetrievalMode.HYBRID,
+                vector_name=DENSE_VECTOR_NAME,
+                sparse_vector_name=SPARSE_VECTOR_NAME,
+            )
+        return store_class(
             client=self.client,
-            collection_name=self.collection_name,
+            collection_name=collection_name,
             embedding=self.embeddings,
         )
 
+    def _create_collection(self, collection_name: str, hybrid: Optional[bool] = None):
+        # 维度 / 量化 / 磁盘存储见 vector_config
+        dense_params = dense_vector_params()
+        if not (self.hybrid_mode if hybrid is None else hybrid):
+            self.client.create_collection(
+                collection_name=collection_name,
+                vectors_config=dense_params,
+                quantization_config=quantization_config(),
+                hnsw_config=hnsw_config()
+            )
+            return
+
+        self.client.create_collection(
+            collection_name=collection_name,
+            vectors_config={DENSE_VECTOR_NAME: dense_params},
+            quantization_config=quantization_config(),
+            hnsw_config=hnsw_config(),
+            # IDF 由 Qdrant 根据集合统计在服务端计算
+            sparse_vectors_config={
+                SPARSE_VECTOR_NAME: models.SparseVectorParams(modifier=models.Modifier.IDF)
+            },
+        )
+
+    def _collection_has_sparse(self, collection_name: str) -> bool:
+        params = self.client.get_collection(collection_name).config.params
+        return bool(params.sparse_vectors and SPARSE_VECTOR_NAME in params.sparse_vectors)
+
+    def _collection_has_named_dense(self, collection_name: str) -> bool:
+        vectors = self.client.get_collection(collection_name).config.params.vectors
+        return isinstance(vectors, dict) and DENSE_VECTOR_NAME in vectors
+
+    async def _author_name(self, doc: Doc) -> str:
+        """Data Enrichment: 获取作者名"""
+        names = await self._author_names([doc.user_id]) if doc.user_id else {}
+        return names.get(doc.user_id, "未知用户")
+
+    async def _author_names(self, user_ids) -> dict:
+        """批量获取作者名 (优先成员，其次用户)"""
+        names = {m.yuque_id: m.name for m in await Member.find(In(Member.yuque_id, list(user_ids))).to_list()}
+        rest = [uid for uid in user_ids if uid not in names]
+        if rest:
+            for user in await User.find(In(User.yuque_id, rest)).to_list():
+                names.setdefault(user.yuque_id, user.name)
+        return names
+
+    async def _hydrate(self, chunks: List[Document]):
+        """
+        精简 payload (见 slim_payload.py) 的切片只带 ID 与过滤字段：按点 ID 从 doc_chunks 补齐正文，
+        从 docs / members 补齐标题、slug、日期与作者名。只对最终展示的切片调用，完整 payload 的切片直接跳过
+        """
+        missing = [c for c in chunks if not c.page_content]
+        if not missing:
+            return
+        point_ids = [str(c.metadata.get("_id")) for c in missing]
+        rows = {r.point_id: r for r in await DocChunk.find(In(DocChunk.point_id, point_ids)).to_list()}
+        doc_ids = list({c.metadata.get("doc_id") for c in missing})
+        docs = {d.yuque_id: d for d in await Doc.find(In(Doc.yuque_id, doc_ids)).project(DocSummary).to_list()}
+        authors = await self._author_names({d.user_id for d in docs.values() if d.user_id})
+
+        for chunk, point_id in zip(missing, point_ids):
+            doc = docs.get(chunk.metadata.get("doc_id"))
+            if doc is None:
+                continue
+            chunk.metadata = {**self._chunk_metadata(doc, authors.get(doc.user_id, "未知用户")), **chunk.metadata}
+            row = rows.get(point_id)
+            if row:
+                chunk.page_content = chunk_content(doc.title, row.heading, row.text)
+
+    def _vector_card(self, chunk: Document, query: str, source_type: str) -> dict:
+        """向量路的结果卡片 (同一文档取最相关的切片)"""
+        return {
+            "title": chunk.metadata.get("title"),
+            "slug": chunk.metadata.get("slug"),
+            "repo_id": chunk.metadata.get("repo_id"),
+            # 对向量检索的片段也进行高亮
+            "content": self._highlight_text(chunk.page_content, query),
+            "updated_date": chunk.metadata.get("updated_date"),
+            "author_name": chunk.metadata.get("author_name"),
+            "source_type": source_type
+        }
+
+    def _chunk_metadata(self, doc: Doc, author_name: str) -> dict:
+        # Data Enrichment: 格式化日期
+        updated_date = "未知日期"
+        if doc.updated_at:
+            updated_date = doc.updated_at.strftime("%Y-%m-%d")
+        elif doc.created_at:
+            updated_date = doc.created_at.strftime("%Y-%m-%d")
+
+        return {
+            "doc_id": doc.yuque_id,
+            "title": doc.title,
+            "slug": doc.slug,
+            "repo_id": doc.repo_id,
+            "user_id": doc.user_id,
+            "author_name": author_name,
+            "updated_date": updated_date,
+            "source": doc.slug
+        }
+
+    def _chunk_documents(self, doc: Doc, author_name: str, rows: List[DocChunk]) -> List[Document]:
+        """
+        切片 -> LangChain Documents (点 ID 见 DocChunk.point_id)
+        记录切片在 plain_text 中的位置，问答时据此扩展相邻内容 (见 ContextBuilder)
+        """
+        metadata = self._chunk_metadata(doc, author_name)
+        return [
+            Document(
+                page_content=chunk_content(doc.title, row.heading, row.text),
+                metadata={**metadata, "seq": row.seq, "text_start": row.text_start, "text_end": row.text_end},
+            )
+            for row in rows
+        ]
+
+    def _sync_points(self, doc_id: int, stored: List[DocChunk], rows: List[DocChunk],
+                     documents: List[Document]) -> int:
+        """
+        按点 ID (内容哈希) 比对新旧切片，返回新向量化的切片数：
+        新增的切片向量化写入，消失的切片删除，未变的切片只更新 payload (作者、日期、偏移等)
+        """
+        stored_ids = {row.point_id for row in stored}
+        if not stored or any(row.chunker_version != CHUNKER_VERSION for row in stored):
+            # 首次写入或切片规则变化：先清除该文档的全部旧点 (包括旧版本写入的随机 ID 点)
+            self._delete_points(doc_id, self.collection_name)
+            stored_ids = set()
+
+        added = [(d, row.point_id) for d, row in zip(documents, rows) if row.point_id not in stored_ids]
+        kept = [(d, row.point_id) for d, row in zip(documents, rows) if row.point_id in stored_ids]
+        removed = stored_ids - {row.point_id for row in rows}
+
+        if kept:
+            key = self.vector_store.metadata_payload_key
+            if settings.QDRANT_SLIM_PAYLOAD:
+                # 整体覆盖 payload，旧的完整 payload (含正文) 随之瘦身
+                operations = [
+                    models.OverwritePayloadOperation(overwrite_payload=models.SetPayload(
+                        payload={key: slim_metadata(d.metadata)}, points=[pid]
+                    ))
+                    for d, pid in kept
+                ]
+            else:
+                operations = [
+                    models.SetPayloadOperation(set_payload=models.SetPayload(payload={key: d.metadata}, points=[pid]))
+                    for d, pid in kept
+                ]
+            try:
+                self.client.batch_update_points(collection_name=self.collection_name, update_operations=operations)
+            except Exception as e:
+                # 向量库与切片记录不一致 (如集合被清空)，按新增处理
+                logger.warning(f"Failed to update payloads for doc {doc_id}, re-embedding kept chunks: {e}")
+                added.extend(kept)
+        if added:
+            self.vector_store.add_documents([d for d, _ in added], ids=[pid for _, pid in added])
+        if removed:
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=models.PointIdsList(points=list(removed)),
+            )
+        return len(added)
+
     async def upsert_doc_to_vector_db(self, doc: Doc):
         """
-        将文档切分并存入向量库 (Data Enrichment)
+        将文档切片并存入向量库 (Data Enrichment)
+        切片持久化到 doc_chunks，再次写入时只向量化内容变化的切片
         """
         if not doc.body:
             return
 
         try:
-            # Clean HTML tags
-            soup = BeautifulSoup(doc.body, "html.parser")
-            clean_text = soup.get_text(separator="\n")
-
-            # 1. 文本切分
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                separators=["\n\n", "\n", "。", "！", "？", " ", ""]
-            )
-            
-            # Data Enrichment: 获取作者名
-            author_name = "未知用户"
-            if doc.user_id:
-                member = await Member.find_one(Member.yuque_id == doc.user_id)
-                if member:
-                    author_name = member.name
-                else:
-                    user = await User.find_one(User.yuque_id == doc.user_id)
-                    if user:
-                        author_name = user.name
-            
-            # Data Enrichment: 格式化日期
-            updated_date = "未知日期"
-            if doc.updated_at:
-                updated_date = doc.updated_at.strftime("%Y-%m-%d")
-            elif doc.created_at:
-                updated_date = doc.created_at.strftime("%Y-%m-%d")
-
-            # 组合 metadata
-            metadata = {
-                "doc_id": doc.yuque_id,
-                "title": doc.title,
-                "slug": doc.slug,
-                "repo_id": doc.repo_id,
-                "user_id": doc.user_id,
-                "author_name": author_name,
-                "updated_date": updated_date,
-                "source": doc.slug
-            }
-            
-            # 创建 Langchain Documents
-            full_text = f"# {doc.title}\n\n{clean_text}"
-            chunks = text_splitter.create_documents([full_text], metadatas=[metadata])
-            
-            if not chunks:
-                return
+            plain_text, rows = await asyncio.to_thread(build_chunks, doc)
+            stored = await get_chunks(doc.yuque_id)
+            documents = self._chunk_documents(doc, await self._author_name(doc), rows)
 
-            # 2. 使用 VectorStore 添加文档
-            # LangChain 会自动处理 embedding 和 upsert
-            self.vector_store.add_documents(chunks)
+            embedded = await asyncio.to_thread(self._sync_points, doc.yuque_id, stored, rows, documents)
+            await save_chunks(doc, plain_text, rows)
+            invalidate_repo(doc.repo_id)
             
-            logger.info(f"Upserted {len(chunks)} chunks for doc {doc.title} ({doc.yuque_id})")
+            logger.info(f"Upserted {len(rows)} chunks ({embedded} embedded) for doc {doc.title} ({doc.yuque_id})")
 
         except Exception as e:
             logger.error(f"Failed to upsert doc {doc.yuque_id} to vector db: {e}")
 
-    async def delete_doc(self, doc_id: int):
+    def _delete_points(self, doc_id: int, collection_name: str):
+        self.client.delete(
+            collection_name=collection_name,
+            points_selector=models.FilterSelector(
+                filter=models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="metadata.doc_id",
+                            match=models.MatchValue(value=doc_id),
+                        ),
+                    ],
+                )
+            ),
+        )
+
+    def _set_metadata(self, field: str, value: int, metadata: dict):
+        """按 metadata 中的字段过滤，只覆盖 metadata 中给出的键 (其余键、正文与向量不变)"""
+        key = self.vector_store.metadata_payload_key
+        self.client.set_payload(
+            collection_name=self.collection_name,
+            payload=metadata,
+            key=key,
+            points=models.Filter(
+                must=[models.FieldCondition(key=f"{key}.{field}", match=models.MatchValue(value=value))]
+            ),
+        )
+
+    async def update_doc_metadata(self, doc: Doc, previous_repo_id: Optional[int] = None):
         """
-        从向量库中删除指定文档的所有切片
+        文档改名 / 移动 (正文未变) 后只更新向量 payload 中的标题、slug 与知识库，不重新切片和向量化
         """
+        if not doc.yuque_id:
+            return
+        metadata = {"title": doc.title, "slug": doc.slug, "source": doc.slug, "repo_id": doc.repo_id}
+        if settings.QDRANT_SLIM_PAYLOAD:
+            # 精简 payload 中只有 repo_id 需要更新，标题等在读取时从 MongoDB 补齐
+            metadata = slim_metadata(metadata)
         try:
-            self.client.delete(
-                collection_name=self.collection_name,
-                points_selector=models.FilterSelector(
-                    filter=models.Filter(
-                        must=[
-                            models.FieldCondition(
-                                key="metadata.doc_id",
-                                match=models.MatchValue(value=doc_id),
-                            ),
-                        ],
-                    )
-                ),
-            )
+            await asyncio.to_thread(self._set_metadata, "doc_id", doc.yuque_id, metadata)
+            if previous_repo_id is not None and previous_repo_id != doc.repo_id:
+                await DocChunk.find(DocChunk.doc_id == doc.yuque_id).update({"$set": {"repo_id": doc.repo_id}})
+                invalidate_repo(previous_repo_id)
+            invalidate_repo(doc.repo_id)
+            logger.info(f"Updated vector metadata for doc {doc.title} ({doc.yuque_id})")
+        except Exception as e:
+            logger.error(f"Failed to update vector metadata for doc {doc.yuque_id}: {e}")
+
+    async def update_author_name(self, user_id: int, author_name: str):
+        """成员改名后只更新其文档向量 payload 中的作者名"""
+        try:
+            if not settings.QDRANT_SLIM_PAYLOAD: # 精简 payload 不存作者名
+                await asyncio.to_thread(self._set_metadata, "user_id", user_id, {"author_name": author_name})
+            # 搜索结果中带有作者名
+            get_search_cache().clear()
+            logger.info(f"Updated vector author name for user {user_id}: {author_name}")
+        except Exception as e:
+            logger.error(f"Failed to update vector author name for user {user_id}: {e}")
+
+    async def delete_doc(self, doc_id: int, collection_name: Optional[str] = None):
+        """
+        从向量库中删除指定文档的所有切片 (collection_name 默认为当前别名)
+        删除当前别名下的向量时同时删除 doc_chunks 中的切片记录
+        """
+        try:
+            self._delete_points(doc_id, collection_name or self.collection_name)
             logger.info(f"Deleted vectors for doc_id: {doc_id}")
         except Exception as e:
             logger.error(f"Failed to delete vectors for doc_id {doc_id}: {e}")
+        if collection_name is None:
+            try:
+                await delete_chunks(doc_id)
+            except Exception as e:
+                logger.error(f"Failed to delete chunks for doc_id {doc_id}: {e}")
 
     def _highlight_text(self, text: str, query: str, window_size: int = 200) -> str:
         """
-        简单的关键词高亮和摘要提取
+        关键词高亮和摘要提取 (引擎按查询编译并缓存，见 snippet.SnippetEngine)
         """
-        if not text:
-            return ""
-            
-        # 1. 提取关键词 (简单按空格分词)
-        keywords = [k for k in query.split() if k.strip()]
-        if not keywords:
-            return text[:window_size] + "..."
-
-        # 2. 找到第一个关键词的位置
-        lower_text = text.lower()
-        first_pos = -1
-        for k in keywords:
-            pos = lower_text.find(k.lower())
-            if pos != -1:
-                if first_pos == -1 or pos < first_pos:
-                    first_pos = pos
-        
-        # 3. 截取窗口
-        if first_pos == -1:
-            start = 0
-        else:
-            start = max(0, first_pos - 20) # 往前多取一点上下文
-        
-        end = min(len(text), start + window_size)
-        snippet = text[start:end]
-        
-        # 4. 高亮关键词 (使用正则忽略大小写替换)
-        for k in keywords:
-            # 使用 re.escape 防止关键词包含正则特殊字符
-            pattern = re.compile(re.escape(k), re.IGNORECASE)
-            snippet = pattern.sub(lambda m: f"<mark>{m.group(0)}</mark>", snippet)
-            
-        if start > 0:
-            snippet = "..." + snippet
-        if end < len(text):
-            snippet = snippet + "..."
-            
-        return snippet
+        return get_snippet_engine(query, window_size).snippet(text)
 
     async def search(self, query: str, limit: int = 20, repo_id: Optional[int] = None):
         """
-        混合检索 (Hybrid Search): Keyword (MongoDB) + Vector (Qdrant) + RRF Fusion
+        混合检索 (Hybrid Search): Keyword (BM25) + Vector (Qdrant) + RRF Fusion
+        结果按 (query, repo_id, limit) 缓存，文档写入时按知识库失效
         """
-        # 为了提高 RRF 融合的效果，内部召回更多的候选文档 (例如 2 倍 limit)
-        candidate_limit = max(limit * 2, 50)
+        search_cache = get_search_cache()
+        cached = search_cache.get(query, repo_id, limit)
+        if cached is not None:
+            return cached
+
+        # 先记录 generation，检索期间若有写入则本次结果不会进入缓存
+        generation = search_cache.generation(repo_id)
+        if self.hybrid_mode:
+            results = await self._native_hybrid_search(query, limit=limit, repo_id=repo_id)
+        else:
+            results = await self._hybrid_search(query, limit=limit, repo_id=repo_id)
+        search_cache.put(query, repo_id, limit, results, generation)
+        return results
+
+    def _repo_filter(self, repo_id: Optional[int]) -> Optional[models.Filter]:
+        if not repo_id:
+            return None
+        return models.Filter(
+            must=[
+                models.FieldCondition(
+                    key="metadata.repo_id",
+                    match=models.MatchValue(value=repo_id),
+                ),
+            ],
+        )
+
+    def _query_points(self, query: str, k: int, query_filter: Optional[models.Filter] = None,
+                      query_vector: Optional[List[float]] = None):
+        """
+        与 QdrantVectorStore.similarity_search_with_score 相同的查询 (dense 或 原生混合)，
+        额外取回 dense 向量用于 MMR 重排。返回 (查询向量, points)
+        query_vector 为已批量算好的查询向量 (多查询扩展)，为空时现算
+        """
+        if query_vector is None:
+            query_vector = self.embeddings.embed_query(query)
+        options = {
+            "collection_name": self.collection_name,
+            "query_filter": query_filter,
+            "limit": k,
+            "with_payload": True,
+        }
+        if self.hybrid_mode:
+            sparse = self.vector_store.sparse_embeddings.embed_query(query)
+            points = self.client.query_points(
+                prefetch=[
+                    models.Prefetch(using=DENSE_VECTOR_NAME, query=query_vector, filter=query_filter,
+                                    limit=k, params=self.search_params),
+                    models.Prefetch(
+                        using=SPARSE_VECTOR_NAME,
+                        query=models.SparseVector(indices=sparse.indices, values=sparse.values),
+                        filter=query_filter,
+                        limit=k,
+                    ),
+                ],
+                query=models.FusionQuery(fusion=models.Fusion.RRF),
+                with_vectors=[DENSE_VECTOR_NAME],
+                **options,
+            ).points
+        else:
+            points = self.client.query_points(
+                query=query_vector, with_vectors=True, search_params=self.search_params, **options
+            ).points
+        return query_vector, points
+
+    async def _retrieve(self, query: str, k: int, repo_id: Optional[int] = None,
+                        mmr_lambda: float = 1.0, fetch_k: Optional[int] = None,
+                        query_vector: Optional[List[float]] = None) -> List[Tuple[Document, float]]:
+        """
+        向量召回 (可选 MMR 多样性重排)
+        mmr_lambda < 1 时取回 fetch_k 个候选及其向量，用 MMR 选出 k 个，避免同一文档的相似切片占满结果
+        query_vector 为已算好的查询向量，传入时不再调用 embedding 模型
+        """
+        query_filter = self._repo_filter(repo_id)
+        if mmr_lambda >= 1 and query_vector is None:
+            return await self.vector_store.asimilarity_search_with_score(
+                query, k=k, filter=query_filter, search_params=self.search_params
+            )
+
+        loop = asyncio.get_running_loop()
+        fetch = k if mmr_lambda >= 1 else max(fetch_k or k, k)
+        query_vector, points = await loop.run_in_executor(
+            None, self._query_points, query, fetch, query_filter, query_vector
+        )
+        vectors = [p.vector.get(DENSE_VECTOR_NAME) if isinstance(p.vector, dict) else p.vector for p in points]
+        if mmr_lambda >= 1 or any(v is None for v in vectors):
+            order = list(range(min(k, len(points))))
+        else:
+            order = mmr_rerank(query_vector, vectors, k, mmr_lambda)
+
+        store = self.vector_store
+        return [
+            (store._document_from_point(points[i], self.collection_name,
+                                        store.content_payload_key, store.metadata_payload_key),
+             points[i].score)
+            for i in order
+        ]
+
+    async def _fetch_search_views(self, match: dict, limit: Optional[int] = None) -> List[DocSearchView]:
+        """
+        关键词路取数：只投影结果卡片需要的字段，纯文本截取前缀，
+        不传输 body / body_html，单次查询的开销与文档大小无关
+        """
+        pipeline = [{"$match": match}]
+        if limit:
+            pipeline.append({"$limit": limit})
+        pipeline.append({"$project": {
+            "yuque_id": 1, "slug": 1, "repo_id": 1, "title": 1, "description": 1, "updated_at": 1, "summary": 1,
+            "plain_text": {"$substrCP": [{"$ifNull": ["$plain_text", ""]}, 0, SNIPPET_SOURCE_CHARS]},
+        }})
+        return await Doc.aggregate(pipeline, projection_model=DocSearchView).to_list()
+
+    async def _native_hybrid_search(self, query: str, limit: int = 20, repo_id: Optional[int] = None):
+        """
+        Qdrant 原生混合检索：一次请求内完成 dense + sparse 召回、服务端 RRF 融合与知识库过滤，
+        无需 MongoDB 关键词路，也无需在 Python 中融合
+        """
+        candidate_limit = max(limit * settings.SEARCH_CANDIDATE_MULTIPLIER, settings.SEARCH_MIN_CANDIDATES)
+        mmr_lambda = settings.SEARCH_MMR_LAMBDA
+        try:
+            vector_results = await self._retrieve(
+                query, k=limit if mmr_lambda < 1 else candidate_limit, repo_id=repo_id,
+                mmr_lambda=mmr_lambda, fetch_k=candidate_limit
+            )
+        except Exception as e:
+            logger.error(f"Native hybrid search failed: {e}")
+            return []
+
+        # 结果按切片返回，同一文档取最相关的切片，分数累加 (与客户端 RRF 的行为一致)
+        fused_scores = {}
+        best_chunks = {}
+        for doc, score in vector_results:
+            doc_id = doc.metadata.get("doc_id")
+            if not doc_id: continue
+
+            if doc_id not in fused_scores:
+                fused_scores[doc_id] = 0
+                best_chunks[doc_id] = doc
+            fused_scores[doc_id] += score
+
+        # 近似重复的文档 (复制的模板 / 周报) 只保留得分最高的一篇
+        sorted_ids = collapse_duplicates(sorted(fused_scores.keys(), key=lambda x: fused_scores[x], reverse=True))[:limit]
+        await self._hydrate([best_chunks[doc_id] for doc_id in sorted_ids])
+        return [
+            {"score": fused_scores[doc_id], **self._vector_card(best_chunks[doc_id], query, "hybrid")}
+            for doc_id in sorted_ids
+        ]
+
+    async def _hybrid_search(self, query: str, limit: int = 20, repo_id: Optional[int] = None):
+        # 为了提高 RRF 融合的效果，内部召回更多的候选文档 (默认 2 倍 limit，至少 50)
+        candidate_limit = max(limit * settings.SEARCH_CANDIDATE_MULTIPLIER, settings.SEARCH_MIN_CANDIDATES)
 
         # 1. 定义两路搜索函数
         async def keyword_search():
             try:
+                # 优先使用进程内 BM25 索引 (支持中文)，未就绪时回退到 MongoDB $text
+                keyword_index = get_keyword_index()
+                if keyword_index.ready:
+                    hits = keyword_index.search(query, limit=candidate_limit, repo_id=repo_id)
+                    hit_ids = [doc_id for doc_id, _ in hits]
+                    if not hit_ids:
+                        return []
+                    docs = await self._fetch_search_views({"yuque_id": {"$in": hit_ids}})
+                    docs_map = {d.yuque_id: d for d in docs}
+                    return [docs_map[doc_id] for doc_id in hit_ids if doc_id in docs_map]
+
                 # 构造 MongoDB 文本搜索查询
                 find_query = {"$text": {"$search": query}}
                 if repo_id:
                     find_query["repo_id"] = repo_id
                 
                 # 获取候选结果
-                return await Doc.find(find_query).limit(candidate_limit).to_list()
+                return await self._fetch_search_views(find_query, limit=candidate_limit)
             except Exception as e:
                 logger.warning(f"Keyword search failed (possibly no index): {e}")
                 return []
 
         async def vector_search():
             try:
-                # 构造 Qdrant 过滤条件 (如果需要)
-                # filter_dict = {"repo_id": repo_id} if repo_id else {}
-                
-                # 使用异步向量搜索
-                return await self.vector_store.asimilarity_search_with_score(query, k=candidate_limit)
+                # 使用异步向量搜索 (按知识库过滤，与关键词路保持一致；开启 MMR 时保留 limit 个多样化切片)
+                mmr_lambda = settings.SEARCH_MMR_LAMBDA
+                return await self._retrieve(
+                    query, k=limit if mmr_lambda < 1 else candidate_limit, repo_id=repo_id,
+                    mmr_lambda=mmr_lambda, fetch_k=candidate_limit
+                )
             except Exception as e:
                 logger.error(f"Vector search failed: {e}")
                 return []
@@ -232,8 +594,8 @@ class RAGService:
         keyword_results, vector_results = await asyncio.gather(keyword_search(), vector_search())
 
         # 3. RRF 融合 (Reciprocal Rank Fusion)
-        # score = 1 / (rank + k), k usually 60
-        k = 60
+        # score = 1 / (rank + k), k usually 60 (调参见 benchmarks/bench_retrieval.py)
+        k = settings.SEARCH_RRF_K
         fused_scores = {}
         doc_info_map = {} 
 
@@ -241,34 +603,31 @@ class RAGService:
         for rank, doc in enumerate(keyword_results):
             if not doc.yuque_id: continue
             
-            # 提取纯文本用于生成摘要
-            text_content = doc.description or ""
-            if not text_content and doc.body:
-                try:
-                    # 尝试去除 HTML 标签 (针对 Lake/HTML 格式)
-                    soup = BeautifulSoup(doc.body, "html.parser")
-                    text_content = soup.get_text(separator=" ")
-                except:
-                    text_content = doc.body
+            # 使用同步时预先计算的纯文本生成摘要
+            text_content = doc.description or doc.plain_text or ""
 
             doc_id = doc.yuque_id
             if doc_id not in fused_scores:
                 fused_scores[doc_id] = 0
+                # 使用高亮摘要；正文前缀中没有命中词时，改用预先计算的文档摘要
+                content = self._highlight_text(text_content, query)
+                if doc.summary and "<mark>" not in content:
+                    content = self._highlight_text(doc.summary, query)
                 doc_info_map[doc_id] = {
                     "title": doc.title,
                     "slug": doc.slug,
                     "repo_id": doc.repo_id,
-                    # 使用高亮摘要
-                    "content": self._highlight_text(text_content, query),
+                    "content": content,
                     "updated_date": doc.updated_at.strftime("%Y-%m-%d") if doc.updated_at else "",
                     "author_name": "未知作者", # MongoDB Doc 中没有直接存储作者名
                     "source_type": "keyword"
                 }
             
-            # 给予关键词匹配稍高的权重 (1.5x)
-            fused_scores[doc_id] += 1.5 * (1 / (rank + k))
+            # 给予关键词匹配稍高的权重 (默认 1.5x)
+            fused_scores[doc_id] += settings.SEARCH_KEYWORD_WEIGHT * (1 / (rank + k))
 
-        # 处理 Vector 结果 (LangChain Document)
+        # 处理 Vector 结果 (LangChain Document)，同一文档取排名最靠前的切片
+        best_chunks = {}
         for rank, (doc, score) in enumerate(vector_results):
             # 尝试从 metadata 获取 doc_id
             doc_id = doc.metadata.get("doc_id")
@@ -276,36 +635,30 @@ class RAGService:
             
             if doc_id not in fused_scores:
                 fused_scores[doc_id] = 0
-                doc_info_map[doc_id] = {
-                    "title": doc.metadata.get("title"),
-                    "slug": doc.metadata.get("slug"),
-                    "repo_id": doc.metadata.get("repo_id"),
-                    # 对向量检索的片段也进行高亮
-                    "content": self._highlight_text(doc.page_content, query),
-                    "updated_date": doc.metadata.get("updated_date"),
-                    "author_name": doc.metadata.get("author_name"),
-                    "source_type": "vector"
-                }
-            else:
-                # 如果已经存在 (即 Keyword 也搜到了)，优先使用 Vector 的 metadata (因为它有 author_name)
-                # 并且 content 使用 Vector 的片段可能更相关
-                current_info = doc_info_map[doc_id]
-                if current_info["source_type"] == "keyword":
-                     doc_info_map[doc_id].update({
-                        "author_name": doc.metadata.get("author_name"),
-                        "content": self._highlight_text(doc.page_content, query),
-                        "source_type": "hybrid"
-                     })
-
+            best_chunks.setdefault(doc_id, doc)
             fused_scores[doc_id] += 1 / (rank + k)
 
         # 4. 重新排序
-        sorted_ids = sorted(fused_scores.keys(), key=lambda x: fused_scores[x], reverse=True)[:limit]
+        # 近似重复的文档 (复制的模板 / 周报) 只保留得分最高的一篇
+        sorted_ids = collapse_duplicates(sorted(fused_scores.keys(), key=lambda x: fused_scores[x], reverse=True))[:limit]
 
-        # 5. 构造最终结果
+        # 5. 构造最终结果 (精简 payload 的切片只为最终结果补齐正文与元数据)
+        await self._hydrate([best_chunks[doc_id] for doc_id in sorted_ids if doc_id in best_chunks])
         final_results = []
         for doc_id in sorted_ids:
-            info = doc_info_map[doc_id]
+            chunk = best_chunks.get(doc_id)
+            if doc_id not in doc_info_map:
+                info = self._vector_card(chunk, query, "vector")
+            else:
+                info = doc_info_map[doc_id]
+                if chunk is not None:
+                    # Keyword 也搜到了：优先使用 Vector 的 metadata (因为它有 author_name)，
+                    # 并且 content 使用 Vector 的片段可能更相关
+                    info.update({
+                        "author_name": chunk.metadata.get("author_name"),
+                        "content": self._highlight_text(chunk.page_content, query),
+                        "source_type": "hybrid"
+                    })
             final_results.append({
                 "score": fused_scores[doc_id],
                 **info
@@ -313,13 +666,10 @@ class RAGService:
             
         return final_results
 
-    async def chat(self, query: str, repo_id: Optional[int] = None, session_id: Optional[str] = None):
+    async def _prepare_chat(self, query: str, repo_id: Optional[int] = None, session_id: Optional[str] = None) -> dict:
         """
-        Conversational RAG Pipeline:
-        1. Contextualize Query (History-Aware)
-        2. Retrieval with Metadata (Parent Document Retrieval)
-        3. Answer Generation
-        4. Memory Persistence
+        问答的准备阶段 (普通与流式接口共用)：
+        会话、历史、问题改写、检索与上下文拼装，返回生成回答所需的全部输入
         """
         # 0. 获取/创建会话
         if not session_id:
@@ -328,91 +678,163 @@ class RAGService:
             await session.insert()
             session_id = str(session.id)
         
-        # 获取历史记录
-        history_msgs = await ChatMessage.find(ChatMessage.session_id == session_id).sort("+created_at").to_list()
-        chat_history = []
-        for msg in history_msgs:
-            if msg.role == "user":
-                chat_history.append(HumanMessage(content=msg.content))
-            else:
-                chat_history.append(AIMessage(content=msg.content))
+        # 获取历史记录 (最近若干轮 + 早期轮次的摘要)
+        chat_history = await self.history.load(session_id)
 
-        # Step 1: Contextualize Query (上下文改写)
+        # Step 1 & 2: Contextualize Query (上下文改写) + Retrieval (Chunk Window Retrieval)
         final_query = query
-        if chat_history:
-            contextualize_q_system_prompt = """Given a chat history and the latest user question \
+        if not chat_history:
+            vector_results = await self._chat_retrieve(query)
+        elif not settings.CHAT_SPECULATIVE_RETRIEVAL:
+            final_query = await self._contextualize(query, chat_history)
+            vector_results = await self._chat_retrieve(final_query)
+        elif not needs_rewrite(query):
+            # 问题自成一体 (无指代、不过短)，跳过改写
+            logger.info("Query looks self-contained, skip contextualize")
+            vector_results = await self._chat_retrieve(query)
+        else:
+            # 推测检索：按原问题检索与改写并行，改写结果与原问题几乎相同时直接复用
+            speculative = asyncio.ensure_future(self._chat_retrieve(query))
+            try:
+                final_query = await self._contextualize(query, chat_history)
+            except asyncio.CancelledError:
+                speculative.cancel()
+                raise
+            except Exception as e:
+                logger.error(f"Contextualize failed, using raw query: {e}")
+            if query_similarity(query, final_query) >= settings.CHAT_REWRITE_REUSE_SIMILARITY:
+                vector_results = await speculative
+            else:
+                speculative.cancel()
+                vector_results = await self._chat_retrieve(final_query)
+
+        # 2.2 Context Construction: 命中切片 + 相邻内容，按 token 预算截取
+        context_text, ordered_docs = await self.context_builder.build(vector_results)
+        if not context_text:
+            context_text = "No relevant documents found."
+
+        # 构造 Sources (Simple metadata for UI)
+        sources = []
+        for d in ordered_docs:
+            sources.append({
+                "title": d.title,
+                "slug": d.slug,
+                "yuque_id": d.yuque_id,
+                "author_id": d.user_id,
+                "updated_at": d.updated_at,
+                "summary": d.summary
+            })
+
+        # 回答缓存只用于首轮问答 (带历史的回答依赖对话内容)，且须有引用文档，文档变更时才能随之失效
+        answer_key = None
+        if not chat_history and ordered_docs and get_answer_cache().enabled:
+            vector = None
+            if settings.ANSWER_CACHE_SIMILARITY < 1:
+                # 检索时已计算过，命中查询向量缓存
+                vector = await self.embeddings.aembed_query(final_query)
+            answer_key = AnswerKey(
+                "chat", final_query, repo_id=repo_id, fingerprint=docs_fingerprint(ordered_docs),
+                vector=vector, doc_ids=[d.yuque_id for d in ordered_docs]
+            )
+
+        return {
+            "session_id": session_id,
+            "sources": sources,
+            "answer_key": answer_key,
+            "inputs": {
+                "context": context_text,
+                "chat_history": chat_history,
+                "input": final_query
+            }
+        }
+
+    async def _contextualize(self, query: str, chat_history: list) -> str:
+        """把依赖上文的问题改写为独立问题"""
+        contextualize_q_system_prompt = """Given a chat history and the latest user question \
 which might reference context in the chat history, formulate a standalone question \
 which can be understood without the chat history. Do NOT answer the question, \
 just reformulate it if needed and otherwise return it as is."""
-            
-            contextualize_q_prompt = ChatPromptTemplate.from_messages(
-                [
-                    ("system", contextualize_q_system_prompt),
-                    ("placeholder", "{chat_history}"),
-                    ("human", "{input}"),
-                ]
-            )
-            history_chain = contextualize_q_prompt | self.llm | StrOutputParser()
-            final_query = await history_chain.ainvoke({
-                "chat_history": chat_history,
-                "input": query
-            })
-            logger.info(f"Contextualized query: {final_query}")
+        
+        contextualize_q_prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", contextualize_q_system_prompt),
+                ("placeholder", "{chat_history}"),
+                ("human", "{input}"),
+            ]
+        )
+        history_chain = contextualize_q_prompt | self.llm | StrOutputParser()
+        final_query = await history_chain.ainvoke({
+            "chat_history": chat_history,
+            "input": query
+        })
+        logger.info(f"Contextualized query: {final_query}")
+        return final_query
 
-        # Step 2: Retrieval (Parent Document Retrieval)
-        # 2.1 Vector Search to get candidate chunks
+    async def _chat_search(self, query: str,
+                           query_vector: Optional[List[float]] = None) -> List[Tuple[Document, float]]:
+        """单个问题的问答召回 (MMR 重排，避免同一文档的相似切片挤掉其他来源)"""
+        options = {"query_vector": query_vector} if query_vector is not None else {}
         try:
-            # Use async vector search
-            vector_results = await self.vector_store.asimilarity_search_with_score(final_query, k=10)
+            return await self._retrieve(
+                query, k=settings.CHAT_RETRIEVAL_K,
+                mmr_lambda=settings.CHAT_MMR_LAMBDA, fetch_k=settings.CHAT_MMR_FETCH_K, **options
+            )
         except Exception as e:
             logger.error(f"Vector search failed in chat: {e}")
-            vector_results = []
+            return []
 
-        # 2.2 Deduplication & ID Extraction
-        top_doc_ids = []
-        seen_ids = set()
-        for doc, score in vector_results:
-            # metadata uses 'doc_id' which is yuque_id
-            d_id = doc.metadata.get("doc_id")
-            if d_id and d_id not in seen_ids:
-                top_doc_ids.append(d_id)
-                seen_ids.add(d_id)
-            if len(top_doc_ids) >= 3:
-                break
-        
-        # 2.3 Full Content Fetching
-        docs = []
-        if top_doc_ids:
-            docs = await Doc.find(In(Doc.yuque_id, top_doc_ids)).to_list()
-        
-        # Sort docs to match the order of top_doc_ids (relevance)
-        docs_map = {d.yuque_id: d for d in docs}
-        ordered_docs = []
-        for d_id in top_doc_ids:
-            if d_id in docs_map:
-                ordered_docs.append(docs_map[d_id])
-
-        # 2.4 Context Construction
-        context_parts = []
-        for d in ordered_docs:
-            # Truncate body to 8000 chars to avoid token limit issues
-            body = d.body or ""
-            if len(body) > 8000:
-                body = body[:8000] + "\n...(truncated due to length)..."
-            
-            # Try to get author name if possible, otherwise use ID
-            author_info = f"{d.user_id} (ID)"
-            
-            part = f"=== Document: {d.title} ===\nAuthor: {author_info}\nUpdate: {d.updated_at}\nContent:\n{body}\n========================="
-            context_parts.append(part)
-        
-        context_text = "\n\n".join(context_parts)
-        if not context_text:
-            context_text = "No relevant documents found."
+    async def _expanded_search(self, query: str) -> List[Tuple[Document, float]]:
+        """
+        多查询扩展召回：原问题与子查询并发检索后 RRF 融合
+        子查询的向量一次批量计算；llm 模式下拆分问题的 LLM 调用与原问题的检索并行
+        """
+        mode = settings.CHAT_QUERY_EXPANSION
+        max_queries = settings.CHAT_EXPANSION_MAX_QUERIES
+        original = None
+        if mode == "llm":
+            original = asyncio.ensure_future(self._chat_search(query))
+            try:
+                sub_queries = await llm_sub_queries(self.llm, query, max_queries)
+            except asyncio.CancelledError:
+                original.cancel()
+                raise
+            except Exception as e:
+                logger.error(f"Query expansion failed: {e}")
+                sub_queries = []
+            if not sub_queries:
+                return await original
+        else:
+            sub_queries = keyword_sub_queries(query, max_queries)
+            if not sub_queries:
+                return await self._chat_search(query)
+        logger.info(f"Expanded query into: {sub_queries}")
 
-        # Step 3: Answer Generation (生成回答)
-        qa_system_prompt = """你是一位专业的团队技术顾问。请基于以下检索到的完整文档上下文（Context），回答用户的问题。
-这些文档是根据相关性检索到的完整内容，请仔细阅读。
+        # 原问题的检索已在进行时只需计算子查询的向量
+        texts = sub_queries if original else [query] + sub_queries
+        try:
+            vectors = await asyncio.to_thread(embed_queries, self.embeddings, texts)
+        except Exception as e:
+            logger.error(f"Batch query embedding failed: {e}")
+            vectors = [None] * len(texts)
+        searches = [self._chat_search(q, v) for q, v in zip(texts, vectors)]
+        result_lists = await asyncio.gather(original or searches.pop(0), *searches)
+        return rrf_fuse(result_lists, k=settings.SEARCH_RRF_K, limit=settings.CHAT_RETRIEVAL_K)
+
+    async def _chat_retrieve(self, query: str) -> List[Tuple[Document, float]]:
+        """问答召回候选切片 (开启 CHAT_QUERY_EXPANSION 时融合多个子查询的结果)"""
+        if settings.CHAT_QUERY_EXPANSION:
+            results = await self._expanded_search(query)
+        else:
+            results = await self._chat_search(query)
+        # 近似重复文档的切片只保留最先出现的那篇文档的，避免上下文里出现多份相同内容
+        doc_ids = list(dict.fromkeys(doc.metadata.get("doc_id") for doc, _ in results))
+        kept = set(collapse_duplicates(doc_ids))
+        return [(doc, score) for doc, score in results if doc.metadata.get("doc_id") in kept]
+
+    def _qa_chain(self):
+        """Step 3: Answer Generation (生成回答)"""
+        qa_system_prompt = """你是一位专业的团队技术顾问。请基于以下检索到的文档上下文（Context），回答用户的问题。
+这些内容是根据相关性从文档中截取的片段及其前后文，请仔细阅读。
 请在回答中尽可能引用文档的标题、作者和最后更新时间，以增加可信度。
 如果上下文中没有答案，请诚实地说不知道，不要编造。
 回答请使用 Markdown 格式，条理清晰。
@@ -428,38 +850,100 @@ just reformulate it if needed and otherwise return it as is."""
             ]
         )
         
-        rag_chain = qa_prompt | self.llm | StrOutputParser()
-        
-        answer = await rag_chain.ainvoke({
-            "context": context_text,
-            "chat_history": chat_history,
-            "input": final_query 
-        })
-        
-        # Step 4: Memory Persistence (记忆存储)
+        return qa_prompt | self.llm | StrOutputParser()
+
+    async def _generate_answer(self, prepared: dict) -> str:
+        """生成回答：可缓存时先查回答缓存，并与相同的并发请求合并为一次 LLM 调用"""
+        generate = lambda: self._qa_chain().ainvoke(prepared["inputs"])
+        answer_key = prepared.get("answer_key")
+        if answer_key is None:
+            return await generate()
+        return await get_answer_cache().get_or_generate(answer_key, generate)
+
+    async def _save_turn(self, session_id: str, query: str, answer: str, sources: list):
+        """Step 4: Memory Persistence (记忆存储)"""
         # 保存用户提问
         await ChatMessage(session_id=session_id, role="user", content=query).insert()
-        
-        # 构造 Sources (Simple metadata for UI)
-        sources = []
-        for d in ordered_docs:
-            sources.append({
-                "title": d.title,
-                "slug": d.slug,
-                "yuque_id": d.yuque_id,
-                "author_id": d.user_id,
-                "updated_at": d.updated_at
-            })
-
         # 保存 AI 回答
         await ChatMessage(session_id=session_id, role="ai", content=answer, sources=sources).insert()
+        # 超出窗口的早期轮次折叠进摘要 (需要调用 LLM，不阻塞当前回答)
+        _spawn(self.history.compact(session_id))
+
+    async def chat(self, query: str, repo_id: Optional[int] = None, session_id: Optional[str] = None):
+        """
+        Conversational RAG Pipeline:
+        1. Contextualize Query (History-Aware)
+        2. Retrieval with Metadata (Chunk Window Retrieval)
+        3. Answer Generation
+        4. Memory Persistence
+        """
+        prepared = await self._prepare_chat(query, repo_id=repo_id, session_id=session_id)
+        answer = await self._generate_answer(prepared)
+        await self._save_turn(prepared["session_id"], query, answer, prepared["sources"])
         
         return {
             "answer": answer,
-            "sources": sources,
-            "session_id": session_id
+            "sources": prepared["sources"],
+            "session_id": prepared["session_id"]
         }
 
+    async def chat_stream(self, query: str, repo_id: Optional[int] = None, session_id: Optional[str] = None):
+        """
+        流式问答：与 chat 相同的流程，按事件逐个产出
+        - {"type": "sources", "sources": [...], "session_id": ...} 检索完成后立即产出
+        - {"type": "token", "content": "..."} 回答生成中逐段产出
+        - {"type": "done", "session_id": ...} / {"type": "error", "message": ...}
+        生成结束后先保存对话再产出 done；客户端中途断开时保存已生成的部分
+        命中回答缓存 (或等待到相同并发请求的结果) 时，整段回答作为一个 token 事件产出
+        """
+        try:
+            prepared = await self._prepare_chat(query, repo_id=repo_id, session_id=session_id)
+        except Exception as e:
+            # 流已开始 (响应头已发出)，不能再返回 500，按事件约定以 error 结束
+            logger.error(f"Preparing streaming chat failed: {e}")
+            yield {"type": "error", "message": "检索上下文失败"}
+            return
+        session_id = prepared["session_id"]
+        yield {"type": "sources", "sources": prepared["sources"], "session_id": session_id}
+
+        answer_cache = get_answer_cache()
+        answer_key = prepared.get("answer_key")
+        cached = await answer_cache.wait(answer_key) if answer_key else None
+        if cached is not None:
+            yield {"type": "token", "content": cached}
+            await self._save_turn(session_id, query, cached, prepared["sources"])
+            yield {"type": "done", "session_id": session_id}
+            return
+        if answer_key:
+            answer_cache.claim(answer_key)
+
+        chunks = []
+        try:
+            async for chunk in self._qa_chain().astream(prepared["inputs"]):
+                if chunk:
+                    chunks.append(chunk)
+                    yield {"type": "token", "content": chunk}
+        except (asyncio.CancelledError, GeneratorExit):
+            # 客户端断开：所在任务已被取消，已生成的部分放到独立任务中保存
+            if answer_key:
+                answer_cache.resolve(answer_key)
+            if chunks:
+                partial = "".join(chunks) + "\n\n...(回答未完成)"
+                _spawn(self._save_turn(session_id, query, partial, prepared["sources"]))
+            raise
+        except Exception as e:
+            logger.error(f"Streaming answer failed: {e}")
+            if answer_key:
+                answer_cache.resolve(answer_key, error=e)
+            yield {"type": "error", "message": "回答生成失败"}
+            return
+
+        answer = "".join(chunks)
+        if answer_key:
+            answer_cache.resolve(answer_key, answer)
+        await self._save_turn(session_id, query, answer, prepared["sources"])
+        yield {"type": "done", "session_id": session_id}
+
     async def explain(self, text: str):
         """
         AI 助读/解释
@@ -474,5 +958,8 @@ just reformulate it if needed and otherwise return it as is."""
         prompt = ChatPromptTemplate.from_template(template)
         chain = prompt | self.llm | StrOutputParser()
         
-        response = await chain.ainvoke({"text": text})
+        # 同一段选中文本的解释直接复用 (只做精确命中)
+        response = await get_answer_cache().get_or_generate(
+            AnswerKey("explain", text), lambda: chain.ainvoke({"text": text})
+        )
         return {"explanation": response}
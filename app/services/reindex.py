@@ -0,0 +1,255 @@
+"""
+向量集合蓝绿重建
+更换 Embedding 模型 / 维度、调整切片或开启原生混合检索后，需要全量重新向量化。
+QDRANT_COLLECTION_NAME 是别名，RAGService 始终通过别名读写：
+1. 新建带版本号的集合 (按当前配置)，从 MongoDB 分批流式读取文档，并行切片与向量化写入新集合
+2. 重建期间经 doc_events 记录的文档变更，在切换前补写到新集合
+3. 原子切换别名，线上检索无中断；旧集合保留一个版本用于回滚
+注意: 变更记录在进程内，多 worker 部署时应在没有其他 worker 写入的时段执行 (或在切换后再做一次增量同步)
+"""
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.models.schemas import Doc, DocChunk, DocIndexView, Member, User
+from app.services.answer_cache import get_answer_cache
+from app.services.chunk_store import build_chunks, get_chunks_for, is_current, save_chunks
+from app.services.search_cache import get_search_cache
+from app.services.vector_config import (
+    list_versioned_collections, point_alias, resolve_alias, versioned_collection_name
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ReindexProgress:
+    def __init__(self, target: str, total: int = 0):
+        self.status = "running" # running / done / failed
+        self.target = target
+        self.previous: Optional[str] = None
+        self.total = total
+        self.processed = 0
+        self.failed = 0
+        self.chunks = 0
+        self.caught_up = 0 # 重建期间发生变更、切换前补写的文档数
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "status": self.status,
+            "target": self.target,
+            "previous": self.previous,
+            "total": self.total,
+            "processed": self.processed,
+            "failed": self.failed,
+            "chunks": self.chunks,
+            "caught_up": self.caught_up,
+            "percent": round(self.processed * 100 / self.total, 1) if self.total else 100.0,
+            "docs_per_second": round(self.processed / elapsed, 2) if elapsed > 0 else 0.0,
+            "elapsed_seconds": round(elapsed, 1),
+            "error": self.error,
+        }
+
+
+_progress: Optional[ReindexProgress] = None
+# 重建进行中时记录发生变更的文档 id，其余时间为 None
+_changed_docs: Optional[Set[int]] = None
+
+
+def get_reindex_progress() -> Optional[dict]:
+    return _progress.to_dict() if _progress else None
+
+
+def is_running() -> bool:
+    return _progress is not None and _progress.status == "running"
+
+
+def note_doc_changed(doc_id: Optional[int]):
+    """doc_events 调用：重建期间的文档写入/删除需要在切换前补写到新集合"""
+    if _changed_docs is not None and doc_id:
+        _changed_docs.add(doc_id)
+
+
+async def _load_author_names() -> Dict[int, str]:
+    """一次性读取作者名 (成员优先)，避免逐文档查询"""
+    names = {u.yuque_id: u.name for u in await User.find_all().to_list()}
+    names.update({m.yuque_id: m.name for m in await Member.find_all().to_list()})
+    return names
+
+
+class Reindexer:
+    """
+    全量重建到新集合并切换别名
+    - 文档按 _id 顺序分批流式读取，同时最多 concurrency 个批次在处理，内存占用与总文档数无关
+    - 切片在线程池中执行 (正文未变的文档复用 doc_chunks 中的切片)；
+      向量化与写入由 VectorStore.add_documents 批量完成 (同样在线程池中)
+    """
+    def __init__(self, rag, batch_size: Optional[int] = None, concurrency: Optional[int] = None):
+        self.rag = rag
+        self.batch_size = batch_size or settings.REINDEX_BATCH_SIZE
+        self.concurrency = max(1, concurrency or settings.REINDEX_CONCURRENCY)
+        self.alias = rag.collection_name
+
+    async def run(self, keep_previous: bool = True) -> dict:
+        global _progress, _changed_docs
+        if is_running():
+            raise RuntimeError("A reindex is already running")
+
+        client = self.rag.client
+        target = versioned_collection_name(self.alias)
+        progress = _progress = ReindexProgress(target)
+        previous = resolve_alias(client, self.alias)
+        # 旧部署直接使用了同名的实体集合 (而不是别名)
+        legacy = previous is None and client.collection_exists(self.alias)
+        progress.previous = previous or (self.alias if legacy else None)
+
+        _changed_docs = set()
+        try:
+            hybrid = settings.QDRANT_HYBRID_SEARCH
+            self.rag._create_collection(target, hybrid=hybrid)
+            store = self.rag._make_vector_store(target, hybrid)
+            authors = await _load_author_names()
+
+            query = Doc.find({"body": {"$nin": [None, ""]}})
+            progress.total = await query.count()
+            logger.info(f"Reindexing {progress.total} docs into '{target}' (alias '{self.alias}')")
+
+            await self._index_all(store, authors, progress)
+            if progress.total and progress.failed / progress.total > settings.REINDEX_MAX_FAILURE_RATIO:
+                raise RuntimeError(f"{progress.failed}/{progress.total} docs failed, keeping current collection")
+
+            # 补写重建期间变更的文档，直到没有新的变更；
+            # 最后一次检查与切换之间没有 await，不会漏掉写入
+            while _changed_docs:
+                doc_ids = list(_changed_docs)
+                _changed_docs.clear()
+                await self._catch_up(store, target, doc_ids, authors, progress)
+
+            if legacy:
+                # 别名不能与实体集合同名，只能先删除旧集合 (仅首次迁移时有极短的不可用窗口)
+                logger.warning(f"Dropping legacy collection '{self.alias}' to replace it with an alias")
+                client.delete_collection(self.alias)
+            point_alias(client, self.alias, target)
+            _changed_docs = None
+            logger.info(f"Alias '{self.alias}' now points to '{target}' ({progress.chunks} chunks)")
+
+            # 检索结果来自新集合，清空依赖旧结果的缓存
+            get_search_cache().clear()
+            get_answer_cache().clear()
+            self._drop_old_collections(target, previous if keep_previous else None)
+            progress.status = "done"
+        except Exception as e:
+            logger.error(f"Reindex into '{target}' failed: {e}")
+            progress.status = "failed"
+            progress.error = str(e)
+            # 未切换时删除半成品集合，别名保持不变
+            if resolve_alias(client, self.alias) != target and client.collection_exists(target):
+                client.delete_collection(target)
+            raise
+        finally:
+            _changed_docs = None
+            progress.finished_at = time.time()
+        return progress.to_dict()
+
+    async def _index_all(self, store, authors: Dict[int, str], progress: ReindexProgress):
+        running: Set[asyncio.Task] = set()
+        batch: List[DocIndexView] = []
+
+        async def wait_one():
+            nonlocal running
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+
+        query = Doc.find({"body": {"$nin": [None, ""]}}).sort("+_id").project(DocIndexView)
+        async for doc in query:
+            batch.append(doc)
+            if len(batch) < self.batch_size:
+                continue
+            if len(running) >= self.concurrency:
+                await wait_one()
+            running.add(asyncio.create_task(self._index_batch(store, batch, authors, progress)))
+            batch = []
+        if batch:
+            running.add(asyncio.create_task(self._index_batch(store, batch, authors, progress)))
+        while running:
+            await wait_one()
+
+    def _split_batch(self, docs: List[DocIndexView], authors: Dict[int, str],
+                     stored: Dict[int, List[DocChunk]]):
+        """
+        标题与正文未变的文档直接复用 doc_chunks 中的切片，其余重新解析切片
+        返回 (Documents, 点 ID, 需要保存的新切片, 失败数)
+        """
+        documents, ids, rebuilt, failed = [], [], [], 0
+        for doc in docs:
+            try:
+                rows = stored.get(doc.yuque_id)
+                if not is_current(rows, doc):
+                    plain_text, rows = build_chunks(doc)
+                    rebuilt.append((doc, plain_text, rows))
+                documents.extend(self.rag._chunk_documents(doc, authors.get(doc.user_id, "未知用户"), rows))
+                ids.extend(row.point_id for row in rows)
+            except Exception as e:
+                failed += 1
+                logger.error(f"Failed to split doc {doc.yuque_id}: {e}")
+        return documents, ids, rebuilt, failed
+
+    async def _embed_docs(self, store, docs: List[DocIndexView], authors: Dict[int, str]) -> Tuple[int, int]:
+        """切片并写入目标集合，返回 (切片数, 失败数)"""
+        stored = await get_chunks_for([doc.yuque_id for doc in docs])
+        documents, ids, rebuilt, failed = await asyncio.to_thread(self._split_batch, docs, authors, stored)
+        if documents:
+            await asyncio.to_thread(store.add_documents, documents, ids=ids)
+        # 向量写入成功后再保存新切片
+        for doc, plain_text, rows in rebuilt:
+            await save_chunks(doc, plain_text, rows)
+        return len(documents), failed
+
+    async def _index_batch(self, store, docs: List[DocIndexView], authors: Dict[int, str],
+                           progress: ReindexProgress):
+        try:
+            chunks, failed = await self._embed_docs(store, docs, authors)
+        except Exception as e:
+            logger.error(f"Failed to embed batch of {len(docs)} docs: {e}")
+            chunks, failed = 0, len(docs)
+        progress.processed += len(docs)
+        progress.failed += failed
+        progress.chunks += chunks
+        logger.info(f"Reindex progress: {progress.processed}/{progress.total} docs, {progress.chunks} chunks")
+
+    async def _catch_up(self, store, target: str, doc_ids: List[int], authors: Dict[int, str],
+                        progress: ReindexProgress):
+        """按 MongoDB 中的最新状态重写这些文档 (已删除的只删除向量)"""
+        docs = {d.yuque_id: d for d in await Doc.find({"yuque_id": {"$in": doc_ids}}).project(DocIndexView).to_list()}
+        for doc_id in doc_ids:
+            await self.rag.delete_doc(doc_id, collection_name=target)
+            doc = docs.get(doc_id)
+            if doc and doc.body:
+                chunks, _ = await self._embed_docs(store, [doc], authors)
+                progress.chunks += chunks
+        progress.caught_up += len(doc_ids)
+
+    def _drop_old_collections(self, current: str, keep: Optional[str]):
+        for name in list_versioned_collections(self.rag.client, self.alias):
+            if name not in (current, keep):
+                logger.info(f"Dropping old collection '{name}'")
+                self.rag.client.delete_collection(name)
+
+
+def rollback(rag) -> Optional[str]:
+    """别名切回上一个版本的集合 (需重建时保留了旧集合)，返回切换后的集合名"""
+    current = resolve_alias(rag.client, rag.collection_name)
+    older = [n for n in list_versioned_collections(rag.client, rag.collection_name) if n < (current or "")]
+    if not older:
+        return None
+    point_alias(rag.client, rag.collection_name, older[-1])
+    get_search_cache().clear()
+    get_answer_cache().clear()
+    logger.info(f"Alias '{rag.collection_name}' rolled back to '{older[-1]}'")
+    return older[-1]
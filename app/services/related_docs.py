@@ -0,0 +1,258 @@
+"""
+相关文档 (离线 kNN)
+文档页的"相关文档"如果每次浏览都做一次向量检索，开销随访问量线性增长。这里改为定时批量计算：
+1. 滚动切片集合，按 doc_id 对切片向量求均值并归一化，得到文档级向量，
+   写入单独的紧凑集合 (每篇文档一个点，点 ID 即 doc_id)
+2. 文档级向量组成矩阵，用 NumPy 分块矩阵乘法 (余弦相似度) 求每篇文档的 top-k 邻居
+3. 邻居列表写入 MongoDB doc_related，GET /docs/{slug}/related 只需一次按 slug 的索引查询
+"""
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from qdrant_client import models
+
+from app.core.config import settings
+from app.models.schemas import Doc, DocSummary, RelatedDocs, RelatedNeighbor
+from app.services import reindex
+from app.services.vector_config import dense_vector_params, quantization_config
+
+logger = logging.getLogger(__name__)
+
+# 写入文档级向量 / 邻居列表的批大小
+WRITE_BATCH_SIZE = 256
+
+_last_report: Optional[dict] = None
+_running = False
+
+
+def get_related_report() -> Optional[dict]:
+    return _last_report
+
+
+def is_running() -> bool:
+    return _running
+
+
+def doc_vectors_collection() -> str:
+    return settings.QDRANT_COLLECTION_NAME + settings.RELATED_DOCS_COLLECTION_SUFFIX
+
+
+def nearest_neighbors(matrix: np.ndarray, k: int, batch_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    matrix 的每行为归一化后的文档向量，返回每行 top-k 邻居的 (行号, 相似度)，按相似度降序，不含自身
+    分块计算 batch_size x n 的相似度矩阵，峰值内存与 batch_size 成正比
+    """
+    n = matrix.shape[0]
+    k = min(k, n - 1)
+    if k <= 0:
+        return np.empty((n, 0), dtype=np.int64), np.empty((n, 0), dtype=np.float32)
+
+    indices = np.empty((n, k), dtype=np.int64)
+    scores = np.empty((n, k), dtype=np.float32)
+    for start in range(0, n, batch_size):
+        end = min(start + batch_size, n)
+        sims = matrix[start:end] @ matrix.T
+        rows = np.arange(end - start)
+        sims[rows, rows + start] = -np.inf # 排除自身
+        # argpartition 选出 top-k (无序)，再只对这 k 个排序
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        indices[start:end] = np.take_along_axis(top, order, axis=1)
+        scores[start:end] = np.take_along_axis(top_scores, order, axis=1)
+    return indices, scores
+
+
+class RelatedDocsBuilder:
+    def __init__(self, rag, top_k: Optional[int] = None, batch_size: Optional[int] = None,
+                 page_size: Optional[int] = None):
+        self.rag = rag
+        self.top_k = top_k or settings.RELATED_DOCS_TOP_K
+        self.batch_size = batch_size or settings.RELATED_DOCS_BATCH_SIZE
+        self.page_size = page_size or settings.VECTOR_GC_PAGE_SIZE
+
+    async def run(self) -> dict:
+        global _last_report, _running
+        if _running:
+            raise RuntimeError("Related docs build is already running")
+        if reindex.is_running():
+            # 重建期间别名会切换，且新集合正在写入
+            raise RuntimeError("A reindex is running, skip related docs build")
+
+        _running = True
+        started = time.time()
+        report = {
+            "status": "running",
+            "collection": doc_vectors_collection(),
+            "scanned_points": 0,
+            "docs": 0,
+            "top_k": self.top_k,
+            "started_at": started,
+            "elapsed_seconds": 0.0,
+            "error": None,
+        }
+        _last_report = report
+        try:
+            doc_ids, repo_ids, matrix = await self._doc_vectors(report)
+            doc_ids, repo_ids, matrix = await self._drop_deleted(doc_ids, repo_ids, matrix)
+            report["docs"] = len(doc_ids)
+            await asyncio.to_thread(self._save_doc_vectors, doc_ids, repo_ids, matrix)
+            indices, scores = await asyncio.to_thread(nearest_neighbors, matrix, self.top_k, self.batch_size)
+            await self._save_neighbors(doc_ids, indices, scores)
+            report["status"] = "done"
+            logger.info(f"Related docs: {report['docs']} docs from {report['scanned_points']} points")
+        except Exception as e:
+            logger.error(f"Related docs build failed: {e}")
+            report["status"] = "failed"
+            report["error"] = str(e)
+            raise
+        finally:
+            report["elapsed_seconds"] = round(time.time() - started, 2)
+            _running = False
+        return report
+
+    async def _doc_vectors(self, report: dict) -> Tuple[List[int], List[Optional[int]], np.ndarray]:
+        """滚动切片集合，按文档对切片向量求均值，返回 (doc_id 列表, repo_id 列表, 归一化矩阵)"""
+        from app.services.rag_service import DENSE_VECTOR_NAME
+        client = self.rag.client
+        key = self.rag.vector_store.metadata_payload_key
+        named = self.rag._collection_has_named_dense(self.rag.collection_name)
+        sums: Dict[int, np.ndarray] = {}
+        repos: Dict[int, Optional[int]] = {}
+        offset = None
+        while True:
+            points, offset = await asyncio.to_thread(
+                client.scroll,
+                collection_name=self.rag.collection_name,
+                limit=self.page_size,
+                offset=offset,
+                with_payload=[f"{key}.doc_id", f"{key}.repo_id"],
+                with_vectors=[DENSE_VECTOR_NAME] if named else True,
+            )
+            for point in points:
+                metadata = (point.payload or {}).get(key) or {}
+                doc_id = metadata.get("doc_id")
+                vector = point.vector.get(DENSE_VECTOR_NAME) if isinstance(point.vector, dict) else point.vector
+                if doc_id is None or not vector:
+                    continue
+                vector = np.asarray(vector, dtype=np.float32)
+                if doc_id in sums:
+                    sums[doc_id] += vector
+                else:
+                    sums[doc_id] = vector.copy()
+                    repos[doc_id] = metadata.get("repo_id")
+            report["scanned_points"] += len(points)
+            if offset is None:
+                break
+
+        doc_ids = list(sums)
+        if not doc_ids:
+            return [], [], np.empty((0, 0), dtype=np.float32)
+        # 切片数不同的文档求均值后方向不变，归一化后即为余弦相似度所需的单位向量
+        matrix = np.stack([sums[doc_id] for doc_id in doc_ids])
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.maximum(norms, 1e-12)
+        return doc_ids, [repos[doc_id] for doc_id in doc_ids], matrix
+
+    async def _drop_deleted(self, doc_ids, repo_ids, matrix):
+        """孤儿向量 (MongoDB 中已删除的文档) 不参与计算"""
+        if not doc_ids:
+            return doc_ids, repo_ids, matrix
+        live = set(await Doc.get_pymongo_collection().distinct("yuque_id", {"yuque_id": {"$in": doc_ids}}))
+        keep = [i for i, doc_id in enumerate(doc_ids) if doc_id in live]
+        if len(keep) == len(doc_ids):
+            return doc_ids, repo_ids, matrix
+        return [doc_ids[i] for i in keep], [repo_ids[i] for i in keep], matrix[keep]
+
+    def _save_doc_vectors(self, doc_ids: List[int], repo_ids: List[Optional[int]], matrix: np.ndarray):
+        """写入文档级向量集合 (维度变化时重建集合)，并删除已不存在的文档"""
+        client = self.rag.client
+        name = doc_vectors_collection()
+        if not doc_ids:
+            if client.collection_exists(name):
+                client.delete(collection_name=name, points_selector=models.FilterSelector(filter=models.Filter()))
+            return
+
+        dim = matrix.shape[1]
+        if client.collection_exists(name):
+            vectors = client.get_collection(name).config.params.vectors
+            if getattr(vectors, "size", None) != dim:
+                client.delete_collection(name)
+        if not client.collection_exists(name):
+            client.create_collection(
+                collection_name=name,
+                vectors_config=dense_vector_params(size=dim),
+                quantization_config=quantization_config(),
+            )
+
+        for start in range(0, len(doc_ids), WRITE_BATCH_SIZE):
+            end = start + WRITE_BATCH_SIZE
+            client.upsert(
+                collection_name=name,
+                points=models.Batch(
+                    ids=doc_ids[start:end],
+                    vectors=matrix[start:end].tolist(),
+                    payloads=[{"doc_id": d, "repo_id": r} for d, r in zip(doc_ids[start:end], repo_ids[start:end])],
+                ),
+            )
+        client.delete(
+            collection_name=name,
+            points_selector=models.FilterSelector(
+                filter=models.Filter(must_not=[models.HasIdCondition(has_id=doc_ids)])
+            ),
+        )
+
+    async def _save_neighbors(self, doc_ids: List[int], indices: np.ndarray, scores: np.ndarray):
+        collection = RelatedDocs.get_pymongo_collection()
+        slugs = {}
+        async for raw in Doc.get_pymongo_collection().find(
+            {"yuque_id": {"$in": doc_ids}}, projection={"yuque_id": 1, "slug": 1}
+        ):
+            slugs[raw["yuque_id"]] = raw["slug"]
+
+        computed_at = datetime.utcnow()
+        for start in range(0, len(doc_ids), WRITE_BATCH_SIZE):
+            writes = []
+            for i in range(start, min(start + WRITE_BATCH_SIZE, len(doc_ids))):
+                row = RelatedDocs(
+                    doc_id=doc_ids[i],
+                    slug=slugs.get(doc_ids[i], ""),
+                    neighbors=[
+                        RelatedNeighbor(doc_id=doc_ids[j], score=round(float(s), 4))
+                        for j, s in zip(indices[i], scores[i])
+                    ],
+                    computed_at=computed_at,
+                )
+                writes.append(collection.replace_one(
+                    {"doc_id": row.doc_id}, row.model_dump(exclude={"id"}), upsert=True
+                ))
+            await asyncio.gather(*writes)
+        await collection.delete_many({"doc_id": {"$nin": doc_ids}})
+
+
+async def get_related(slug: str, limit: int) -> Optional[List[dict]]:
+    """
+    读取文档的相关文档 (按相似度降序)；文档不存在时返回 None
+    邻居列表为离线计算结果，查询时只补充文档列表字段并过滤掉之后已删除的文档
+    """
+    row = await RelatedDocs.find_one(RelatedDocs.slug == slug)
+    if not row:
+        # 尚未计算 (新文档) 或 slug 已变更
+        doc = await Doc.find_one(Doc.slug == slug).project(DocSummary)
+        if not doc:
+            return None
+        row = await RelatedDocs.find_one(RelatedDocs.doc_id == doc.yuque_id) if doc.yuque_id else None
+        if not row:
+            return []
+
+    neighbors = row.neighbors[:limit]
+    docs = await Doc.find({"yuque_id": {"$in": [n.doc_id for n in neighbors]}}).project(DocSummary).to_list()
+    docs_map = {d.yuque_id: d for d in docs}
+    return [
+        {**docs_map[n.doc_id].model_dump(), "score": n.score}
+        for n in neighbors if n.doc_id in docs_map
+    ]
@@ -1,6 +1,7 @@
 import logging
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from app.core.config import settings
 from app.services.sync_service import SyncService
 
 logger = logging.getLogger(__name__)
@@ -60,6 +61,24 @@ class SchedulerService:
         )
         logger.info("Job 'nightly_sync' scheduled for 03:00 AM daily")
 
+        if settings.VECTOR_GC_ENABLED:
+            self._scheduler.add_job(
+                self._run_vector_gc,
+                trigger=CronTrigger(hour=settings.VECTOR_GC_HOUR, minute=30, timezone=tz),
+                id="vector_gc",
+                replace_existing=True
+            )
+            logger.info(f"Job 'vector_gc' scheduled for {settings.VECTOR_GC_HOUR:02d}:30 daily")
+
+        if settings.RELATED_DOCS_ENABLED:
+            self._scheduler.add_job(
+                self._run_related_docs,
+                trigger=CronTrigger(hour=settings.RELATED_DOCS_HOUR, minute=0, timezone=tz),
+                id="related_docs",
+                replace_existing=True
+            )
+            logger.info(f"Job 'related_docs' scheduled for {settings.RELATED_DOCS_HOUR:02d}:00 daily")
+
     async def _run_nightly_sync(self):
         """执行全量同步任务"""
         logger.info(">>> Starting Nightly Auto-Sync Task <<<")
@@ -70,3 +89,21 @@ class SchedulerService:
             logger.error(f"Nightly sync failed: {e}", exc_info=True)
         finally:
             await service.client.close()
+
+    async def _run_vector_gc(self):
+        """对账 Qdrant 与 MongoDB，回收孤儿向量"""
+        from app.services.rag_service import RAGService
+        from app.services.vector_gc import OrphanVectorCollector
+        try:
+            await OrphanVectorCollector(RAGService()).run()
+        except Exception as e:
+            logger.error(f"Vector GC failed: {e}", exc_info=True)
+
+    async def _run_related_docs(self):
+        """由切片向量重新计算文档级向量与相关文档列表"""
+        from app.services.rag_service import RAGService
+        from app.services.related_docs import RelatedDocsBuilder
+        try:
+            await RelatedDocsBuilder(RAGService()).run()
+        except Exception as e:
+            logger.error(f"Related docs build failed: {e}", exc_info=True)
@@ -0,0 +1,121 @@
+import time
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.text_utils import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class SearchResultCache:
+    """
+    混合检索结果缓存
+    - 键: (归一化查询, repo_id, limit)
+    - 失效: 每个知识库维护一个 generation 计数器，文档写入/删除时自增；
+      限定知识库的查询校验该库的 generation，全局查询校验全局 generation，
+      因此某个库的写入只会让相关条目失效，不会清空整个缓存
+    - TTL 作为兜底 (例如成员改名等未追踪的写入)
+    """
+    def __init__(self, max_size: int = 512, ttl: int = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> (写入时间, generation, 结果)
+        self._entries: "OrderedDict[Tuple[str, Optional[int], int], Tuple[float, int, List[Dict[str, Any]]]]" = OrderedDict()
+        self._repo_generations: Dict[int, int] = defaultdict(int)
+        self._global_generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _key(self, query: str, repo_id: Optional[int], limit: int):
+        return (normalize_query(query), repo_id, limit)
+
+    def generation(self, repo_id: Optional[int] = None) -> int:
+        """
+        当前 generation。调用方应在检索开始前获取，写入缓存时带上，
+        这样检索过程中发生的写入会让这次结果直接作废
+        """
+        if repo_id:
+            return self._repo_generations[repo_id]
+        return self._global_generation
+
+    def get(self, query: str, repo_id: Optional[int], limit: int) -> Optional[List[Dict[str, Any]]]:
+        if not self.enabled:
+            return None
+        key = self._key(query, repo_id, limit)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            created_at, generation, results = entry
+            if generation != self.generation(repo_id) or (self.ttl and time.time() - created_at > self.ttl):
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(results)
+
+    def put(self, query: str, repo_id: Optional[int], limit: int,
+            results: List[Dict[str, Any]], generation: int):
+        if not self.enabled:
+            return
+        key = self._key(query, repo_id, limit)
+        with self._lock:
+            # 检索期间发生了写入，结果可能已过期，不缓存
+            if generation != self.generation(repo_id):
+                return
+            self._entries[key] = (time.time(), generation, list(results))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_repo(self, repo_id: Optional[int]):
+        """知识库内容发生变化：该库及全局查询的缓存失效"""
+        with self._lock:
+            if repo_id:
+                self._repo_generations[repo_id] += 1
+            self._global_generation += 1
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_search_cache: Optional[SearchResultCache] = None
+
+
+def get_search_cache() -> SearchResultCache:
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = SearchResultCache(
+            max_size=settings.SEARCH_CACHE_SIZE,
+            ttl=settings.SEARCH_CACHE_TTL,
+        )
+    return _search_cache
+
+
+def invalidate_repo(repo_id: Optional[int]):
+    """文档写入路径 (同步 / Webhook / 清理) 调用，使相关搜索缓存失效"""
+    get_search_cache().invalidate_repo(repo_id)
@@ -0,0 +1,39 @@
+"""
+精简向量 payload (QDRANT_SLIM_PAYLOAD)
+默认每个点都存完整的切片正文 (约 1000 字符) 和展示用的元数据，正文与 MongoDB doc_chunks 重复，
+候选集较大时也会放大 Qdrant 的内存与网络传输。开启后点上只存 ID 与过滤字段：
+- doc_id / repo_id / user_id：过滤与按文档、作者更新
+- seq / text_start / text_end：定位切片 (问答上下文直接按位置截取 Doc.plain_text，不需要正文)
+搜索结果卡片需要的正文、标题、作者等只对最终 top-k 从 MongoDB 补齐 (见 RAGService._hydrate)
+已有的点在更新或重建集合 (POST /ai/reindex) 后才会瘦身；读取路径兼容两种 payload
+"""
+from typing import Iterable, List, Optional
+
+from langchain_qdrant import QdrantVectorStore
+
+SLIM_METADATA_KEYS = ("doc_id", "repo_id", "user_id", "seq", "text_start", "text_end")
+
+
+def slim_metadata(metadata: Optional[dict]) -> dict:
+    return {k: metadata[k] for k in SLIM_METADATA_KEYS if k in (metadata or {})}
+
+
+class SlimQdrantVectorStore(QdrantVectorStore):
+    """
+    写入时正文仍用于生成向量，但不写入 payload，元数据只保留 SLIM_METADATA_KEYS
+    覆盖的是 langchain-qdrant 的私有静态方法 _build_payloads (按 requirements.txt 固定的 1.1.0 编写，
+    签名由 tests/test_slim_payload.py 校验)，升级该依赖时需核对
+    """
+
+    @staticmethod
+    def _build_payloads(
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]],
+        content_payload_key: str,
+        metadata_payload_key: str,
+    ) -> List[dict]:
+        # 与上游实现一样只遍历一次 texts，兼容任意可迭代对象
+        return [
+            {metadata_payload_key: slim_metadata(metadatas[i] if metadatas is not None else None)}
+            for i, _ in enumerate(texts)
+        ]
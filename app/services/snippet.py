@@ -0,0 +1,148 @@
+import re
+import unicodedata
+from collections import Counter, deque
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from app.services.text_utils import _TOKEN_RE, is_cjk
+
+_SPLIT_RE = re.compile(r"[\s,，。、;；:：!！?？()（）\[\]【】\"'“”‘’]+")
+
+
+def extract_terms(query: str) -> Dict[str, int]:
+    """
+    从查询中提取高亮词 (中文友好)，返回 {词: 所属查询词序号}：
+    - 按空白/标点切分出的原始词 (保留 "C++"、"v1.2" 这类词)
+    - 中文词额外拆成不重叠的 bigram，使 "部署流程" 也能命中正文中的 "部署"、"流程"
+    - 丢弃单个字母数字，避免满屏高亮
+    同一查询词拆出的词共享序号，选窗口时按覆盖的查询词数计分
+    """
+    query = unicodedata.normalize("NFKC", query or "").lower()
+    terms: Dict[str, int] = {}
+    group = 0
+    for word in _SPLIT_RE.split(query):
+        if not word:
+            continue
+        candidates = [word] if len(word) > 1 or is_cjk(word) else []
+        for run in _TOKEN_RE.findall(word):
+            if is_cjk(run) and len(run) > 2:
+                candidates.extend(run[i:i + 2] for i in range(0, len(run) - 1, 2))
+                if len(run) % 2:
+                    candidates.append(run[-2:])
+            elif len(run) > 1 or is_cjk(run):
+                candidates.append(run)
+        if not candidates:
+            continue
+        for term in candidates:
+            terms.setdefault(term, group)
+        group += 1
+    return terms
+
+
+class SnippetEngine:
+    """
+    摘要与高亮引擎，每个查询编译一次：
+    - 每段文本只收集一次全部命中 (按最左最长消解重叠)，窗口选择与高亮共用这份结果
+    - 滑动窗口按 (覆盖的查询词数, 命中字符数) 选最佳片段，替代 "第一个命中词" 的定位
+    - 仅当查询含大小写字母时才对文本 lower()，纯中文查询直接在原文上查找
+    """
+    def __init__(self, query: str, window_size: int = 200, context: int = 20):
+        self.terms = extract_terms(query)
+        self.window_size = window_size
+        self.context = context
+        self._group_count = len(set(self.terms.values()))
+        # 长词优先，与正则交替式的匹配顺序一致
+        self._ordered_terms = sorted(self.terms.items(), key=lambda item: len(item[0]), reverse=True)
+        self._cased = any(term != term.upper() for term in self.terms)
+        self._pattern_ignorecase = None
+        if self.terms:
+            self._pattern_ignorecase = re.compile(
+                "|".join(re.escape(term) for term, _ in self._ordered_terms), re.IGNORECASE
+            )
+
+    def _find_matches(self, text: str) -> List[Tuple[int, int, int]]:
+        """返回不重叠的命中 [(start, end, 查询词序号)]，按位置排序"""
+        target = text.lower() if self._cased else text
+        if len(target) != len(text):
+            # 极少数字符小写后长度变化，偏移无法对齐，退回忽略大小写的正则
+            return [(m.start(), m.end(), self.terms.get(m.group(0).lower(), -1))
+                    for m in self._pattern_ignorecase.finditer(text)]
+
+        # str.find 在 C 层扫描，词数很少时比纯 Python 自动机或正则交替式都快
+        hits = []
+        for term, group in self._ordered_terms:
+            size = len(term)
+            pos = target.find(term)
+            while pos != -1:
+                hits.append((pos, -size, group))
+                pos = target.find(term, pos + 1)
+        hits.sort()
+
+        matches = []
+        last_end = 0
+        for pos, neg_size, group in hits:
+            if pos >= last_end:
+                last_end = pos - neg_size
+                matches.append((pos, last_end, group))
+        return matches
+
+    def _best_start(self, matches: List[Tuple[int, int, int]]) -> int:
+        """滑动窗口，返回最佳窗口中第一个命中的位置"""
+        reach = self.window_size - self.context
+        window = deque()
+        groups = Counter()
+        covered = 0
+        best_start, best_score = matches[0][0], (0, 0)
+        for start, end, group in matches:
+            window.append((start, end, group))
+            groups[group] += 1
+            covered += end - start
+            while end - window[0][0] > reach:
+                old_start, old_end, old_group = window.popleft()
+                groups[old_group] -= 1
+                if not groups[old_group]:
+                    del groups[old_group]
+                covered -= old_end - old_start
+            score = (len(groups), covered)
+            if score > best_score:
+                best_start, best_score = window[0][0], score
+                # 所有查询词都已出现在窗口内，不会有更好的窗口了
+                if len(groups) >= self._group_count:
+                    break
+        return best_start
+
+    def snippet(self, text: str) -> str:
+        if not text:
+            return ""
+        if not self.terms:
+            return text[:self.window_size] + "..."
+
+        matches = self._find_matches(text)
+        start = max(0, self._best_start(matches) - self.context) if matches else 0 # 往前多取一点上下文
+        end = min(len(text), start + self.window_size)
+
+        # 复用命中位置一次性拼接高亮
+        parts = []
+        cursor = start
+        for m_start, m_end, _ in matches:
+            if m_start < start:
+                continue
+            if m_end > end:
+                break
+            parts.append(text[cursor:m_start])
+            parts.append(f"<mark>{text[m_start:m_end]}</mark>")
+            cursor = m_end
+        parts.append(text[cursor:end])
+        snippet = "".join(parts)
+
+        if start > 0:
+            snippet = "..." + snippet
+        if end < len(text):
+            snippet = snippet + "..."
+        return snippet
+
+
+@lru_cache(maxsize=256)
+def get_snippet_engine(query: str, window_size: int = 200) -> SnippetEngine:
+    """按查询缓存编译好的引擎，同一次搜索的所有结果复用"""
+    return SnippetEngine(query, window_size=window_size)
@@ -0,0 +1,36 @@
+import zlib
+from collections import Counter
+from typing import List
+
+from langchain_qdrant import SparseEmbeddings, SparseVector
+
+from app.services.text_utils import tokenize
+
+
+class LexicalSparseEmbeddings(SparseEmbeddings):
+    """
+    本地词法稀疏向量 (用于 Qdrant 原生 sparse + dense 混合检索)
+    - 分词与关键词索引一致 (中文 bigram + 英文单词)
+    - 维度为词的 CRC32 哈希，无需维护词表
+    - 文档侧为饱和词频 (BM25 的 tf 部分)，IDF 交由 Qdrant 的 Modifier.IDF 在服务端计算
+    """
+    def __init__(self, k1: float = 1.2):
+        self.k1 = k1
+
+    @staticmethod
+    def _term_id(term: str) -> int:
+        return zlib.crc32(term.encode("utf-8"))
+
+    def _vectorize(self, terms: List[str], saturate: bool) -> SparseVector:
+        weights = Counter()
+        for term, tf in Counter(terms).items():
+            # 哈希冲突时合并权重 (indices 必须唯一)
+            weights[self._term_id(term)] += tf * (self.k1 + 1) / (tf + self.k1) if saturate else 1.0
+        indices = sorted(weights)
+        return SparseVector(indices=indices, values=[float(weights[i]) for i in indices])
+
+    def embed_documents(self, texts: List[str]) -> List[SparseVector]:
+        return [self._vectorize(tokenize(text), saturate=True) for text in texts]
+
+    def embed_query(self, text: str) -> SparseVector:
+        return self._vectorize(tokenize(text), saturate=False)
@@ -0,0 +1,217 @@
+"""
+文档摘要 (同步时预先计算，存入 Doc.summary)
+- 抽取式摘要：按句打分 (词频中心度 + 与标题的重合 + 位置)，选出的句子按原文顺序拼接，纯 CPU、无模型调用
+- LLM 摘要 (可选，SUMMARY_LLM_ENABLED)：进入后台队列逐篇生成，完成后替换抽取式摘要
+- 按内容指纹 (标题 + 正文) 计算一次，内容未变时同步 / Webhook 不会重复计算；
+  动态流、搜索结果与问答引用卡片直接读取 Doc.summary
+"""
+import re
+import asyncio
+import hashlib
+import logging
+from collections import Counter
+from typing import Dict, List, Optional
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from app.core.config import settings
+from app.models.schemas import Doc
+from app.services.chunker import parse_blocks
+from app.services.text_utils import tokenize
+
+logger = logging.getLogger(__name__)
+
+# 摘要规则变化时递增，指纹随之变化
+SUMMARIZER_VERSION = 1
+
+# 只由写入路径维护的字段，同步 / Webhook 按 API 数据整体 $set 文档时需要排除，避免覆盖已有摘要
+SUMMARY_FIELDS = {"summary", "summary_fingerprint", "summary_source"}
+
+_SENTENCE_RE = re.compile(r"[^。！？!?；;\n]+[。！？!?；;]*")
+_MIN_SENTENCE_CHARS = 6
+
+
+def content_fingerprint(title: Optional[str], body: Optional[str]) -> str:
+    raw = f"{SUMMARIZER_VERSION}\0{title or ''}\0{body or ''}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _sentences(body: Optional[str]) -> List[str]:
+    sentences = []
+    # 代码块与表格不参与摘要
+    for block in parse_blocks(body):
+        if block.kind != "text":
+            continue
+        for match in _SENTENCE_RE.finditer(block.text):
+            sentence = match.group().strip()
+            if len(sentence) >= _MIN_SENTENCE_CHARS:
+                sentences.append(sentence)
+    return sentences
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + "..."
+
+
+def extractive_summary(title: Optional[str], body: Optional[str], max_chars: Optional[int] = None) -> str:
+    """
+    抽取式摘要：
+    - 句子得分 = 句中词 (中文 bigram) 在全文中的平均词频 x (1 + 与标题重合的比例) x 位置权重 (越靠前越高)
+    - 按得分从高到低选句直到 max_chars，再按原文顺序拼接
+    """
+    max_chars = max_chars or settings.SUMMARY_MAX_CHARS
+    sentences = _sentences(body)
+    if not sentences:
+        return ""
+
+    tokens = [set(tokenize(s)) for s in sentences]
+    frequencies = Counter(t for terms in tokens for t in terms)
+    title_terms = set(tokenize(title or ""))
+
+    scores = []
+    for i, terms in enumerate(tokens):
+        if not terms:
+            scores.append(0.0)
+            continue
+        centrality = sum(frequencies[t] for t in terms) / len(terms)
+        overlap = len(terms & title_terms) / len(title_terms) if title_terms else 0.0
+        scores.append(centrality * (1 + overlap) / (1 + 0.1 * i))
+
+    chosen, used = [], 0
+    for i in sorted(range(len(sentences)), key=lambda i: -scores[i]):
+        if used and used + len(sentences[i]) > max_chars:
+            continue
+        chosen.append(i)
+        used += len(sentences[i])
+        if used >= max_chars:
+            break
+    summary = " ".join(sentences[i] for i in sorted(chosen))
+    return _truncate(summary, max_chars)
+
+
+async def summarize_doc(doc) -> bool:
+    """
+    写入路径调用 (doc_events)：内容指纹变化时重新计算抽取式摘要并保存，返回是否重新计算
+    doc 对象上的摘要字段会一并更新
+    """
+    if not doc.yuque_id or not doc.body:
+        return False
+    fingerprint = content_fingerprint(doc.title, doc.body)
+    if doc.summary_fingerprint == fingerprint:
+        return False
+
+    collection = Doc.get_pymongo_collection()
+    stored = await collection.find_one(
+        {"yuque_id": doc.yuque_id}, projection={"summary": 1, "summary_fingerprint": 1, "summary_source": 1}
+    )
+    if stored and stored.get("summary_fingerprint") == fingerprint:
+        # 写入方构造的 doc 对象不含摘要字段，数据库中已是最新
+        doc.summary = stored.get("summary")
+        doc.summary_fingerprint = fingerprint
+        doc.summary_source = stored.get("summary_source")
+        return False
+
+    summary = await asyncio.to_thread(extractive_summary, doc.title, doc.body)
+    await collection.update_one(
+        {"yuque_id": doc.yuque_id},
+        {"$set": {"summary": summary or None, "summary_fingerprint": fingerprint, "summary_source": "extractive"}}
+    )
+    doc.summary = summary or None
+    doc.summary_fingerprint = fingerprint
+    doc.summary_source = "extractive"
+    if settings.SUMMARY_LLM_ENABLED and summary:
+        get_abstract_queue().enqueue(doc.yuque_id, fingerprint)
+    return True
+
+
+class AbstractQueue:
+    """
+    LLM 摘要队列：单个后台 worker 逐篇生成，避免同步大量文档时并发打满模型配额
+    同一文档排队期间只保留最新的指纹；生成时内容已再次变化则丢弃结果
+    """
+    def __init__(self):
+        self._pending: Dict[int, str] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def enqueue(self, doc_id: int, fingerprint: str):
+        if self._worker is None or self._worker.done():
+            # 首次使用 (或事件循环已更换) 时创建 worker，未处理的文档重新排队
+            self._queue = asyncio.Queue()
+            for pending_id in self._pending:
+                self._queue.put_nowait(pending_id)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        if doc_id not in self._pending:
+            self._queue.put_nowait(doc_id)
+        self._pending[doc_id] = fingerprint
+
+    async def _run(self):
+        while True:
+            doc_id = await self._queue.get()
+            fingerprint = self._pending.pop(doc_id, None)
+            if fingerprint is None:
+                continue
+            try:
+                await self._generate(doc_id, fingerprint)
+            except Exception as e:
+                logger.error(f"Failed to generate LLM summary for doc {doc_id}: {e}")
+
+    async def _generate(self, doc_id: int, fingerprint: str):
+        collection = Doc.get_pymongo_collection()
+        raw = await collection.find_one(
+            {"yuque_id": doc_id, "summary_fingerprint": fingerprint}, projection={"title": 1, "plain_text": 1}
+        )
+        if not raw or not raw.get("plain_text"):
+            return # 文档已删除或内容已变化
+
+        from app.services.model_providers import create_chat_model
+        prompt = ChatPromptTemplate.from_template(
+            "请用中文为下面的文档写一段不超过 {max_chars} 字的摘要，只输出摘要本身。\n\n"
+            "标题：{title}\n\n正文：\n{text}"
+        )
+        chain = prompt | create_chat_model(temperature=0) | StrOutputParser()
+        abstract = await chain.ainvoke({
+            "max_chars": settings.SUMMARY_MAX_CHARS,
+            "title": raw.get("title") or "",
+            "text": raw["plain_text"][:settings.SUMMARY_LLM_INPUT_CHARS],
+        })
+        abstract = _truncate(abstract.strip(), settings.SUMMARY_MAX_CHARS)
+        if abstract:
+            await collection.update_one(
+                {"yuque_id": doc_id, "summary_fingerprint": fingerprint},
+                {"$set": {"summary": abstract, "summary_source": "llm"}}
+            )
+
+
+_abstract_queue: Optional[AbstractQueue] = None
+
+
+def get_abstract_queue() -> AbstractQueue:
+    global _abstract_queue
+    if _abstract_queue is None:
+        _abstract_queue = AbstractQueue()
+    return _abstract_queue
+
+
+async def backfill_summaries() -> int:
+    """为旧数据补齐摘要 (升级后首次启动时执行，之后为空操作)"""
+    collection = Doc.get_pymongo_collection()
+    query = {"summary_fingerprint": None, "yuque_id": {"$ne": None}, "body": {"$nin": [None, ""]}}
+    updated = 0
+    async for raw in collection.find(query, projection={"yuque_id": 1, "title": 1, "body": 1}):
+        fingerprint = content_fingerprint(raw.get("title"), raw["body"])
+        summary = await asyncio.to_thread(extractive_summary, raw.get("title"), raw["body"])
+        await collection.update_one(
+            {"_id": raw["_id"]},
+            {"$set": {"summary": summary or None, "summary_fingerprint": fingerprint, "summary_source": "extractive"}}
+        )
+        if settings.SUMMARY_LLM_ENABLED and summary:
+            get_abstract_queue().enqueue(raw["yuque_id"], fingerprint)
+        updated += 1
+    if updated:
+        logger.info(f"Backfilled summaries for {updated} docs")
+    return updated
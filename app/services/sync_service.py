@@ -7,6 +7,11 @@ from app.services.yuque_client import YuqueClient
 import math
 from app.models.schemas import User, Repo, Doc, Member, Activity
 from app.services.rag_service import RAGService
+from app.services import doc_events
+from app.services.keyword_index import save_keyword_index
+from app.services.text_utils import extract_plain_text
+from app.services.summarizer import SUMMARY_FIELDS
+from app.services.near_duplicates import text_simhash
 from app.core.security import get_password_hash
 
 logger = logging.getLogger(__name__)
@@ -36,11 +41,13 @@ class SyncService:
                 if doc.yuque_id:
                     await self.rag_service.delete_doc(doc.yuque_id)
                 await doc.delete()
+                await doc_events.doc_removed(doc)
             
             # 3. 删除 Repo 记录
             repo = await Repo.find_one(Repo.yuque_id == repo_id)
             if repo:
                 await repo.delete()
+                doc_events.repo_removed(repo_id)
                 logger.info(f"Cleanup: 知识库记录已删除 ({repo.name})")
             else:
                  logger.info(f"Cleanup: 知识库记录不存在 ({repo_id})")
@@ -84,6 +91,8 @@ class SyncService:
             for repo_data in repos_data:
                 await self.sync_repo(repo_data)
 
+            # 全量同步后保存关键词索引快照，加快下次启动
+            await save_keyword_index()
             logger.info("=== 全量同步完成 ===")
 
         except Exception as e:
@@ -167,6 +176,10 @@ class SyncService:
                         {"$set": member_data},
                         on_insert=Member(**member_data)
                     )
+                    doc_events.member_saved(Member(**member_data))
+                    if existing and existing.name != member_data["name"]:
+                        # 改名只需更新其文档向量 payload 中的作者名，无需重新向量化
+                        await self.rag_service.update_author_name(yuque_id, member_data["name"])
 
                 except Exception as e:
                     logger.error(f"处理成员数据出错: {e}, 数据: {item}")
@@ -218,6 +231,7 @@ class SyncService:
                         
                         # 2. 从 MongoDB 删除
                         await doc.delete()
+                        await doc_events.doc_removed(doc)
                         logger.info(f"已删除文档: {doc.title} (UUID: {doc.uuid})")
             else:
                 # 如果 TOC 为空，说明知识库被清空了，删除该库下所有文档
@@ -228,6 +242,7 @@ class SyncService:
                         if doc.yuque_id:
                             await self.rag_service.delete_doc(doc.yuque_id)
                         await doc.delete()
+                        await doc_events.doc_removed(doc)
 
             logger.info(f"  - 知识库 {repo.name} 同步完毕")
 
@@ -304,6 +319,7 @@ class SyncService:
                         
                         # 2. 从 MongoDB 删除
                         await doc.delete()
+                        await doc_events.doc_removed(doc)
                         logger.info(f"已删除文档: {doc.title} (UUID: {doc.uuid})")
             else:
                 # 如果 TOC 为空，说明知识库被清空了，删除该库下所有文档
@@ -314,7 +330,10 @@ class SyncService:
                         if doc.yuque_id:
                             await self.rag_service.delete_doc(doc.yuque_id)
                         await doc.delete()
+                        await doc_events.doc_removed(doc)
 
+            # 标题/结构可能已变化，使该库的搜索缓存失效
+            doc_events.repo_changed(repo_id)
             logger.info(f"知识库结构同步完成 (Repo ID: {repo_id})")
         except Exception as e:
             logger.error(f"同步知识库结构失败: {e}")
@@ -351,6 +370,13 @@ class SyncService:
                 else:
                     update_data["yuque_id"] = None
 
+                # 改名 / 跨库移动时只需更新向量 payload，先取出原来的标题、slug 与知识库
+                previous = None
+                if update_data["yuque_id"]:
+                    previous = await Doc.get_pymongo_collection().find_one(
+                        {"uuid": update_data['uuid']}, projection={"title": 1, "slug": 1, "repo_id": 1}
+                    )
+
                 # Upsert: 如果存在则更新结构，不存在则插入 (此时 body 为空)
                 doc_obj = Doc(**update_data)
                 
@@ -358,6 +384,9 @@ class SyncService:
                     {"$set": update_data},
                     on_insert=doc_obj
                 )
+                await doc_events.doc_outline_saved(doc_obj, previous)
+                if previous and any(previous.get(k) != update_data[k] for k in ("title", "slug", "repo_id")):
+                    await self.rag_service.update_doc_metadata(doc_obj, previous.get("repo_id"))
             except Exception as e:
                 logger.error(f"更新 TOC 结构失败 (uuid: {toc_item.get('uuid')}): {e}")
 
@@ -490,13 +519,19 @@ class SyncService:
             {"$set": repo.model_dump(exclude={"id"})},
             on_insert=repo
         )
+        doc_events.repo_saved(repo)
         return repo
 
     async def _upsert_doc(self, data: Dict) -> Optional[Doc]:
+        # 同步时计算一次纯文本，检索路径不再解析正文
+        data["plain_text"] = extract_plain_text(data.get("body")) or None
+        data["simhash"] = await asyncio.to_thread(text_simhash, data["plain_text"])
+
         # 使用 uuid 作为唯一键进行 upsert
         doc = Doc(**data)
         
-        update_data = doc.model_dump(exclude={"id"})
+        # 摘要字段由 doc_events 按内容指纹维护，不随 API 数据覆盖
+        update_data = doc.model_dump(exclude={"id"} | SUMMARY_FIELDS)
         # 如果 created_at 为 None，则从更新操作中移除，避免覆盖已有数据的创建时间
         if update_data.get("created_at") is None:
             update_data.pop("created_at", None)
@@ -505,7 +540,9 @@ class SyncService:
             {"$set": update_data},
             on_insert=doc
         )
-        return await Doc.find_one(Doc.uuid == doc.uuid)
+        saved = await Doc.find_one(Doc.uuid == doc.uuid)
+        await doc_events.doc_saved(saved)
+        return saved
 
     def _parse_time(self, time_str: Optional[str]) -> Optional[datetime]:
         if not time_str:
@@ -0,0 +1,80 @@
+import re
+import unicodedata
+from typing import List, Optional
+
+from bs4 import BeautifulSoup
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_INLINE_SPACES_RE = re.compile(r"[ \t\u00a0]+")
+_LINE_EDGE_RE = re.compile(r" ?\n ?")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+# 连续的中日韩字符 / 连续的字母数字
+_CJK_CHARS = r"\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_TOKEN_RE = re.compile(rf"[{_CJK_CHARS}]+|[a-z0-9_]+")
+_CJK_RE = re.compile(rf"[{_CJK_CHARS}]")
+
+
+def normalize_query(text: str) -> str:
+    """
+    查询归一化：全角转半角 (NFKC)、转小写、合并空白
+    用于缓存键，保证 "部署 " / "部署" / "ＡＰＩ" / "api" 命中同一条目
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text)
+    return _WHITESPACE_RE.sub(" ", text).strip().lower()
+
+
+def is_cjk(text: str) -> bool:
+    return bool(_CJK_RE.match(text))
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中文友好的分词 (无词典)：
+    - 中文按二元组 (bigram) 切分，单字成词时保留单字
+    - 英文/数字按连续字母数字切分并转小写
+    "部署流程 API" -> ["部署", "署流", "流程", "api"]
+    """
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for run in _TOKEN_RE.findall(text):
+        if is_cjk(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def html_to_text(body: Optional[str], separator: str = "\n") -> str:
+    """
+    将 Lake / HTML 正文转为纯文本 (Markdown 正文原样返回)
+    """
+    if not body:
+        return ""
+    try:
+        return BeautifulSoup(body, "html.parser").get_text(separator=separator)
+    except Exception:
+        return body
+
+
+def compact_whitespace(text: str) -> str:
+    """合并行内空白、去除行首尾空格，最多保留一个空行"""
+    text = _INLINE_SPACES_RE.sub(" ", text)
+    text = _LINE_EDGE_RE.sub("\n", text)
+    return _BLANK_LINES_RE.sub("\n\n", text).strip()
+
+
+def extract_plain_text(body: Optional[str]) -> str:
+    """
+    正文纯文本 (同步时计算一次并存入 Doc.plain_text)
+    按结构解析后渲染 (标题、段落、代码块、表格之间空一行，见 chunker.parse_blocks)，
+    检索摘要、关键词索引与向量切分共用这份文本，切片偏移也指向它
+    """
+    from app.services.chunker import render_blocks, parse_blocks
+    return render_blocks(parse_blocks(body))[0]
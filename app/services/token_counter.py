@@ -0,0 +1,63 @@
+import math
+import logging
+from functools import lru_cache
+from typing import Optional
+
+from app.core.config import settings
+from app.services.text_utils import _CJK_RE
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: str):
+    """
+    tiktoken 编码器 (按模型缓存)
+    首次使用需下载词表，离线环境加载失败时返回 None，退回估算
+    """
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken encoding for {model} unavailable, using estimate: {e}")
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算：中文约 1 字 1 token，其他字符约 4 个 1 token"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def count_tokens(text: Optional[str], model: Optional[str] = None) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding(model or settings.CHAT_MODEL)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: Optional[str], max_tokens: int, model: Optional[str] = None) -> str:
+    """截断到不超过 max_tokens 个 token"""
+    if not text or max_tokens <= 0:
+        return ""
+    encoding = _get_encoding(model or settings.CHAT_MODEL)
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # 二分查找满足预算的最长前缀
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
@@ -0,0 +1,288 @@
+"""
+搜索框输入联想 (typeahead)
+进程内前缀索引，覆盖文档标题、知识库名与成员名；中文标题同时支持全拼与首字母 (如 "bushu" / "bssc" -> "部署手册")
+- 启动时从 MongoDB 构建 (后台进行，不阻塞启动)，之后由 doc_events 在同步 / Webhook 写入时增量维护
+- 查询只在内存中二分查找，不访问 MongoDB
+注意: 只在事件循环线程中读写，不加锁
+"""
+import re
+import time
+import bisect
+import asyncio
+import logging
+import unicodedata
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError: # 未安装时不支持拼音匹配
+    lazy_pinyin = None
+
+from app.models.schemas import Doc, Member, Repo
+from app.services.text_utils import is_cjk
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_CJK_RUN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+
+# 匹配方式 (越小越靠前)：从开头匹配 / 从词 (中文为任意字) 开头匹配 / 全拼 / 首字母
+RANK_PREFIX, RANK_WORD, RANK_PINYIN, RANK_INITIALS = 0, 1, 2, 3
+
+EntryKey = Tuple[str, int] # (类型, ID)
+
+
+def normalize(text: Optional[str]) -> str:
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+class _Entry:
+    __slots__ = ("data", "repo_id", "weight", "name", "anchors")
+
+    def __init__(self, data: dict, repo_id: Optional[int], weight: int, name: str):
+        self.data = data # 返回给前端的字段
+        self.repo_id = repo_id
+        self.weight = weight
+        self.name = name # 归一化后的名称
+        self.anchors: List[tuple] = []
+
+
+class TypeaheadIndex:
+    """
+    前缀索引：每个名称生成若干 "锚点" (从开头、每个词 / 中文字、拼音音节处截取的后缀)，
+    锚点按首字符分桶后排序存放，查询时在桶内二分查找以查询为前缀的锚点
+    """
+    MAX_ANCHOR_LENGTH = 32 # 锚点截断长度 (更长的查询按截断后匹配)
+    MAX_SCAN = 2000 # 单次查询最多检查的锚点数，短查询命中过多时只在前面的锚点中排序
+
+    def __init__(self):
+        self.ready = False
+        self._entries: Dict[EntryKey, _Entry] = {}
+        self._buckets: Dict[str, List[tuple]] = {} # 首字符 -> [(锚点, 匹配方式, 条目)]
+        self._sorted = True
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _anchors(self, name: str) -> Dict[str, int]:
+        limit = self.MAX_ANCHOR_LENGTH
+        anchors = {name[:limit]: RANK_PREFIX}
+        for i in range(1, len(name)):
+            ch = name[i]
+            if ch == " ":
+                continue
+            # 中文每个字都可以作为起点；英文 / 数字从单词开头开始
+            if is_cjk(ch) or not name[i - 1].isalnum():
+                anchors.setdefault(name[i:i + limit], RANK_WORD)
+        if lazy_pinyin is not None:
+            for run in _CJK_RUN_RE.findall(name):
+                syllables = lazy_pinyin(run)
+                for j in range(len(syllables)):
+                    anchors.setdefault("".join(syllables[j:])[:limit], RANK_PINYIN)
+                    anchors.setdefault("".join(s[:1] for s in syllables[j:])[:limit], RANK_INITIALS)
+        return anchors
+
+    def add(self, kind: str, entry_id: int, name: str, data: dict,
+            repo_id: Optional[int] = None, weight: Optional[int] = None):
+        """新增或替换一个条目 (weight 为 None 时沿用已有条目的权重)"""
+        key = (kind, entry_id)
+        previous = self._entries.get(key)
+        if weight is None:
+            weight = previous.weight if previous else 0
+        self.remove(kind, entry_id)
+        normalized = normalize(name)
+        if not normalized:
+            return
+
+        entry = _Entry({"type": kind, "id": entry_id, "title": name, **data}, repo_id, weight, normalized)
+        for anchor, rank in self._anchors(normalized).items():
+            item = (anchor, rank, key)
+            bucket = self._buckets.setdefault(anchor[0], [])
+            if self._sorted:
+                bisect.insort(bucket, item)
+            else:
+                bucket.append(item)
+            entry.anchors.append(item)
+        self._entries[key] = entry
+
+    def remove(self, kind: str, entry_id: int):
+        entry = self._entries.pop((kind, entry_id), None)
+        if not entry:
+            return
+        for item in entry.anchors:
+            bucket = self._buckets.get(item[0][0])
+            if not bucket:
+                continue
+            if not self._sorted:
+                bucket.remove(item)
+                continue
+            i = bisect.bisect_left(bucket, item)
+            if i < len(bucket) and bucket[i] == item:
+                del bucket[i]
+
+    def begin_bulk(self):
+        """批量构建：先追加、最后统一排序"""
+        self._sorted = False
+
+    def end_bulk(self):
+        for bucket in self._buckets.values():
+            bucket.sort()
+        self._sorted = True
+
+    def repo_name(self, repo_id: Optional[int]) -> Optional[str]:
+        entry = self._entries.get(("repo", repo_id))
+        return entry.data["title"] if entry else None
+
+    def suggest(self, query: str, limit: int = 10, types: Optional[Set[str]] = None,
+                repo_id: Optional[int] = None) -> List[dict]:
+        """
+        返回匹配的条目，排序：名称完全相同 > 匹配方式 > 权重 (阅读量等) > 名称长度
+        repo_id 只筛选文档 (及该知识库本身)
+        """
+        q = normalize(query)[:self.MAX_ANCHOR_LENGTH]
+        bucket = self._buckets.get(q[:1]) if q else None
+        if not bucket:
+            return []
+
+        best: Dict[EntryKey, int] = {}
+        i = bisect.bisect_left(bucket, (q,))
+        end = min(len(bucket), i + self.MAX_SCAN)
+        while i < end:
+            anchor, rank, key = bucket[i]
+            if not anchor.startswith(q):
+                break
+            if (types is None or key[0] in types) and rank < best.get(key, RANK_INITIALS + 1):
+                if repo_id is None or key[0] == "member" or self._entries[key].repo_id == repo_id:
+                    best[key] = rank
+            i += 1
+
+        entries = self._entries
+        ranked = sorted(best, key=lambda k: (
+            entries[k].name != q, best[k], -entries[k].weight, len(entries[k].name)
+        ))
+        results = []
+        for key in ranked[:limit]:
+            item = dict(entries[key].data)
+            if key[0] == "doc":
+                item["repo_name"] = self.repo_name(item.get("repo_id"))
+            results.append(item)
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "entries": len(self._entries),
+            "anchors": sum(len(b) for b in self._buckets.values()),
+            "pinyin": lazy_pinyin is not None,
+        }
+
+    # --- 各类条目 ---
+
+    def add_doc(self, doc, keep_weight: bool = False):
+        if not doc.yuque_id or doc.type == "TITLE":
+            return
+        self.add(
+            "doc", doc.yuque_id, doc.title,
+            {"slug": doc.slug, "repo_id": doc.repo_id},
+            repo_id=doc.repo_id, weight=None if keep_weight else doc.read_count,
+        )
+
+    def add_repo(self, repo):
+        self.add(
+            "repo", repo.yuque_id, repo.name,
+            {"slug": repo.slug, "namespace": repo.namespace},
+            repo_id=repo.yuque_id, weight=repo.items_count,
+        )
+
+    def add_member(self, member):
+        if not member.is_active:
+            self.remove("member", member.yuque_id)
+            return
+        self.add(
+            "member", member.yuque_id, member.name,
+            {"login": member.login, "avatar_url": member.avatar_url},
+        )
+
+
+_typeahead_index: Optional[TypeaheadIndex] = None
+# 重建期间的写入操作，重建完成后在新索引上重放 (None 表示当前没有在重建)
+_pending: Optional[List[Callable[[TypeaheadIndex], None]]] = None
+
+
+def get_typeahead_index() -> TypeaheadIndex:
+    global _typeahead_index
+    if _typeahead_index is None:
+        _typeahead_index = TypeaheadIndex()
+    return _typeahead_index
+
+
+def _apply(op: Callable[[TypeaheadIndex], None]):
+    if _pending is not None:
+        _pending.append(op)
+    try:
+        op(get_typeahead_index())
+    except Exception as e:
+        logger.error(f"Failed to update typeahead index: {e}")
+
+
+def index_doc(doc, keep_weight: bool = False):
+    _apply(lambda index: index.add_doc(doc, keep_weight=keep_weight))
+
+
+def unindex_doc(doc_id: Optional[int]):
+    if doc_id:
+        _apply(lambda index: index.remove("doc", doc_id))
+
+
+def index_repo(repo):
+    _apply(lambda index: index.add_repo(repo))
+
+
+def unindex_repo(repo_id: int):
+    _apply(lambda index: index.remove("repo", repo_id))
+
+
+def index_member(member):
+    _apply(lambda index: index.add_member(member))
+
+
+async def rebuild_typeahead_index() -> TypeaheadIndex:
+    """从 MongoDB 全量构建，完成后原子替换当前索引"""
+    global _typeahead_index, _pending
+    started = time.perf_counter()
+    _pending = []
+    index = TypeaheadIndex()
+    index.begin_bulk()
+    try:
+        for repo in await Repo.find_all().to_list():
+            index.add_repo(repo)
+        for member in await Member.find_all().to_list():
+            index.add_member(member)
+
+        projection = {"yuque_id": 1, "type": 1, "title": 1, "slug": 1, "repo_id": 1, "read_count": 1}
+        cursor = Doc.get_pymongo_collection().find({"yuque_id": {"$ne": None}}, projection=projection)
+        async for raw in cursor:
+            if raw.get("type") == "TITLE":
+                continue
+            index.add(
+                "doc", raw["yuque_id"], raw.get("title") or "",
+                {"slug": raw.get("slug"), "repo_id": raw.get("repo_id")},
+                repo_id=raw.get("repo_id"), weight=raw.get("read_count") or 0,
+            )
+            if len(index) % 200 == 0:
+                # 生成拼音是 CPU 操作，定期让出事件循环
+                await asyncio.sleep(0)
+        index.end_bulk()
+
+        # 重放构建期间的写入；从这里到替换之间没有 await，不会丢失写入
+        for op in _pending:
+            op(index)
+        index.ready = True
+        _typeahead_index = index
+    finally:
+        _pending = None
+    logger.info(f"Typeahead index built: {len(index)} entries in {time.perf_counter() - started:.2f}s")
+    return index
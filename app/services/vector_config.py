@@ -0,0 +1,145 @@
+import logging
+from datetime import datetime
+from typing import List, Optional
+
+from qdrant_client import QdrantClient, models
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 各 Embedding 模型的默认维度
+MODEL_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+# EMBEDDING_PROVIDER=fake 的默认维度
+FAKE_EMBEDDING_DIMENSIONS = 256
+
+QUANTIZATION_KINDS = ("", "scalar", "binary")
+
+
+def embedding_dimensions() -> int:
+    """实际使用的向量维度 (EMBEDDING_DIMENSIONS 优先，否则为模型默认维度)"""
+    if settings.EMBEDDING_DIMENSIONS:
+        return settings.EMBEDDING_DIMENSIONS
+    if settings.EMBEDDING_PROVIDER == "fake":
+        return FAKE_EMBEDDING_DIMENSIONS
+    return MODEL_DIMENSIONS.get(settings.EMBEDDING_MODEL, 1536)
+
+
+def quantization_config(kind: Optional[str] = None) -> Optional[models.QuantizationConfig]:
+    """
+    量化配置 (量化向量常驻内存，用于 HNSW 遍历)
+    - scalar: float32 -> int8，约 1/4 内存，召回损失很小
+    - binary: 每维 1 bit，约 1/32 内存，维度越高效果越好，需配合重打分
+    """
+    kind = settings.QDRANT_QUANTIZATION if kind is None else kind
+    if kind == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if kind == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    if kind:
+        raise ValueError(f"Unknown QDRANT_QUANTIZATION: {kind} (expected one of {QUANTIZATION_KINDS})")
+    return None
+
+
+def dense_vector_params(size: Optional[int] = None, on_disk: Optional[bool] = None) -> models.VectorParams:
+    return models.VectorParams(
+        size=size or embedding_dimensions(),
+        distance=models.Distance.COSINE,
+        # 原始向量放磁盘 (mmap)，内存中只保留量化向量与索引
+        on_disk=settings.QDRANT_VECTORS_ON_DISK if on_disk is None else on_disk,
+    )
+
+
+def hnsw_config() -> Optional[models.HnswConfigDiff]:
+    if settings.QDRANT_HNSW_ON_DISK:
+        return models.HnswConfigDiff(on_disk=True)
+    return None
+
+
+def search_params(kind: Optional[str] = None, oversampling: Optional[float] = None) -> Optional[models.SearchParams]:
+    """开启量化时的查询参数：先用量化向量多取 oversampling 倍候选，再用原始向量重打分"""
+    kind = settings.QDRANT_QUANTIZATION if kind is None else kind
+    if not kind:
+        return None
+    return models.SearchParams(
+        quantization=models.QuantizationSearchParams(
+            rescore=settings.QDRANT_QUANTIZATION_RESCORE,
+            oversampling=settings.QDRANT_QUANTIZATION_OVERSAMPLING if oversampling is None else oversampling,
+        )
+    )
+
+
+def sync_collection_config(client: QdrantClient, collection_name: str, vector_name: Optional[str] = None) -> bool:
+    """
+    迁移：将已有集合的量化 / 磁盘存储 / HNSW 配置对齐到当前设置 (Qdrant 原地更新，后台重建)
+    维度无法原地修改，不一致时返回 False，需重建到新集合 (见 reindex.py)
+    """
+    info = client.get_collection(collection_name)
+    vectors = info.config.params.vectors
+    current = vectors.get(vector_name) if isinstance(vectors, dict) else vectors
+    if current is None:
+        return True
+
+    expected_size = embedding_dimensions()
+    if current.size != expected_size:
+        logger.error(
+            f"Collection '{collection_name}' stores {current.size}-dim vectors but embeddings are "
+            f"{expected_size}-dim. Rebuild it with POST /ai/reindex to re-embed into a new collection."
+        )
+        return False
+
+    update = {}
+    wanted_quantization = quantization_config()
+    current_quantization = info.config.quantization_config
+    if type(wanted_quantization) is not type(current_quantization):
+        update["quantization_config"] = wanted_quantization or models.Disabled.DISABLED
+
+    if bool(current.on_disk) != settings.QDRANT_VECTORS_ON_DISK:
+        diff = models.VectorParamsDiff(on_disk=settings.QDRANT_VECTORS_ON_DISK)
+        update["vectors_config"] = {vector_name or "": diff}
+
+    if bool(info.config.hnsw_config.on_disk) != settings.QDRANT_HNSW_ON_DISK:
+        update["hnsw_config"] = models.HnswConfigDiff(on_disk=settings.QDRANT_HNSW_ON_DISK)
+
+    if update:
+        logger.info(f"Updating collection '{collection_name}' storage config: {sorted(update)}")
+        client.update_collection(collection_name=collection_name, **update)
+    return True
+
+
+# --- 版本化集合与别名 (蓝绿重建，见 reindex.py) ---
+
+def versioned_collection_name(alias: str) -> str:
+    """别名背后的实体集合名，如 yuque_docs_v20240101120000"""
+    return f"{alias}_v{datetime.now():%Y%m%d%H%M%S}"
+
+
+def list_versioned_collections(client: QdrantClient, alias: str) -> List[str]:
+    prefix = f"{alias}_v"
+    return sorted(c.name for c in client.get_collections().collections if c.name.startswith(prefix))
+
+
+def resolve_alias(client: QdrantClient, alias: str) -> Optional[str]:
+    """别名当前指向的集合；不是别名 (不存在或是同名的实体集合) 时返回 None"""
+    for description in client.get_aliases().aliases:
+        if description.alias_name == alias:
+            return description.collection_name
+    return None
+
+
+def point_alias(client: QdrantClient, alias: str, collection_name: str):
+    """将别名原子地切换到 collection_name (删除旧指向与创建新指向在同一次请求中完成)"""
+    operations = []
+    if resolve_alias(client, alias):
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+    operations.append(models.CreateAliasOperation(
+        create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias)
+    ))
+    client.update_collection_aliases(change_aliases_operations=operations)
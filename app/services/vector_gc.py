@@ -0,0 +1,165 @@
+"""
+孤儿向量回收
+文档删除是逐篇进行的，向量删除失败只记日志，Qdrant 中会残留 MongoDB 已不存在的文档的向量：
+占用内存，并且会出现在检索结果里。这里定期对账：
+1. 分页滚动当前集合 (只取 payload 中的 doc_id，不取向量)
+2. 每页按 doc_id 批量查询 MongoDB，不存在的文档即为孤儿，按点 ID 批量删除 (同时清理 doc_chunks)
+3. 反向统计 MongoDB 中有正文却没有向量的文档数，作为漂移指标 (不自动补写，避免意外的 Embedding 开销)
+"""
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set
+
+from qdrant_client import models
+
+from app.core.config import settings
+from app.models.schemas import Doc, DocChunk
+from app.services import reindex
+from app.services.answer_cache import get_answer_cache
+from app.services.search_cache import get_search_cache
+
+logger = logging.getLogger(__name__)
+
+# 报告中列出的样例 doc_id 数量
+SAMPLE_SIZE = 20
+
+_last_report: Optional[dict] = None
+_running = False
+
+
+def get_gc_report() -> Optional[dict]:
+    return _last_report
+
+
+def is_running() -> bool:
+    return _running
+
+
+class OrphanVectorCollector:
+    def __init__(self, rag, page_size: Optional[int] = None, dry_run: bool = False):
+        self.rag = rag
+        self.page_size = page_size or settings.VECTOR_GC_PAGE_SIZE
+        self.dry_run = dry_run
+        self._orphans: Set[int] = set()
+
+    async def run(self) -> dict:
+        global _last_report, _running
+        if _running:
+            raise RuntimeError("Vector GC is already running")
+        if reindex.is_running():
+            # 重建期间别名会切换，且新集合正在写入
+            raise RuntimeError("A reindex is running, skip vector GC")
+
+        _running = True
+        started = time.time()
+        report = {
+            "status": "running",
+            "dry_run": self.dry_run,
+            "collection": self.rag.collection_name,
+            "scanned_points": 0,
+            "scanned_docs": 0,
+            "orphan_docs": 0,
+            "orphan_points": 0,
+            "deleted_points": 0,
+            "unlabeled_points": 0, # payload 中没有 doc_id 的点 (只统计不删除)
+            "missing_docs": 0, # MongoDB 中有正文但没有向量的文档
+            "orphan_sample": [],
+            "missing_sample": [],
+            "started_at": started,
+            "elapsed_seconds": 0.0,
+            "error": None,
+        }
+        _last_report = report
+        try:
+            seen = await self._sweep(report)
+            await self._count_missing(seen, report)
+            if report["deleted_points"]:
+                # 检索结果可能包含已删除的点
+                get_search_cache().clear()
+                get_answer_cache().clear()
+            report["status"] = "done"
+            logger.info(
+                f"Vector GC: scanned {report['scanned_points']} points / {report['scanned_docs']} docs, "
+                f"{report['orphan_docs']} orphan docs ({report['orphan_points']} points, "
+                f"{report['deleted_points']} deleted), {report['missing_docs']} docs without vectors"
+            )
+        except Exception as e:
+            logger.error(f"Vector GC failed: {e}")
+            report["status"] = "failed"
+            report["error"] = str(e)
+            raise
+        finally:
+            report["elapsed_seconds"] = round(time.time() - started, 2)
+            _running = False
+        return report
+
+    async def _sweep(self, report: dict) -> Set[int]:
+        """滚动整个集合，返回出现过的 doc_id"""
+        client = self.rag.client
+        key = self.rag.vector_store.metadata_payload_key
+        seen: Set[int] = set()
+        offset = None
+        while True:
+            # 按点 ID 顺序翻页，删除已扫描过的点不影响后续分页
+            points, offset = await asyncio.to_thread(
+                client.scroll,
+                collection_name=self.rag.collection_name,
+                limit=self.page_size,
+                offset=offset,
+                with_payload=[f"{key}.doc_id"],
+                with_vectors=False,
+            )
+            by_doc: Dict[int, List] = {}
+            for point in points:
+                doc_id = ((point.payload or {}).get(key) or {}).get("doc_id")
+                if doc_id is None:
+                    report["unlabeled_points"] += 1
+                    continue
+                by_doc.setdefault(doc_id, []).append(point.id)
+            report["scanned_points"] += len(points)
+
+            if by_doc:
+                new_ids = set(by_doc) - seen
+                report["scanned_docs"] += len(new_ids)
+                seen.update(new_ids)
+                live = set(await Doc.get_pymongo_collection().distinct(
+                    "yuque_id", {"yuque_id": {"$in": list(by_doc)}}
+                ))
+                orphans = [doc_id for doc_id in by_doc if doc_id not in live]
+                if orphans:
+                    await self._delete_orphans(orphans, by_doc, report)
+            if offset is None:
+                break
+        return seen
+
+    async def _delete_orphans(self, orphans: List[int], by_doc: Dict[int, List], report: dict):
+        point_ids = [pid for doc_id in orphans for pid in by_doc[doc_id]]
+        report["orphan_points"] += len(point_ids)
+        # 同一文档的点可能跨页，只按新出现的文档计数
+        for doc_id in orphans:
+            if doc_id in self._orphans:
+                continue
+            self._orphans.add(doc_id)
+            report["orphan_docs"] += 1
+            if len(report["orphan_sample"]) < SAMPLE_SIZE:
+                report["orphan_sample"].append(doc_id)
+        if self.dry_run:
+            return
+        await asyncio.to_thread(
+            self.rag.client.delete,
+            collection_name=self.rag.collection_name,
+            points_selector=models.PointIdsList(points=point_ids),
+        )
+        await DocChunk.find({"doc_id": {"$in": orphans}}).delete()
+        report["deleted_points"] += len(point_ids)
+
+    async def _count_missing(self, seen: Set[int], report: dict):
+        cursor = Doc.get_pymongo_collection().find(
+            {"yuque_id": {"$ne": None}, "body": {"$nin": [None, ""]}}, projection={"yuque_id": 1}
+        )
+        async for raw in cursor:
+            if raw["yuque_id"] not in seen:
+                report["missing_docs"] += 1
+                if len(report["missing_sample"]) < SAMPLE_SIZE:
+                    report["missing_sample"].append(raw["yuque_id"])
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from datetime import datetime
 from app.models.schemas import WebhookPayload, Doc, Comment, Member, Repo
@@ -9,6 +10,10 @@ from typing import Optional
 from fastapi import BackgroundTasks
 
 from app.services.comment_service import CommentService
+from app.services import doc_events
+from app.services.text_utils import extract_plain_text
+from app.services.summarizer import SUMMARY_FIELDS
+from app.services.near_duplicates import text_simhash
 
 logger = logging.getLogger(__name__)
 
@@ -84,6 +89,7 @@ class WebhookService:
                         updated_at=datetime.utcnow()
                     )
                     author_member = await new_member.insert()
+                    doc_events.member_saved(author_member)
                     logger.info(f"Auto-synced new member from webhook actor: {data.actor.name} ({user_id})")
             except Exception as e:
                 logger.error(f"Failed to sync actor {user_id}: {e}")
@@ -123,6 +129,7 @@ class WebhookService:
                     "cover": detail.get('cover'),
                     "body": detail.get('body'),
                     "body_html": detail.get('body_html'),
+                    "plain_text": extract_plain_text(detail.get('body')) or None,
                     "format": detail.get('format'),
                     "word_count": detail.get('word_count', 0),
                     "likes_count": detail.get('likes_count', 0),
@@ -156,8 +163,9 @@ class WebhookService:
                 # 为了简单直接，我们在这里从 detail 构造并 upsert，
                 # 结构修正交给最后的 sync_repo_structure
 
+                doc_data["simhash"] = await asyncio.to_thread(text_simhash, doc_data["plain_text"])
                 doc_obj = Doc(**doc_data)
-                update_data = doc_obj.model_dump(exclude={"id"})
+                update_data = doc_obj.model_dump(exclude={"id"} | SUMMARY_FIELDS)
                 if update_data.get("created_at") is None:
                     update_data.pop("created_at", None)
 
@@ -165,6 +173,7 @@ class WebhookService:
                     {"$set": update_data},
                     on_insert=doc_obj
                 )
+                await doc_events.doc_saved(doc_obj)
                 logger.info(f"Doc full-synced from API: {doc_data['title']} ({doc_data['yuque_id']})")
                 
                 # 触发向量化
@@ -233,15 +242,19 @@ class WebhookService:
 
     async def _handle_doc_delete(self, data):
         """处理文档删除事件"""
-        result = await Doc.find_one(Doc.yuque_id == data.id).delete()
-        if result and result.deleted_count > 0:
+        doc = await Doc.find_one(Doc.yuque_id == data.id)
+        if doc:
+            await doc.delete()
+            await doc_events.doc_removed(doc)
             logger.info(f"Doc deleted: {data.id}")
         else:
             logger.info(f"Doc not found for deletion: {data.id}")
         
-        # 删除文档后，触发目录结构同步 (修复兄弟节点的 prev_uuid 等)
         sync_service = SyncService()
         try:
+            # 文档可能已被之前的结构同步删除，但向量仍可能残留，始终删除一次
+            await sync_service.rag_service.delete_doc(data.id)
+            # 删除文档后，触发目录结构同步 (修复兄弟节点的 prev_uuid 等)
             await sync_service.sync_repo_structure(data.book.id)
         finally:
             await sync_service.client.close()
@@ -0,0 +1,243 @@
+"""
+离线检索评测：召回质量 (recall@k / MRR / nDCG@k) 与分阶段延迟
+
+用法 (在项目根目录):
+    YUQUE_TOKEN=x python -m benchmarks.bench_retrieval [--k 5] [--mode client|native]
+        [--rrf-k 20 60 100] [--keyword-weight 1.0 1.5 2.0] [--candidate-multiplier 2 4] [--mmr-lambda 1.0 0.7]
+        [--save results.json] [--check baseline.json --tolerance 0.02]
+
+- 语料与标注查询见 benchmarks/fixtures/retrieval_*.jsonl (relevant 为 {yuque_id: 相关度 1/2})
+- MongoDB 使用 mongomock，Qdrant 使用本地内存模式，向量由确定性的哈希假向量生成，全程离线、结果可复现
+- 多个参数值时按网格逐一评测；--check 与保存的基线比较，质量指标下降超过 tolerance 时以非零状态退出
+- 延迟来自内存替身，只适合比较不同参数/实现的相对差异，不代表线上绝对值
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import itertools
+import statistics
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+from beanie import init_beanie
+from mongomock_motor import AsyncMongoMockClient
+from qdrant_client import QdrantClient
+
+from app.core.config import settings
+from app.models.schemas import Doc, DocChunk, DocSearchView, Member, User
+from app.services import rag_service
+from app.services.keyword_index import get_keyword_index, rebuild_keyword_index
+from app.services.model_providers import HashingEmbeddings
+from app.services.text_utils import extract_plain_text
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class StageTimer:
+    """记录各阶段耗时 (毫秒)"""
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def wrap_async(self, stage: str, fn):
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self.samples[stage].append((time.perf_counter() - started) * 1000)
+        return wrapper
+
+    def wrap_sync(self, stage: str, fn):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.samples[stage].append((time.perf_counter() - started) * 1000)
+        return wrapper
+
+    def reset(self):
+        self.samples.clear()
+
+
+def load_jsonl(name: str) -> List[dict]:
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# --- 指标 ---
+
+def recall_at_k(ranked: List[int], relevant: Dict[int, int], k: int) -> float:
+    if not relevant:
+        return 0.0
+    return len(set(ranked[:k]) & set(relevant)) / len(relevant)
+
+
+def reciprocal_rank(ranked: List[int], relevant: Dict[int, int]) -> float:
+    for i, doc_id in enumerate(ranked):
+        if relevant.get(doc_id, 0) > 0:
+            return 1.0 / (i + 1)
+    return 0.0
+
+
+def ndcg_at_k(ranked: List[int], relevant: Dict[int, int], k: int) -> float:
+    """分级相关度的 nDCG，增益为 2^rel - 1"""
+    dcg = sum((2 ** relevant.get(doc_id, 0) - 1) / np.log2(i + 2) for i, doc_id in enumerate(ranked[:k]))
+    ideal = sorted(relevant.values(), reverse=True)[:k]
+    idcg = sum((2 ** rel - 1) / np.log2(i + 2) for i, rel in enumerate(ideal))
+    return float(dcg / idcg) if idcg else 0.0
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+# --- 环境 ---
+
+async def build_service(mode: str, timer: StageTimer):
+    """装载语料：mongomock + BM25 索引 + 内存 Qdrant"""
+    mongo = AsyncMongoMockClient()
+    await init_beanie(database=mongo["retrieval_bench"], document_models=[Doc, DocChunk, Member, User])
+    for row in load_jsonl("retrieval_corpus.jsonl"):
+        await Doc(
+            uuid=f"doc-{row['yuque_id']}", yuque_id=row["yuque_id"], slug=f"doc-{row['yuque_id']}",
+            repo_id=row["repo_id"], title=row["title"], type="DOC", body=row["body"],
+            plain_text=extract_plain_text(row["body"]),
+        ).insert()
+    await rebuild_keyword_index()
+
+    embeddings = HashingEmbeddings()
+    settings.QDRANT_HYBRID_SEARCH = mode == "native"
+    settings.EMBEDDING_DIMENSIONS = embeddings.dim # 集合维度与假向量一致
+    rag = rag_service.RAGService(embeddings=embeddings, client=QdrantClient(":memory:"))
+    for doc in await Doc.find_all().to_list():
+        await rag.upsert_doc_to_vector_db(doc)
+
+    async def fetch_search_views(match: dict, limit=None):
+        # mongomock 不支持 $substrCP，用等价的 Python 截取代替
+        query = Doc.find(match).project(DocSearchView)
+        if limit:
+            query = query.limit(limit)
+        views = await query.to_list()
+        for view in views:
+            view.plain_text = (view.plain_text or "")[:rag_service.SNIPPET_SOURCE_CHARS]
+        return views
+
+    # 分阶段计时
+    index = get_keyword_index()
+    index.search = timer.wrap_sync("bm25", index.search)
+    rag._fetch_search_views = timer.wrap_async("keyword_fetch", fetch_search_views)
+    rag._retrieve = timer.wrap_async("vector", rag._retrieve)
+    return rag
+
+
+async def evaluate(rag, queries: List[dict], k: int, limit: int, timer: StageTimer) -> dict:
+    search = rag._native_hybrid_search if rag.hybrid_mode else rag._hybrid_search # 绕过结果缓存
+    for item in queries[:3]:
+        await search(item["query"], limit=limit) # 预热
+    timer.reset()
+
+    recalls, rrs, ndcgs, totals = [], [], [], []
+    for item in queries:
+        relevant = {int(doc_id): grade for doc_id, grade in item["relevant"].items()}
+        started = time.perf_counter()
+        results = await search(item["query"], limit=limit)
+        totals.append((time.perf_counter() - started) * 1000)
+        ranked = [int(r["slug"].split("-")[1]) for r in results]
+        recalls.append(recall_at_k(ranked, relevant, k))
+        rrs.append(reciprocal_rank(ranked, relevant))
+        ndcgs.append(ndcg_at_k(ranked, relevant, k))
+
+    stages = {"total": totals, **timer.samples}
+    return {
+        f"recall@{k}": statistics.mean(recalls),
+        "mrr": statistics.mean(rrs),
+        f"ndcg@{k}": statistics.mean(ndcgs),
+        "latency_ms": {
+            stage: {"p50": percentile(samples, 0.5), "p99": percentile(samples, 0.99)}
+            for stage, samples in stages.items()
+        },
+    }
+
+
+async def run(args) -> List[dict]:
+    timer = StageTimer()
+    rag = await build_service(args.mode, timer)
+    queries = load_jsonl("retrieval_queries.jsonl")
+
+    grid = list(itertools.product(args.rrf_k, args.keyword_weight, args.candidate_multiplier, args.mmr_lambda))
+    results = []
+    for rrf_k, keyword_weight, multiplier, mmr_lambda in grid:
+        settings.SEARCH_RRF_K = rrf_k
+        settings.SEARCH_KEYWORD_WEIGHT = keyword_weight
+        settings.SEARCH_CANDIDATE_MULTIPLIER = multiplier
+        settings.SEARCH_MMR_LAMBDA = mmr_lambda
+        metrics = await evaluate(rag, queries, args.k, args.limit, timer)
+        results.append({
+            "params": {"rrf_k": rrf_k, "keyword_weight": keyword_weight,
+                       "candidate_multiplier": multiplier, "mmr_lambda": mmr_lambda, "mode": args.mode},
+            **metrics,
+        })
+    return results
+
+
+def print_results(results: List[dict], k: int):
+    stages = ["total", "bm25", "keyword_fetch", "vector"]
+    header = f"{'rrf_k':>6}{'kw_w':>6}{'mult':>6}{'mmr':>6}{f'recall@{k}':>11}{'mrr':>7}{f'ndcg@{k}':>9}"
+    header += "".join(f"{stage + ' p50/p99':>24}" for stage in stages)
+    print(header)
+    for r in results:
+        p = r["params"]
+        line = f"{p['rrf_k']:>6}{p['keyword_weight']:>6}{p['candidate_multiplier']:>6}{p['mmr_lambda']:>6}"
+        line += f"{r[f'recall@{k}']:>11.3f}{r['mrr']:>7.3f}{r[f'ndcg@{k}']:>9.3f}"
+        for stage in stages:
+            lat = r["latency_ms"].get(stage, {"p50": 0.0, "p99": 0.0})
+            line += f"{lat['p50']:>15.2f}/{lat['p99']:<8.2f}"
+        print(line)
+
+
+def check_regression(results: List[dict], baseline_path: str, k: int, tolerance: float) -> bool:
+    """以网格中第一组参数与基线比较质量指标"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)[0]
+    ok = True
+    for metric in (f"recall@{k}", "mrr", f"ndcg@{k}"):
+        current, previous = results[0][metric], baseline[metric]
+        if current < previous - tolerance:
+            print(f"REGRESSION {metric}: {previous:.3f} -> {current:.3f}")
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=20, help="search 的 limit")
+    parser.add_argument("--mode", choices=["client", "native"], default="client",
+                        help="client: BM25 + 向量 RRF; native: Qdrant dense + sparse")
+    parser.add_argument("--rrf-k", type=int, nargs="+", default=[settings.SEARCH_RRF_K])
+    parser.add_argument("--keyword-weight", type=float, nargs="+", default=[settings.SEARCH_KEYWORD_WEIGHT])
+    parser.add_argument("--candidate-multiplier", type=int, nargs="+", default=[settings.SEARCH_CANDIDATE_MULTIPLIER])
+    parser.add_argument("--mmr-lambda", type=float, nargs="+", default=[settings.SEARCH_MMR_LAMBDA])
+    parser.add_argument("--save", default="", help="保存结果 (JSON)，可作为基线")
+    parser.add_argument("--check", default="", help="与基线比较")
+    parser.add_argument("--tolerance", type=float, default=0.02)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_results(results, args.k)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.check and not check_regression(results, args.check, args.k, args.tolerance):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+摘要高亮微基准：SnippetEngine vs 旧版 RAGService._highlight_text
+
+用法 (在项目根目录):
+    YUQUE_TOKEN=x python -m benchmarks.bench_snippet [--results 40] [--rounds 50]
+
+模拟一次搜索为 N 条结果生成摘要，旧实现每条结果都要整段 lower()、逐词 find 并逐词编译正则；
+新实现每个查询只编译一次，每段文本单次扫描
+"""
+import re
+import time
+import random
+import argparse
+import statistics
+
+from app.services.snippet import SnippetEngine, get_snippet_engine
+
+
+def legacy_highlight_text(text: str, query: str, window_size: int = 200) -> str:
+    """旧实现 (原样保留，用作基线)"""
+    if not text:
+        return ""
+    keywords = [k for k in query.split() if k.strip()]
+    if not keywords:
+        return text[:window_size] + "..."
+    lower_text = text.lower()
+    first_pos = -1
+    for k in keywords:
+        pos = lower_text.find(k.lower())
+        if pos != -1:
+            if first_pos == -1 or pos < first_pos:
+                first_pos = pos
+    if first_pos == -1:
+        start = 0
+    else:
+        start = max(0, first_pos - 20)
+    end = min(len(text), start + window_size)
+    snippet = text[start:end]
+    for k in keywords:
+        pattern = re.compile(re.escape(k), re.IGNORECASE)
+        snippet = pattern.sub(lambda m: f"<mark>{m.group(0)}</mark>", snippet)
+    if start > 0:
+        snippet = "..." + snippet
+    if end < len(text):
+        snippet = snippet + "..."
+    return snippet
+
+
+# 查询词，在正文中低频出现；其余为填充词
+KEYWORDS = ["部署", "流程", "周报", "模板", "Docker", "监控", "告警", "API", "权限", "回滚", "发布"]
+
+
+def make_corpus(n: int, length: int, seed: int = 42, keyword_rate: float = 0.02):
+    """生成接近真实文档的文本：大量填充词，查询词约占 2%"""
+    rng = random.Random(seed)
+    cjk = [chr(c) for c in range(0x4e00, 0x4e00 + 3000)]
+    latin = ["service", "config", "node", "cluster", "request", "version", "team", "update"]
+    filler = ["".join(rng.choice(cjk) for _ in range(rng.randint(2, 4))) for _ in range(2000)] + latin
+    docs = []
+    for _ in range(n):
+        words, size = [], 0
+        while size < length:
+            word = rng.choice(KEYWORDS) if rng.random() < keyword_rate else rng.choice(filler)
+            word += rng.choice(["，", "。", " ", "", "的"])
+            words.append(word)
+            size += len(word)
+        docs.append("".join(words)[:length])
+    return docs
+
+
+def bench(fn, rounds: int):
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--results", type=int, default=40, help="每次搜索的结果数")
+    parser.add_argument("--length", type=int, default=2000, help="每条结果的文本长度")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    texts = make_corpus(args.results, args.length)
+    queries = ["部署 流程", "Docker 监控 告警", "周报模板", "API 权限 回滚 发布"]
+
+    print(f"{'query':<22}{'legacy p50/p99 (ms)':>24}{'engine p50/p99 (ms)':>24}{'speedup':>10}{'marks/snippet':>16}")
+    for query in queries:
+        def run_legacy():
+            for text in texts:
+                legacy_highlight_text(text, query)
+
+        def run_engine():
+            # 与线上一致：每次搜索取一次 (缓存的) 引擎，所有结果复用
+            get_snippet_engine.cache_clear()
+            engine = get_snippet_engine(query)
+            for text in texts:
+                engine.snippet(text)
+
+        legacy = bench(run_legacy, args.rounds)
+        engine = bench(run_engine, args.rounds)
+        # 摘要质量：平均每条摘要的高亮数 (旧 / 新)
+        engine_instance = SnippetEngine(query)
+        legacy_marks = sum(legacy_highlight_text(t, query).count("<mark>") for t in texts) / len(texts)
+        engine_marks = sum(engine_instance.snippet(t).count("<mark>") for t in texts) / len(texts)
+        print(f"{query:<22}{legacy[0]:>12.3f}/{legacy[1]:<11.3f}{engine[0]:>12.3f}/{engine[1]:<11.3f}"
+              f"{legacy[0] / engine[0]:>9.2f}x{legacy_marks:>8.2f}/{engine_marks:<6.2f}")
+
+    # 中文无空格查询：旧实现无法高亮
+    sample = texts[0]
+    print("\nlegacy :", legacy_highlight_text(sample, "部署流程")[:120])
+    print("engine :", SnippetEngine("部署流程").snippet(sample)[:120])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+向量压缩基准：降维 / 标量量化 / 二值量化 / 原始向量落盘 对比全精度基线
+
+用法 (在项目根目录，需要可访问的 Qdrant；":memory:" 仅用于冒烟测试，本地模式不执行量化):
+    YUQUE_TOKEN=x python -m benchmarks.bench_vector_compression [--url http://localhost:6333]
+        [--source synthetic|mongo] [--docs 20000] [--queries 200] [--k 10] [--cache vectors.npz]
+
+- source=mongo: 读取 MongoDB 中文档的 plain_text，用 EMBEDDING_MODEL 以完整维度向量化 (标题作为查询)，
+  结果可用 --cache 保存复用。降维通过截断 + 归一化得到，与 text-embedding-3 的 dimensions 参数等价
+- source=synthetic: 聚类高斯向量，只适合比较量化；随机向量不具备 Matryoshka 性质，降维召回会明显偏低
+
+输出每种配置的向量内存估算、查询 p50/p99 延迟与 recall@k (以全精度全维度的精确 top-k 为基准)
+"""
+import os
+import time
+import argparse
+import statistics
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from app.core.config import settings
+from app.services.vector_config import MODEL_DIMENSIONS, dense_vector_params, quantization_config, search_params
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def synthetic_vectors(n_docs: int, n_queries: int, dim: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(n_docs // 200, 8), dim))
+    docs = centers[rng.integers(len(centers), size=n_docs)] + rng.normal(scale=0.6, size=(n_docs, dim))
+    queries = centers[rng.integers(len(centers), size=n_queries)] + rng.normal(scale=0.6, size=(n_queries, dim))
+    return normalize(docs), normalize(queries)
+
+
+def mongo_vectors(n_docs: int, n_queries: int):
+    import pymongo
+    from langchain_openai import OpenAIEmbeddings
+
+    collection = pymongo.MongoClient(settings.MONGO_URI)[settings.MONGO_DB_NAME]["docs"]
+    rows = list(collection.find({"plain_text": {"$nin": [None, ""]}}, {"title": 1, "plain_text": 1}).limit(n_docs))
+    embeddings = OpenAIEmbeddings(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL,
+                                  model=settings.EMBEDDING_MODEL)
+    docs = embeddings.embed_documents([f"# {r['title']}\n\n{r['plain_text'][:2000]}" for r in rows])
+    queries = embeddings.embed_documents([r["title"] for r in rows[:n_queries]])
+    return normalize(np.asarray(docs)), normalize(np.asarray(queries))
+
+
+def truncate(vectors: np.ndarray, dim: int) -> np.ndarray:
+    return normalize(vectors[:, :dim])
+
+
+def vector_ram_bytes(n: int, dim: int, quantization: str, on_disk: bool) -> int:
+    """向量常驻内存估算 (不含 HNSW 图与 payload)"""
+    original = 0 if on_disk else n * dim * 4
+    if quantization == "scalar":
+        return original + n * dim
+    if quantization == "binary":
+        return original + n * dim // 8
+    return original
+
+
+def wait_indexed(client: QdrantClient, name: str, timeout: float = 600):
+    started = time.time()
+    while time.time() - started < timeout:
+        if client.get_collection(name).status == models.CollectionStatus.GREEN:
+            return
+        time.sleep(0.5)
+
+
+def run_config(client, name, docs, queries, truth, k, dim, quantization, on_disk, oversampling):
+    collection = f"bench_{name}"
+    if client.collection_exists(collection):
+        client.delete_collection(collection)
+    client.create_collection(
+        collection_name=collection,
+        # 与线上建集合使用同一套配置 (app.services.vector_config)，只替换维度 / 量化方式 / 落盘
+        vectors_config=dense_vector_params(size=dim, on_disk=on_disk),
+        quantization_config=quantization_config(quantization),
+        # 小数据集也构建 HNSW，避免退化为全量扫描
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=10),
+    )
+    doc_vectors = truncate(docs, dim)
+    client.upload_collection(collection, vectors=doc_vectors, ids=list(range(len(doc_vectors))), batch_size=256)
+    wait_indexed(client, collection)
+
+    params = search_params(quantization, oversampling=oversampling)
+    query_vectors = truncate(queries, dim)
+    latencies, recalls = [], []
+    for i, vector in enumerate(query_vectors):
+        started = time.perf_counter()
+        points = client.query_points(collection, query=vector.tolist(), limit=k, search_params=params).points
+        latencies.append((time.perf_counter() - started) * 1000)
+        recalls.append(len({p.id for p in points} & truth[i]) / k)
+
+    client.delete_collection(collection)
+    latencies.sort()
+    return {
+        "ram_mb": vector_ram_bytes(len(doc_vectors), dim, quantization, on_disk) / 1024 / 1024,
+        "p50": statistics.median(latencies),
+        "p99": latencies[max(0, int(len(latencies) * 0.99) - 1)],
+        "recall": sum(recalls) / len(recalls),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=settings.QDRANT_URL)
+    parser.add_argument("--source", choices=["synthetic", "mongo"], default="synthetic")
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--reduced-dims", type=int, nargs="+", default=[512, 256])
+    parser.add_argument("--oversampling", type=float, default=2.0)
+    parser.add_argument("--cache", default="", help="向量缓存文件 (.npz)，避免重复调用 Embedding API")
+    args = parser.parse_args()
+
+    if args.cache and os.path.exists(args.cache):
+        data = np.load(args.cache)
+        docs, queries = data["docs"], data["queries"]
+    elif args.source == "mongo":
+        docs, queries = mongo_vectors(args.docs, args.queries)
+    else:
+        docs, queries = synthetic_vectors(args.docs, args.queries, MODEL_DIMENSIONS.get(settings.EMBEDDING_MODEL, 1536))
+    if args.cache and not os.path.exists(args.cache):
+        np.savez(args.cache, docs=docs, queries=queries)
+
+    full_dim = docs.shape[1]
+    # 基准：全精度、全维度的精确 top-k
+    exact = np.argsort(-(queries @ docs.T), axis=1)[:, :args.k]
+    truth = [set(row.tolist()) for row in exact]
+
+    configs = [("float32", full_dim, "", False)]
+    configs += [(f"float32_{d}d", d, "", False) for d in args.reduced_dims if d < full_dim]
+    configs += [
+        ("scalar", full_dim, "scalar", False),
+        ("scalar_on_disk", full_dim, "scalar", True),
+        ("binary_on_disk", full_dim, "binary", True),
+    ]
+    configs += [(f"scalar_{d}d_on_disk", d, "scalar", True) for d in args.reduced_dims if d < full_dim]
+
+    client = QdrantClient(location=args.url) if args.url == ":memory:" else QdrantClient(url=args.url)
+    print(f"{len(docs)} docs x {full_dim} dims, {len(queries)} queries, k={args.k}, source={args.source}")
+    print(f"{'config':<24}{'vector RAM (MB)':>16}{'p50 (ms)':>10}{'p99 (ms)':>10}{'recall@k':>10}")
+    for name, dim, quantization, on_disk in configs:
+        result = run_config(client, name, docs, queries, truth, args.k, dim, quantization, on_disk, args.oversampling)
+        print(f"{name:<24}{result['ram_mb']:>16.1f}{result['p50']:>10.2f}{result['p99']:>10.2f}{result['recall']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
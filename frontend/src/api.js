@@ -58,6 +58,38 @@ export const getDashboardRankings = (repoId = null) => api.get('/dashboard/ranki
 // AI Features
 export const searchDocs = (query) => api.post('/search', { query });
 export const askAI = (query) => api.post('/chat/rag', { query });
+
+// 流式问答：逐行解析 NDJSON 事件 (sources / token / done / error)，signal 用于中途取消
+export const askAIStream = async (query, onEvent, { sessionId = null, repoId = null, signal } = {}) => {
+  const token = localStorage.getItem('token');
+  const response = await fetch('/api/v1/chat/rag/stream', {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      ...(token ? { Authorization: `Bearer ${token}` } : {}),
+    },
+    body: JSON.stringify({ query, session_id: sessionId, repo_id: repoId }),
+    signal,
+  });
+  if (!response.ok) {
+    throw new Error(`Stream request failed: ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop();
+    for (const line of lines) {
+      if (line.trim()) onEvent(JSON.parse(line));
+    }
+  }
+  if (buffer.trim()) onEvent(JSON.parse(buffer));
+};
 export const explainDoc = (text) => api.post('/ai/explain', { text });
 
 // User Features (Public)
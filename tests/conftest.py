@@ -1,12 +1,41 @@
+import itertools
+
 import pytest
 from httpx import AsyncClient
+from qdrant_client import QdrantClient
 from mongomock_motor import AsyncMongoMockClient
 from beanie import init_beanie
-from app.models.schemas import User, Member, Doc, Repo, Comment, Activity, WebhookPayload
+from app.models.schemas import User, Member, Doc, DocChunk, RelatedDocs, Repo, Comment, Activity, WebhookPayload
 from app.core.config import settings
 from app.core.config import settings
+from app.services import rag_service, reindex
+from app.services.model_providers import HashingEmbeddings
 import os
 
+
+class CountingEmbeddings(HashingEmbeddings):
+    """记录 embedding 调用：documents 为向量化过的文档切片，queries 为每次查询向量调用的文本"""
+    def __init__(self, dim: int = 64):
+        super().__init__(dim=dim)
+        self.documents = []
+        self.queries = []
+
+    def embed_documents(self, texts):
+        self.documents.extend(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.queries.append([text])
+        return super().embed_query(text)
+
+    def embed_queries(self, texts):
+        self.queries.append(list(texts))
+        return super().embed_queries(texts)
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "rag_settings(**overrides): settings overrides for the rag fixture")
+
 @pytest.fixture
 def anyio_backend():
     return 'asyncio'
@@ -25,7 +54,7 @@ async def mock_db():
     await init_beanie(
         database=db,
         document_models=[
-            User, Member, Doc, Repo, Comment, Activity
+            User, Member, Doc, DocChunk, RelatedDocs, Repo, Comment, Activity
         ]
     )
     return db
@@ -35,6 +64,24 @@ async def client(mock_db):
     async with AsyncClient(app=app, base_url="http://test") as ac:
         yield ac
 
+@pytest.fixture
+def rag(request, monkeypatch):
+    """
+    内存 Qdrant + 64 维哈希向量 (CountingEmbeddings) 的 RAGService
+    其他 settings 覆盖项用 @pytest.mark.rag_settings(CHUNK_SIZE=60) 指定 (可放在模块级 pytestmark)
+    """
+    # 版本号默认精确到秒，测试中改为递增序号
+    versions = itertools.count(1)
+    versioned = lambda alias: f"{alias}_v{next(versions):04d}"
+    monkeypatch.setattr(rag_service, "versioned_collection_name", versioned)
+    monkeypatch.setattr(reindex, "versioned_collection_name", versioned)
+    overrides = {"EMBEDDING_DIMENSIONS": 64, "QDRANT_HYBRID_SEARCH": False, "QDRANT_COLLECTION_NAME": "test_docs"}
+    for marker in reversed(list(request.node.iter_markers("rag_settings"))):
+        overrides.update(marker.kwargs)
+    for name, value in overrides.items():
+        monkeypatch.setattr(settings, name, value)
+    return rag_service.RAGService(embeddings=CountingEmbeddings(dim=64), client=QdrantClient(":memory:"))
+
 @pytest.fixture
 def mock_env(monkeypatch):
     monkeypatch.setenv("YUQUE_TOKEN", "test_token")
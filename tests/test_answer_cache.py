@@ -0,0 +1,90 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.models.schemas import DocContextView
+from app.services.answer_cache import AnswerCache, AnswerKey, docs_fingerprint
+
+
+def view(doc_id: int, day: int = 1) -> DocContextView:
+    return DocContextView(yuque_id=doc_id, slug=f"doc-{doc_id}", title="t", updated_at=datetime(2024, 1, day))
+
+
+def chat_key(question: str, vector=None, docs=(view(1), view(2))) -> AnswerKey:
+    return AnswerKey("chat", question, repo_id=1, fingerprint=docs_fingerprint(docs),
+                     vector=vector, doc_ids=[d.yuque_id for d in docs])
+
+
+def test_exact_hit_requires_same_normalized_question_and_docs():
+    cache = AnswerCache(max_size=10)
+    cache.put(chat_key("如何 部署"), "用 Docker")
+    assert cache.get(chat_key("如何  部署 ")) == "用 Docker"
+    # 引用文档被编辑过 (更新时间变化)，指纹不同
+    assert cache.get(chat_key("如何 部署", docs=(view(1), view(2, day=2)))) is None
+
+
+def test_semantic_hit_within_same_context():
+    cache = AnswerCache(max_size=10, similarity=0.9)
+    cache.put(chat_key("如何部署服务", vector=[1.0, 0.0]), "用 Docker")
+
+    assert cache.get(chat_key("服务怎么部署", vector=[0.95, 0.05])) == "用 Docker"
+    assert cache.get(chat_key("报销流程", vector=[0.0, 1.0])) is None
+    assert cache.get(chat_key("服务怎么部署", vector=[0.95, 0.05], docs=(view(3),))) is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_doc_change_invalidates_citing_answers():
+    cache = AnswerCache(max_size=10)
+    cache.put(chat_key("a"), "A")
+    cache.put(chat_key("b", docs=(view(3),)), "B")
+
+    cache.invalidate_doc(2)
+
+    assert cache.get(chat_key("a")) is None
+    assert cache.get(chat_key("b", docs=(view(3),))) == "B"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_requests_are_coalesced():
+    cache = AnswerCache(max_size=10)
+    calls = 0
+
+    async def generate():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "答案"
+
+    answers = await asyncio.gather(*(cache.get_or_generate(chat_key("q"), generate) for _ in range(5)))
+    assert answers == ["答案"] * 5
+    assert calls == 1
+    assert cache.stats()["coalesced"] == 4
+
+
+@pytest.mark.asyncio
+async def test_waiters_regenerate_when_leader_fails():
+    cache = AnswerCache(max_size=10)
+    attempts = []
+
+    async def generate():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        if len(attempts) == 1:
+            raise RuntimeError("LLM down")
+        return "答案"
+
+    results = await asyncio.gather(cache.get_or_generate(chat_key("q"), generate),
+                                   cache.get_or_generate(chat_key("q"), generate), return_exceptions=True)
+    assert isinstance(results[0], RuntimeError)
+    assert results[1] == "答案"
+    assert cache.get(chat_key("q")) == "答案"
+
+
+def test_explain_keys_keep_case_and_indentation():
+    cache = AnswerCache(max_size=10)
+    code = "def foo():\n    return Foo()\n"
+    cache.put(AnswerKey("explain", code), "解释")
+    assert cache.get(AnswerKey("explain", code.rstrip() + "  \n")) == "解释"
+    assert cache.get(AnswerKey("explain", code.replace("Foo", "foo"))) is None
+    assert cache.get(AnswerKey("explain", code.replace("    ", "  "))) is None
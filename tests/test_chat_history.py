@@ -0,0 +1,94 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from beanie import init_beanie
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
+
+from app.models.schemas import ChatMessage, ChatSession
+from app.services.chat_history import ChatHistoryManager
+from app.services.rag_service import RAGService
+
+
+@pytest.fixture
+async def chat_db(mock_db):
+    await init_beanie(database=mock_db, document_models=[ChatSession, ChatMessage])
+    return mock_db
+
+
+async def make_session(turns: int) -> str:
+    session = ChatSession(title="部署")
+    await session.insert()
+    session_id = str(session.id)
+    start = datetime(2024, 1, 1)
+    for i in range(turns):
+        await ChatMessage(session_id=session_id, role="user", content=f"问题{i}",
+                          created_at=start + timedelta(minutes=2 * i)).insert()
+        await ChatMessage(session_id=session_id, role="ai", content=f"回答{i}",
+                          created_at=start + timedelta(minutes=2 * i + 1)).insert()
+    return session_id
+
+
+@pytest.mark.asyncio
+async def test_load_keeps_only_recent_turns(chat_db):
+    session_id = await make_session(10)
+    manager = ChatHistoryManager(llm=None, max_turns=2, token_budget=1000)
+
+    history = await manager.load(session_id)
+    assert [m.content for m in history] == ["问题8", "回答8", "问题9", "回答9"]
+    assert isinstance(history[0], HumanMessage) and isinstance(history[-1], AIMessage)
+
+
+@pytest.mark.asyncio
+async def test_load_respects_token_budget(chat_db):
+    session_id = await make_session(3)
+    manager = ChatHistoryManager(llm=None, max_turns=3, token_budget=5)
+
+    history = await manager.load(session_id)
+    # "问题2" / "回答2" 各约 3 个 token，预算内只能放下最新的一条
+    assert [m.content for m in history] == ["回答2"]
+
+
+@pytest.mark.asyncio
+async def test_compact_folds_old_turns_into_summary(chat_db):
+    session_id = await make_session(5)
+    prompts = []
+
+    def fake_llm(prompt):
+        prompts.append(prompt.to_string())
+        return "用户在问部署相关问题"
+
+    manager = ChatHistoryManager(llm=RunnableLambda(fake_llm), max_turns=2, token_budget=1000)
+    await manager.compact(session_id)
+
+    session = await ChatSession.get(session_id)
+    assert session.summary == "用户在问部署相关问题"
+    assert "问题0" in prompts[0] and "回答2" in prompts[0] and "问题3" not in prompts[0]
+
+    history = await manager.load(session_id)
+    assert isinstance(history[0], SystemMessage)
+    assert "用户在问部署相关问题" in history[0].content
+    assert [m.content for m in history[1:]] == ["问题3", "回答3", "问题4", "回答4"]
+
+    # 没有新的溢出时不再调用 LLM
+    await manager.compact(session_id)
+    assert len(prompts) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.rag_settings(CHAT_HISTORY_MAX_TURNS=2)
+async def test_concurrent_requests_compact_session_once(chat_db, rag):
+    session_id = await make_session(5)
+    calls = []
+
+    async def slow_llm(prompt):
+        calls.append(prompt)
+        await asyncio.sleep(0.05)
+        return "用户在问部署相关问题"
+
+    # 每个请求各自新建 RAGService (及其 ChatHistoryManager)
+    services = [RAGService(embeddings=rag.embeddings, llm=RunnableLambda(slow_llm), client=rag.client) for _ in range(2)]
+    await asyncio.gather(*(s.history.compact(session_id) for s in services))
+    assert len(calls) == 1
+    assert (await ChatSession.get(session_id)).summary == "用户在问部署相关问题"
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+from beanie import init_beanie
+
+from app.models.schemas import ChatMessage, ChatSession
+from app.services.answer_cache import AnswerKey, get_answer_cache
+from app.services.chat_history import ChatHistoryManager
+from app.services.rag_service import RAGService, _background_tasks
+
+
+class FakeChain:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def astream(self, inputs):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def make_rag(chunks, answer_key=None):
+    # 不连接 Qdrant / OpenAI，只替换检索准备与生成链
+    rag = RAGService.__new__(RAGService)
+
+    async def prepare(query, repo_id=None, session_id=None):
+        return {
+            "session_id": session_id or "s1",
+            "sources": [{"title": "部署文档", "slug": "deploy"}],
+            "answer_key": answer_key,
+            "inputs": {"context": "", "chat_history": [], "input": query},
+        }
+
+    rag._prepare_chat = prepare
+    rag._qa_chain = lambda: FakeChain(chunks)
+    rag.history = ChatHistoryManager(llm=None)
+    return rag
+
+
+@pytest.fixture
+async def chat_db(mock_db):
+    await init_beanie(database=mock_db, document_models=[ChatSession, ChatMessage])
+    return mock_db
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_emits_sources_then_tokens(chat_db):
+    rag = make_rag(["使用 ", "Docker ", "部署"])
+    events = [event async for event in rag.chat_stream("如何部署")]
+
+    assert events[0]["type"] == "sources"
+    assert events[0]["sources"][0]["slug"] == "deploy"
+    assert [e["content"] for e in events if e["type"] == "token"] == ["使用 ", "Docker ", "部署"]
+    assert events[-1] == {"type": "done", "session_id": "s1"}
+
+    messages = await ChatMessage.find(ChatMessage.session_id == "s1").sort("+created_at").to_list()
+    assert [(m.role, m.content) for m in messages] == [("user", "如何部署"), ("ai", "使用 Docker 部署")]
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_reports_prepare_failure(chat_db):
+    rag = make_rag(["不会生成"])
+
+    async def failing_prepare(query, repo_id=None, session_id=None):
+        raise RuntimeError("qdrant unavailable")
+
+    rag._prepare_chat = failing_prepare
+    events = [event async for event in rag.chat_stream("如何部署", session_id="s5")]
+    assert events == [{"type": "error", "message": "检索上下文失败"}]
+    assert await ChatMessage.find(ChatMessage.session_id == "s5").count() == 0
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_saves_partial_answer_on_disconnect(chat_db):
+    rag = make_rag(["第一段", "第二段", "第三段"])
+    stream = rag.chat_stream("如何部署", session_id="s2")
+    await stream.__anext__()  # sources
+    await stream.__anext__()  # 第一段
+    await stream.aclose()     # 客户端断开
+    await asyncio.gather(*_background_tasks)
+
+    messages = await ChatMessage.find(ChatMessage.session_id == "s2", ChatMessage.role == "ai").to_list()
+    assert len(messages) == 1
+    assert messages[0].content.startswith("第一段")
+    assert "未完成" in messages[0].content
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_fills_and_reuses_answer_cache(chat_db):
+    key = AnswerKey("chat", "缓存测试问题", fingerprint="fp", doc_ids=[1])
+    first = [e async for e in make_rag(["使用 ", "Docker"], answer_key=key).chat_stream("缓存测试问题", session_id="s3")]
+    assert get_answer_cache().get(key) == "使用 Docker"
+
+    # 再次提问不调用生成链，整段回答一次产出
+    second = [e async for e in make_rag([], answer_key=key).chat_stream("缓存测试问题", session_id="s4")]
+    assert [e["content"] for e in second if e["type"] == "token"] == ["使用 Docker"]
+    assert first[-1]["type"] == second[-1]["type"] == "done"
+    get_answer_cache().invalidate_doc(1)
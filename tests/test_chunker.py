@@ -0,0 +1,93 @@
+import pytest
+
+from app.models.schemas import Doc, DocChunk
+from app.services.chunker import StructuredChunker, parse_blocks
+from app.services.chunk_store import get_chunks
+
+LAKE_BODY = (
+    '<!doctype lake><meta name="doc-version" content="1" />'
+    '<h2>部署</h2><p>使用 <b>Docker</b> 部署</p>'
+    '<card type="block" name="codeblock" '
+    'value="data:%7B%22mode%22%3A%22bash%22%2C%22code%22%3A%22docker%20run%20-d%20app%5Cnecho%20ok%22%7D"></card>'
+    '<table><tr><td>参数</td><td>说明</td></tr><tr><td>port</td><td>端口</td></tr></table>'
+)
+
+MARKDOWN_BODY = "# 安装\n\n下载安装包\n\n```bash\npip install app\n\napp --help\n```\n\n| 参数 | 说明 |\n|---|---|\n| port | 端口 |\n\n## 配置\n修改 <b>config</b>"
+
+
+def test_parse_lake_blocks():
+    blocks = [(b.kind, b.text) for b in parse_blocks(LAKE_BODY)]
+    assert blocks == [
+        ("heading", "部署"),
+        ("text", "使用 Docker 部署"),
+        ("code", "docker run -d app\necho ok"),
+        ("table", "参数 | 说明\nport | 端口"),
+    ]
+
+
+def test_parse_markdown_blocks():
+    blocks = [(b.kind, b.text) for b in parse_blocks(MARKDOWN_BODY)]
+    assert blocks == [
+        ("heading", "安装"),
+        ("text", "下载安装包"),
+        ("code", "pip install app\n\napp --help"), # 代码块内的空行不拆分段落
+        ("table", "参数 | 说明\nport | 端口"),
+        ("heading", "配置"),
+        ("text", "修改 config"),
+    ]
+
+
+def test_chunks_break_at_headings_and_keep_code_whole():
+    body = "# A\n\n" + "段落。" * 30 + "\n\n```\n" + "\n".join(f"line {i}" for i in range(20)) + "\n```\n\n## B\n\n结尾"
+    text, chunks = StructuredChunker(chunk_size=200, overlap=20).chunk(body)
+
+    for chunk in chunks:
+        assert chunk.end - chunk.start <= 200
+        assert text[chunk.start:chunk.end] == text[chunk.start:chunk.end].strip()
+    code = next(c for c in chunks if c.kind == "code")
+    assert text[code.start:code.end].startswith("line 0") and "line 19" in text[code.start:code.end]
+    assert chunks[-1].heading == "A > B" and text[chunks[-1].start:chunks[-1].end] == "B\n\n结尾"
+
+
+def test_oversized_paragraph_is_split_at_sentences_with_overlap():
+    text, chunks = StructuredChunker(chunk_size=100, overlap=30).chunk("第一句话很长很长。" * 40)
+
+    assert len(chunks) > 3
+    for prev, cur in zip(chunks, chunks[1:]):
+        assert cur.start < prev.end # 相邻片段有重叠
+        assert text[prev.end - 1] == "。"
+
+
+def point_ids(rag) -> set:
+    points, _ = rag.client.scroll(rag.collection_name, limit=100)
+    return {str(p.id) for p in points}
+
+
+@pytest.mark.asyncio
+@pytest.mark.rag_settings(CHUNK_SIZE=60)
+async def test_upsert_only_embeds_changed_chunks(mock_db, rag):
+    sections = [f"## 第{i}节\n\n" + f"第{i}节的内容。" * 5 for i in range(3)]
+    doc = Doc(uuid="u1", yuque_id=1, slug="a", repo_id=1, title="手册", type="DOC", body="\n\n".join(sections))
+    await doc.insert()
+    await rag.upsert_doc_to_vector_db(doc)
+
+    rows = await get_chunks(1)
+    assert len(rows) == 3 and point_ids(rag) == {r.point_id for r in rows}
+    stored = await Doc.find_one(Doc.yuque_id == 1)
+    assert all(stored.plain_text[r.text_start:r.text_end] == r.text for r in rows)
+
+    embedded = rag.embeddings.documents
+    embedded.clear()
+
+    # 修改中间一节：只向量化这一节，旧的点被删除
+    sections[1] = "## 第1节\n\n" + "改写后的内容。" * 3
+    doc.body = "\n\n".join(sections)
+    await rag.upsert_doc_to_vector_db(doc)
+
+    new_rows = await get_chunks(1)
+    assert len(embedded) == 1 and "改写后的内容" in embedded[0]
+    assert point_ids(rag) == {r.point_id for r in new_rows}
+    assert new_rows[0].point_id == rows[0].point_id and new_rows[2].point_id == rows[2].point_id
+
+    await rag.delete_doc(1)
+    assert point_ids(rag) == set() and await DocChunk.find_all().count() == 0
@@ -0,0 +1,65 @@
+import pytest
+from langchain_core.documents import Document
+
+from app.models.schemas import Doc
+from app.services.context_builder import ContextBuilder, chunk_span, merge_spans
+from app.services.token_counter import count_tokens
+
+PARAGRAPHS = [f"第{i}段：" + "背景说明。" * 20 for i in range(20)]
+PLAIN_TEXT = "\n\n".join(PARAGRAPHS)
+
+
+async def insert_doc(yuque_id: int, title: str, plain_text: str):
+    await Doc(uuid=f"u{yuque_id}", yuque_id=yuque_id, slug=f"doc-{yuque_id}", repo_id=1,
+              title=title, type="DOC", body="<p>raw markup</p>", plain_text=plain_text).insert()
+
+
+def hit(doc_id: int, text: str, start: int = None) -> Document:
+    metadata = {"doc_id": doc_id}
+    if start is not None:
+        metadata.update(text_start=start, text_end=start + len(text))
+    return Document(page_content=text, metadata=metadata)
+
+
+def test_chunk_span_uses_offsets_or_falls_back_to_search():
+    target = PARAGRAPHS[5]
+    start = PLAIN_TEXT.index(target)
+    assert chunk_span(hit(1, target, start), PLAIN_TEXT) == (start, start + len(target))
+    # 旧切片没有偏移，且首个切片带有标题行
+    assert chunk_span(hit(1, "# 标题\n\n" + PARAGRAPHS[0]), PLAIN_TEXT) == (0, len(PARAGRAPHS[0]))
+    assert chunk_span(hit(1, "不存在的内容"), PLAIN_TEXT) is None
+
+
+def test_merge_spans():
+    assert merge_spans([(10, 20), (0, 5), (15, 30)]) == [(0, 5), (10, 30)]
+
+
+@pytest.mark.asyncio
+async def test_build_expands_hits_within_budget(mock_db):
+    await insert_doc(1, "部署手册", PLAIN_TEXT)
+    target = PARAGRAPHS[10]
+    start = PLAIN_TEXT.index(target)
+
+    builder = ContextBuilder(token_budget=400, max_docs=3, expand_step=200)
+    context, docs = await builder.build([(hit(1, target, start), 0.9)])
+
+    assert [d.yuque_id for d in docs] == [1]
+    assert "=== Document: 部署手册 ===" in context
+    assert target in context
+    # 命中段落前后的内容被扩展进来，但整体不超过预算
+    assert PARAGRAPHS[9][-20:] in context and PARAGRAPHS[11][:20] in context
+    assert PARAGRAPHS[0] not in context
+    assert count_tokens(context) <= 400 + 20
+    assert "raw markup" not in context
+
+
+@pytest.mark.asyncio
+async def test_build_limits_docs_and_keeps_relevance_order(mock_db):
+    for i in (1, 2, 3):
+        await insert_doc(i, f"文档{i}", f"文档{i}的内容")
+    results = [(hit(3, "文档3的内容"), 0.9), (hit(1, "文档1的内容"), 0.8), (hit(2, "文档2的内容"), 0.7)]
+
+    context, docs = await ContextBuilder(token_budget=1000, max_docs=2).build(results)
+    assert [d.yuque_id for d in docs] == [3, 1]
+    assert context.index("文档3") < context.index("文档1")
+    assert "文档2的内容" not in context
@@ -0,0 +1,74 @@
+import os
+import time
+import pytest
+
+os.environ.setdefault("YUQUE_TOKEN", "test_token")
+
+from app.services.embedding_cache import EmbeddingCache, CachedQueryEmbeddings
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [float(len(text)), 1.0]
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+def test_normalized_queries_share_entry():
+    cache = EmbeddingCache(max_size=10)
+    cache.put("部署 ", [1.0])
+    assert cache.get("部署") == [1.0]
+    cache.put("ＡＰＩ  Gateway", [2.0])
+    assert cache.get("api gateway") == [2.0]
+    assert cache.stats()["hits"] == 2
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    cache = EmbeddingCache(max_size=2, ttl=10)
+    cache.put("a", [1.0])
+    cache.put("b", [2.0])
+    cache.get("a")  # a becomes most recently used
+    cache.put("c", [3.0])
+    assert cache.get("b") is None
+    assert cache.get("a") == [1.0]
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert cache.get("a") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_persistence_roundtrip(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = EmbeddingCache(max_size=10, persist_path=path, namespace="model-a")
+    cache.put("周报模板", [0.5, 0.25])
+    cache.save()
+
+    restored = EmbeddingCache(max_size=10, persist_path=path, namespace="model-a")
+    restored.load()
+    assert restored.get("周报模板") == [0.5, 0.25]
+
+    other_model = EmbeddingCache(max_size=10, persist_path=path, namespace="model-b")
+    other_model.load()
+    assert other_model.get("周报模板") is None
+
+
+@pytest.mark.asyncio
+async def test_cached_embeddings_skip_repeat_calls():
+    inner = CountingEmbeddings()
+    embeddings = CachedQueryEmbeddings(inner, EmbeddingCache(max_size=10))
+    first = embeddings.embed_query("部署")
+    second = await embeddings.aembed_query(" 部署")
+    assert first == second
+    assert inner.calls == 1
+    # 文档向量化不走缓存
+    embeddings.embed_documents(["部署"])
+    assert inner.calls == 2
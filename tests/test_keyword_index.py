@@ -0,0 +1,134 @@
+import pytest
+from app.core.config import settings
+from app.models.schemas import Doc
+from app.services import keyword_index
+from app.services.keyword_index import (
+    KeywordIndex, rebuild_keyword_index, get_keyword_index, index_doc, backfill_plain_text, save_keyword_index
+)
+
+
+@pytest.fixture
+def fresh_keyword_index(monkeypatch):
+    # 进程内的全局索引在测试结束后恢复，避免后续测试依赖执行顺序
+    monkeypatch.setattr(keyword_index, "_keyword_index", None)
+
+
+def build_index():
+    index = KeywordIndex()
+    index.add(1, 10, "服务部署指南", "介绍如何使用 Docker 部署后端服务。")
+    index.add(2, 10, "周报模板", "每周五提交周报，模板见附件。")
+    index.add(3, 20, "前端开发规范", "React 组件命名与目录结构约定，部署由 CI 完成。")
+    return index
+
+
+def test_chinese_query_ranks_title_match_first():
+    index = build_index()
+    results = index.search("部署")
+    assert [doc_id for doc_id, _ in results] == [1, 3]
+    assert results[0][1] > results[1][1]
+
+
+def test_repo_filter_and_remove():
+    index = build_index()
+    assert [doc_id for doc_id, _ in index.search("部署", repo_id=20)] == [3]
+
+    index.remove(3)
+    assert [doc_id for doc_id, _ in index.search("部署")] == [1]
+
+    # 更新文档会替换旧内容
+    index.add(1, 10, "服务运维手册", "日志与监控")
+    assert index.search("部署") == []
+    assert [doc_id for doc_id, _ in index.search("监控")] == [1]
+
+
+def test_snapshot_roundtrip(tmp_path):
+    index = build_index()
+    index.remove(2)
+    path = str(tmp_path / "keyword.idx")
+    index.save(path)
+
+    restored = KeywordIndex()
+    assert restored.load(path)
+    assert len(restored) == 2
+    assert restored.search("部署") == index.search("部署")
+    assert restored.stats()["tombstones"] == 0
+
+
+@pytest.mark.asyncio
+async def test_save_in_thread_ignores_writes_after_snapshot(tmp_path, monkeypatch, fresh_keyword_index):
+    index = get_keyword_index()
+    for doc_id, repo_id, title, text in [(1, 10, "服务部署指南", "使用 Docker 部署"), (2, 10, "周报", "部署进度")]:
+        index.add(doc_id, repo_id, title, text)
+    index.ready = True
+    path = str(tmp_path / "keyword.idx")
+    monkeypatch.setattr(settings, "KEYWORD_INDEX_PATH", path)
+    await save_keyword_index()
+    assert KeywordIndex().load(path)
+
+    # 快照之后 (写文件期间) 的写入不进入本次快照，倒排表与文档表保持一致
+    payload = index.snapshot()
+    index.add(3, 20, "部署手册", "Docker 部署")
+    index.remove(1)
+    KeywordIndex.write_snapshot(payload, path)
+    restored = KeywordIndex()
+    assert restored.load(path)
+    assert {doc_id for doc_id, _ in restored.search("部署")} == {1, 2}
+
+
+@pytest.mark.asyncio
+async def test_rebuild_from_mongo(mock_db, fresh_keyword_index):
+    await Doc(uuid="u1", yuque_id=101, repo_id=1, slug="a", title="部署手册", type="DOC",
+              body="<p>使用 <b>Docker</b> 部署</p>").insert()
+    await Doc(uuid="u2", yuque_id=None, repo_id=1, slug="b", title="目录", type="TITLE").insert()
+
+    # 旧数据没有 plain_text，重建前先补齐
+    assert await backfill_plain_text() == 1
+    stored = await Doc.find_one(Doc.yuque_id == 101)
+    assert stored.plain_text == "使用 Docker 部署"
+
+    index = await rebuild_keyword_index()
+    assert index.ready
+    assert get_keyword_index() is index
+    assert [doc_id for doc_id, _ in index.search("docker")] == [101]
+
+    # 写入路径的增量更新作用于当前索引
+    index_doc(Doc(uuid="u3", yuque_id=102, repo_id=1, slug="c", title="Docker 入门", type="DOC"))
+    assert {doc_id for doc_id, _ in index.search("docker")} == {101, 102}
+
+
+@pytest.mark.asyncio
+async def test_toc_rename_reindexes_title(mock_db, fresh_keyword_index):
+    from app.services import doc_events
+
+    doc = Doc(uuid="u1", yuque_id=101, repo_id=1, slug="a", title="部署手册", type="DOC", plain_text="使用 Docker")
+    await doc.insert()
+    index_doc(doc)
+    for i in range(3):
+        get_keyword_index().add(200 + i, 1, f"周报{i}", "本周进展")
+    assert [doc_id for doc_id, _ in get_keyword_index().search("部署")] == [101]
+
+    # TOC 同步只写入了标题等结构字段，正文仍在 MongoDB 中
+    await Doc.find_one(Doc.yuque_id == 101).update({"$set": {"title": "运维指南"}})
+    outline = Doc(uuid="u1", yuque_id=101, repo_id=1, slug="a", title="运维指南", type="DOC")
+    await doc_events.doc_outline_saved(outline, {"title": "部署手册", "repo_id": 1})
+    assert get_keyword_index().search("部署") == []
+    assert [doc_id for doc_id, _ in get_keyword_index().search("运维")] == [101]
+    assert [doc_id for doc_id, _ in get_keyword_index().search("docker")] == [101]
+
+
+async def test_search_route_keeps_doc_shape(mock_db, fresh_keyword_index):
+    from app.api.routes import search_docs
+
+    doc = Doc(uuid="u1", yuque_id=101, repo_id=1, slug="a", title="部署手册", type="DOC",
+              body="# 部署", body_html="<h1>部署</h1>", plain_text="部署")
+    await doc.insert()
+    index_doc(doc)
+    for i in range(3):
+        get_keyword_index().add(200 + i, 1, f"周报{i}", "本周进展")
+    get_keyword_index().ready = True
+
+    results = await search_docs(q="部署", limit=10)
+    assert [d.yuque_id for d in results] == [101]
+    assert isinstance(results[0], Doc)
+    assert results[0].body is None
+    assert results[0].body_html == "<h1>部署</h1>"
@@ -0,0 +1,23 @@
+from app.services.mmr import mmr_rerank
+
+
+def test_lambda_one_is_plain_similarity_order():
+    query = [1.0, 0.0]
+    vectors = [[0.5, 0.5], [1.0, 0.0], [0.9, 0.1]]
+    assert mmr_rerank(query, vectors, k=3, lambda_mult=1.0) == [1, 2, 0]
+
+
+def test_near_duplicates_are_pushed_down():
+    query = [1.0, 0.0, 0.0]
+    vectors = [
+        [1.0, 0.05, 0.0],   # 最相关
+        [1.0, 0.06, 0.0],   # 与第一个几乎相同
+        [0.7, 0.0, 0.7],    # 相关但方向不同
+    ]
+    assert mmr_rerank(query, vectors, k=2, lambda_mult=1.0) == [0, 1]
+    assert mmr_rerank(query, vectors, k=2, lambda_mult=0.5) == [0, 2]
+
+
+def test_handles_empty_and_small_inputs():
+    assert mmr_rerank([1.0, 0.0], [], k=3) == []
+    assert mmr_rerank([1.0, 0.0], [[0.0, 0.0], [1.0, 0.0]], k=5) == [1, 0]
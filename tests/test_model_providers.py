@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services import model_providers
+from app.services.model_providers import (
+    HashingEmbeddings, InstrumentedEmbeddings, ModelMetrics, create_chat_model, get_embeddings
+)
+
+
+def test_hashing_embeddings_are_deterministic_and_normalized():
+    embeddings = HashingEmbeddings(dim=64)
+    first, second, other = embeddings.embed_documents(["部署 Kubernetes 集群", "部署 Kubernetes 集群", "报销流程"])
+    assert first == second and len(first) == 64
+    assert np.linalg.norm(first) == pytest.approx(1.0, abs=1e-5)
+    query = embeddings.embed_query("Kubernetes 部署")
+    assert np.dot(query, first) > np.dot(query, other)
+
+
+def test_instrumented_embeddings_record_calls_and_errors():
+    class Failing(HashingEmbeddings):
+        def embed_query(self, text):
+            raise RuntimeError("boom")
+
+    metrics = ModelMetrics()
+    InstrumentedEmbeddings(HashingEmbeddings(dim=8), "fake", metrics).embed_documents(["a b", "c"])
+    with pytest.raises(RuntimeError):
+        InstrumentedEmbeddings(Failing(dim=8), "fake", metrics).embed_query("x")
+
+    stats = metrics.stats()["embedding:fake"]
+    assert stats["calls"] == 2 and stats["items"] == 3 and stats["errors"] == 1
+    assert stats["tokens"] == 0 # 不计费的提供方不统计 token
+
+
+def test_instrumented_embeddings_estimate_openai_tokens():
+    metrics = ModelMetrics()
+    InstrumentedEmbeddings(HashingEmbeddings(dim=8), "openai", metrics).embed_documents(["部署流程", "deploy app"])
+    # 中文约 1 字 1 token，其他字符约 4 个 1 token
+    assert metrics.stats()["embedding:openai"]["tokens"] == 4 + 3
+
+
+def test_fake_providers_and_unknown_provider(monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_DIMENSIONS", 0)
+    monkeypatch.setattr(model_providers, "_embeddings", {})
+    embeddings = get_embeddings("fake")
+    assert get_embeddings("fake") is embeddings # 进程内复用
+    assert len(embeddings.embed_query("hello")) == model_providers.FAKE_EMBEDDING_DIMENSIONS
+
+    with pytest.raises(ValueError):
+        get_embeddings("nope")
+    with pytest.raises(ValueError):
+        create_chat_model("nope")
+
+
+def test_local_provider_requires_model_dir_and_dimensions(monkeypatch):
+    monkeypatch.setattr(model_providers, "_embeddings", {})
+    monkeypatch.setattr(settings, "LOCAL_EMBEDDING_MODEL_DIR", "")
+    with pytest.raises(ValueError):
+        get_embeddings("local")
+
+
+@pytest.mark.asyncio
+async def test_chat_model_calls_are_recorded():
+    metrics = model_providers.get_model_metrics()
+    before = metrics.stats().get("chat:fake", {}).get("calls", 0)
+    llm = create_chat_model("fake")
+    answer = await llm.ainvoke("你好")
+    assert answer.content == model_providers.FAKE_LLM_RESPONSE
+    stats = metrics.stats()["chat:fake"]
+    assert stats["calls"] == before + 1 and stats["tokens"] > 0
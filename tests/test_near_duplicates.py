@@ -0,0 +1,71 @@
+import pytest
+
+from app.models.schemas import Doc
+from app.services import doc_events, near_duplicates
+from app.services.near_duplicates import NearDuplicateIndex, hamming, rebuild_duplicate_index, text_simhash
+
+REPORT = (
+    "本周完成了订单服务的灰度发布，修复了支付回调重复通知的问题，"
+    "补充了库存扣减的幂等校验，并整理了上线检查清单。下周计划推进结算服务的拆分，"
+    "评估消息队列的积压告警阈值，同时配合测试完成回归用例的补充与性能压测，"
+    "另外需要与运维确认新机房的网络策略和数据库主从切换演练的时间安排。"
+    "风险方面，结算服务拆分涉及历史数据迁移，需要提前准备回滚方案；"
+    "压测环境资源紧张，可能影响排期。本周共处理线上工单十二个，其中三个与支付回调相关，已全部关闭。"
+)
+OTHER = "知识库权限说明：成员按角色分为管理员、编辑者与只读成员。" * 8
+
+
+def test_simhash_distance():
+    base = text_simhash(REPORT)
+    # 只改动一两个字的副本距离很近，不相关的内容距离很远
+    edited = text_simhash(REPORT.replace("本周", "这周"))
+    other = text_simhash(OTHER)
+    assert base is not None and -(1 << 63) <= base < (1 << 63)
+    assert hamming(base, text_simhash(REPORT)) == 0
+    assert hamming(base, edited) <= 3
+    assert hamming(base, other) > 10
+    assert text_simhash("空模板") is None
+
+
+def test_simhash_blocks_match_single_pass(monkeypatch):
+    # 超过一块的长文档分块累计投票，结果与一次性计算相同
+    text = "".join(f"工单{i}已关闭；" for i in range(5000))
+    blocked = text_simhash(text)
+    monkeypatch.setattr(near_duplicates, "SIMHASH_BLOCK", 1 << 20)
+    assert blocked == text_simhash(text)
+
+
+def test_clusters_and_collapse():
+    index = NearDuplicateIndex(max_distance=3)
+    index.add(1, text_simhash(REPORT), repo_id=1)
+    index.add(2, text_simhash(REPORT.replace("本周", "这周")), repo_id=2)
+    index.add(3, text_simhash(REPORT + "补充"), repo_id=1)
+    index.add(4, text_simhash(OTHER), repo_id=1)
+    assert index.clusters() == [[1, 2, 3]]
+    assert index.clusters(repo_id=2) == [[1, 2, 3]]
+    assert index.collapse([2, 4, 1, 3]) == [2, 4]
+
+    index.remove(2)
+    index.add(3, None)
+    assert index.clusters() == []
+    assert index.collapse([1, 3, 4]) == [1, 3, 4]
+
+
+@pytest.mark.asyncio
+async def test_rebuild_backfills_and_tracks_writes(mock_db):
+    await Doc(uuid="a", yuque_id=1, slug="r1", repo_id=1, title="周报", type="DOC", plain_text=REPORT).insert()
+    await Doc(uuid="b", yuque_id=2, slug="r2", repo_id=1, title="周报副本", type="DOC",
+              plain_text=REPORT, simhash=text_simhash(REPORT)).insert()
+
+    index = await rebuild_duplicate_index()
+    assert index.ready and near_duplicates.get_duplicate_index() is index
+    assert index.clusters() == [[1, 2]]
+    assert (await Doc.find_one(Doc.yuque_id == 1)).simhash == text_simhash(REPORT)
+    assert near_duplicates.collapse_duplicates([2, 1]) == [2]
+
+    copy = Doc(uuid="c", yuque_id=3, slug="r3", repo_id=2, title="周报", type="DOC",
+               plain_text=REPORT, simhash=text_simhash(REPORT))
+    await doc_events.doc_saved(copy)
+    assert index.clusters() == [[1, 2, 3]]
+    await doc_events.doc_removed(copy)
+    assert index.clusters() == [[1, 2]]
@@ -0,0 +1,34 @@
+import pytest
+
+from app.models.schemas import Doc, DocChunk, Member
+from app.services import sync_service
+
+
+def payloads(rag) -> list:
+    points, _ = rag.client.scroll(rag.collection_name, limit=100, with_payload=True)
+    return [p.payload for p in points]
+
+
+@pytest.mark.asyncio
+async def test_rename_and_author_change_skip_embedding(mock_db, rag, monkeypatch):
+    monkeypatch.setattr(sync_service, "RAGService", lambda: rag)
+    await Member(yuque_id=7, login="zhangsan", name="张三").insert()
+    doc = Doc(uuid="u1", yuque_id=1, slug="deploy", repo_id=1, title="部署指南", type="DOC", user_id=7,
+              body="<h2>准备</h2><p>安装 Docker。</p><h2>启动</h2><p>执行 docker compose up。</p>")
+    await doc.insert()
+    await rag.upsert_doc_to_vector_db(doc)
+    embedded = len(rag.embeddings.documents)
+    assert embedded > 0
+
+    service = sync_service.SyncService()
+    # TOC 同步发现文档改名并移动到另一个知识库
+    await service._update_toc_structure(2, {"uuid": "u1", "id": 1, "title": "部署手册", "type": "DOC", "url": "deploy-v2"})
+    metadata = [p["metadata"] for p in payloads(rag)]
+    assert {(m["title"], m["slug"], m["repo_id"]) for m in metadata} == {("部署手册", "deploy-v2", 2)}
+    assert all(m["author_name"] == "张三" and m["seq"] is not None for m in metadata) # 其余键不变
+    assert {c.repo_id for c in await DocChunk.find(DocChunk.doc_id == 1).to_list()} == {2}
+
+    await rag.update_author_name(7, "张三丰")
+    assert {p["metadata"]["author_name"] for p in payloads(rag)} == {"张三丰"}
+    assert all(p["page_content"] for p in payloads(rag))
+    assert len(rag.embeddings.documents) == embedded
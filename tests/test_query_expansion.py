@@ -0,0 +1,63 @@
+import pytest
+from langchain_core.documents import Document
+from pydantic import ValidationError
+
+from app.core.config import Settings
+from app.models.schemas import Doc
+from app.services.embedding_cache import CachedQueryEmbeddings, EmbeddingCache
+from app.services.query_expansion import keyword_sub_queries, rrf_fuse
+from tests.conftest import CountingEmbeddings
+
+
+def test_keyword_sub_queries():
+    assert keyword_sub_queries("服务怎么部署，以及数据库如何备份？", 3) == ["服务怎么部署", "数据库如何备份"]
+    assert keyword_sub_queries("How to deploy the service and how to back up the database", 3) == [
+        "How to deploy the service", "how to back up the database"
+    ]
+    # 单一方面的问题、名词短语中的 "与" 都不拆分
+    assert keyword_sub_queries("知识库权限与角色说明？", 3) == []
+    assert keyword_sub_queries("部署指南", 3) == []
+
+
+def test_invalid_expansion_mode_fails_at_startup():
+    assert Settings(YUQUE_TOKEN="x", CHAT_QUERY_EXPANSION="llm").CHAT_QUERY_EXPANSION == "llm"
+    with pytest.raises(ValidationError):
+        Settings(YUQUE_TOKEN="x", CHAT_QUERY_EXPANSION="bogus")
+
+
+def test_rrf_fuse_rewards_chunks_found_by_several_queries():
+    a, b, c = (Document(page_content=x, metadata={"_id": x}) for x in "abc")
+    fused = rrf_fuse([[(a, 0.9), (b, 0.8)], [(c, 0.9), (b, 0.7)]], k=60, limit=2)
+    assert [doc.metadata["_id"] for doc, _ in fused] == ["b", "a"]
+    assert fused[0][1] == pytest.approx(2 / 61)
+
+
+def test_cached_embeddings_batch_only_missing_queries():
+    base = CountingEmbeddings(dim=16)
+    embeddings = CachedQueryEmbeddings(base, EmbeddingCache(max_size=10))
+    first = embeddings.embed_query("部署")
+    vectors = embeddings.embed_queries(["部署", "备份", "监控"])
+    assert base.queries == [["部署"], ["备份", "监控"]]
+    assert vectors[0] == first and vectors[1] == base.embed_query("备份")
+
+
+@pytest.mark.asyncio
+@pytest.mark.rag_settings(CHAT_QUERY_EXPANSION="keywords", DUPLICATE_COLLAPSE=False)
+async def test_chat_retrieve_fuses_sub_queries(mock_db, rag):
+    docs = [
+        Doc(uuid="u1", yuque_id=1, slug="deploy", repo_id=1, title="部署指南", type="DOC",
+            body="<p>执行 docker compose up 部署服务。</p>"),
+        Doc(uuid="u2", yuque_id=2, slug="backup", repo_id=1, title="备份手册", type="DOC",
+            body="<p>使用 mongodump 备份数据库。</p>"),
+    ]
+    for doc in docs:
+        await doc.insert()
+        await rag.upsert_doc_to_vector_db(doc)
+    rag.embeddings.queries.clear()
+
+    results = await rag._chat_retrieve("docker compose 部署服务，以及 mongodump 备份数据库")
+    assert {doc.metadata["doc_id"] for doc, _ in results} == {1, 2}
+    # 原问题与两个子查询的向量一次算完，检索时不再逐条调用
+    assert rag.embeddings.queries == [[
+        "docker compose 部署服务，以及 mongodump 备份数据库", "docker compose 部署服务", "mongodump 备份数据库"
+    ]]
@@ -0,0 +1,76 @@
+import pytest
+
+from app.core.config import settings
+from app.models.schemas import Doc
+from app.services import reindex
+from app.services.vector_config import resolve_alias
+
+
+async def insert_docs(n: int):
+    for i in range(1, n + 1):
+        await Doc(uuid=f"u{i}", yuque_id=i, slug=f"doc-{i}", repo_id=1, title=f"文档{i}", type="DOC",
+                  body=f"<p>正文{i}</p>", plain_text=f"第{i}篇文档的正文内容").insert()
+
+
+def doc_ids(rag) -> set:
+    points, _ = rag.client.scroll(rag.collection_name, limit=100, with_payload=True)
+    return {p.payload["metadata"]["doc_id"] for p in points}
+
+
+@pytest.mark.asyncio
+async def test_new_collection_is_created_behind_alias(mock_db, rag):
+    target = resolve_alias(rag.client, settings.QDRANT_COLLECTION_NAME)
+    assert target and target.startswith(f"{settings.QDRANT_COLLECTION_NAME}_v")
+
+
+@pytest.mark.asyncio
+async def test_reindex_builds_new_collection_and_swaps_alias(mock_db, rag):
+    await insert_docs(7)
+    before = resolve_alias(rag.client, settings.QDRANT_COLLECTION_NAME)
+
+    result = await reindex.Reindexer(rag, batch_size=2, concurrency=2).run()
+
+    assert result["status"] == "done" and result["processed"] == 7 and result["failed"] == 0
+    assert resolve_alias(rag.client, settings.QDRANT_COLLECTION_NAME) == result["target"] != before
+    assert doc_ids(rag) == set(range(1, 8))
+    # 保留上一个版本用于回滚
+    assert rag.client.collection_exists(before)
+    assert reindex.rollback(rag) == before
+
+
+@pytest.mark.asyncio
+async def test_docs_changed_during_reindex_are_caught_up(mock_db, rag, monkeypatch):
+    await insert_docs(3)
+    original = reindex.Reindexer._index_all
+
+    async def index_then_edit(self, store, authors, progress):
+        await original(self, store, authors, progress)
+        # 模拟重建期间的 webhook：新增一篇、删除一篇
+        await Doc(uuid="u9", yuque_id=9, slug="doc-9", repo_id=1, title="新文档", type="DOC",
+                  body="<p>新</p>", plain_text="重建期间新增").insert()
+        reindex.note_doc_changed(9)
+        await (await Doc.find_one(Doc.yuque_id == 2)).delete()
+        reindex.note_doc_changed(2)
+
+    monkeypatch.setattr(reindex.Reindexer, "_index_all", index_then_edit)
+    result = await reindex.Reindexer(rag).run(keep_previous=False)
+
+    assert result["caught_up"] == 2
+    assert doc_ids(rag) == {1, 3, 9}
+
+
+@pytest.mark.asyncio
+async def test_failed_reindex_keeps_current_alias(mock_db, rag, monkeypatch):
+    await insert_docs(2)
+    before = resolve_alias(rag.client, settings.QDRANT_COLLECTION_NAME)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("embedding API down")
+
+    monkeypatch.setattr(rag.embeddings, "embed_documents", broken)
+    with pytest.raises(RuntimeError):
+        await reindex.Reindexer(rag).run()
+
+    assert resolve_alias(rag.client, settings.QDRANT_COLLECTION_NAME) == before
+    assert reindex.get_reindex_progress()["status"] == "failed"
+    assert [c.name for c in rag.client.get_collections().collections] == [before]
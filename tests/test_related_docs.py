@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from app.models.schemas import Doc
+from app.services import related_docs
+
+
+def test_nearest_neighbors_matches_brute_force():
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(size=(50, 8)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    indices, scores = related_docs.nearest_neighbors(matrix, k=5, batch_size=7)
+    sims = matrix @ matrix.T
+    np.fill_diagonal(sims, -np.inf)
+    assert indices.tolist() == np.argsort(-sims, axis=1)[:, :5].tolist()
+    assert np.allclose(scores, np.sort(sims, axis=1)[:, ::-1][:, :5])
+    assert related_docs.nearest_neighbors(matrix[:1], k=5, batch_size=7)[0].shape == (1, 0)
+
+
+@pytest.mark.asyncio
+async def test_build_and_lookup(mock_db, rag):
+    bodies = {
+        1: "<p>使用 Docker 部署服务，镜像构建与容器编排。</p>",
+        2: "<p>Docker 部署：构建镜像后启动容器，配置容器编排。</p>",
+        3: "<p>团队周报模板与会议纪要的写法。</p>",
+        4: "<p>会议纪要模板：周报与例会的记录方式。</p>",
+    }
+    for i, body in bodies.items():
+        doc = Doc(uuid=f"u{i}", yuque_id=i, slug=f"d{i}", repo_id=1, title=f"文档{i}", type="DOC", body=body)
+        await doc.insert()
+        await rag.upsert_doc_to_vector_db(doc)
+    # 只删了 MongoDB 的文档不参与计算
+    await (await Doc.find_one(Doc.yuque_id == 4)).delete()
+
+    report = await related_docs.RelatedDocsBuilder(rag, top_k=2).run()
+    assert report["status"] == "done" and report["docs"] == 3
+    points, _ = rag.client.scroll(related_docs.doc_vectors_collection(), limit=10)
+    assert sorted(p.id for p in points) == [1, 2, 3]
+
+    related = await related_docs.get_related("d1", limit=5)
+    assert [r["yuque_id"] for r in related] == [2, 3]
+    assert related[0]["score"] > related[1]["score"]
+    assert await related_docs.get_related("d1", limit=1) == related[:1]
+
+    # 新文档尚未计算时返回空列表，不存在的文档返回 None
+    await Doc(uuid="u5", yuque_id=5, slug="d5", repo_id=1, title="新文档", type="DOC").insert()
+    assert await related_docs.get_related("d5", limit=5) == []
+    assert await related_docs.get_related("missing", limit=5) is None
@@ -0,0 +1,31 @@
+from app.services.search_cache import SearchResultCache
+
+
+def test_hit_for_normalized_query():
+    cache = SearchResultCache(max_size=10)
+    generation = cache.generation(1)
+    cache.put("部署 流程", 1, 20, [{"title": "部署"}], generation)
+    assert cache.get("部署  流程 ", 1, 20) == [{"title": "部署"}]
+    assert cache.get("部署 流程", 1, 10) is None
+
+
+def test_repo_write_only_invalidates_affected_entries():
+    cache = SearchResultCache(max_size=10)
+    cache.put("q", 1, 20, [{"id": 1}], cache.generation(1))
+    cache.put("q", 2, 20, [{"id": 2}], cache.generation(2))
+    cache.put("q", None, 20, [{"id": 3}], cache.generation(None))
+
+    cache.invalidate_repo(1)
+
+    assert cache.get("q", 1, 20) is None
+    assert cache.get("q", 2, 20) == [{"id": 2}]
+    # 全局查询可能包含任意知识库的文档，因此同样失效
+    assert cache.get("q", None, 20) is None
+
+
+def test_results_computed_during_write_are_not_cached():
+    cache = SearchResultCache(max_size=10)
+    generation = cache.generation(1)
+    cache.invalidate_repo(1)  # 检索期间发生写入
+    cache.put("q", 1, 20, [{"id": 1}], generation)
+    assert cache.get("q", 1, 20) is None
@@ -94,3 +94,26 @@ async def test_delete_activity(mock_db):
     await service.delete_activity(1)
     
     assert await Activity.count() == 0
+
+
+@pytest.mark.asyncio
+async def test_create_activity_ignores_stale_stored_summary(mock_db):
+    from app.services.summarizer import content_fingerprint
+
+    service = FeedService()
+    # 库里的摘要对应的是旧内容 (例如拉取详情失败，摘要未随本次更新重新计算)
+    await Doc(uuid="u1", yuque_id=1, slug="test-doc", repo_id=456, title="Test Doc", type="DOC",
+              summary="旧摘要", summary_fingerprint=content_fingerprint("Test Doc", "Old Body")).insert()
+
+    await service.create_activity(MockPayload(action_type="update", body="New Body", body_html="<p>New Body</p>"))
+    activity = await Activity.find_one(Activity.doc_uuid == "1")
+    assert activity.summary == "New Body"
+
+    # 指纹与本次内容一致时复用预先计算的摘要
+    await Activity.find_all().delete()
+    await Doc.find_one(Doc.yuque_id == 1).update(
+        {"$set": {"summary_fingerprint": content_fingerprint("Test Doc", "New Body")}}
+    )
+    await service.create_activity(MockPayload(action_type="update", body="New Body", body_html="<p>New Body</p>"))
+    activity = await Activity.find_one(Activity.doc_uuid == "1")
+    assert activity.summary == "旧摘要"
@@ -0,0 +1,49 @@
+import inspect
+
+import pytest
+from langchain_qdrant import QdrantVectorStore
+
+from app.models.schemas import Doc, Member
+from app.services.slim_payload import SLIM_METADATA_KEYS, SlimQdrantVectorStore
+
+
+def test_build_payloads_matches_upstream_signature():
+    # 覆盖的是 langchain-qdrant 的私有方法，升级依赖后签名变化时在这里暴露
+    upstream = inspect.signature(QdrantVectorStore._build_payloads)
+    assert list(upstream.parameters) == list(inspect.signature(SlimQdrantVectorStore._build_payloads).parameters)
+
+    payloads = SlimQdrantVectorStore._build_payloads(
+        iter(["正文一", "正文二"]), [{"doc_id": 1, "title": "标题"}, {"doc_id": 2}], "page_content", "metadata"
+    )
+    assert payloads == [{"metadata": {"doc_id": 1}}, {"metadata": {"doc_id": 2}}]
+    assert SlimQdrantVectorStore._build_payloads(["x"], None, "page_content", "metadata") == [{"metadata": {}}]
+
+
+@pytest.mark.asyncio
+@pytest.mark.rag_settings(QDRANT_SLIM_PAYLOAD=True)
+async def test_slim_payload_is_hydrated_for_results(mock_db, rag):
+    await Member(yuque_id=7, login="zhangsan", name="张三").insert()
+    doc = Doc(uuid="u1", yuque_id=1, slug="deploy", repo_id=1, title="部署指南", type="DOC", user_id=7,
+              body="<h2>准备</h2><p>安装 Docker 与 compose 插件。</p><h2>启动</h2><p>执行 docker compose up 启动服务。</p>")
+    await doc.insert()
+    await rag.upsert_doc_to_vector_db(doc)
+    doc = await Doc.find_one(Doc.yuque_id == 1) # 带上同步时写入的 plain_text
+
+    points, _ = rag.client.scroll(rag.collection_name, limit=10, with_payload=True)
+    assert points and all(set(p.payload) == {"metadata"} for p in points)
+    assert all(set(p.payload["metadata"]) <= set(SLIM_METADATA_KEYS) for p in points)
+
+    results = await rag._hybrid_search("docker compose 启动", limit=5)
+    assert results[0]["title"] == "部署指南" and results[0]["slug"] == "deploy"
+    assert results[0]["author_name"] == "张三"
+    assert "compose" in results[0]["content"]
+
+    # 问答上下文按位置截取 plain_text，不需要切片正文
+    chunks = await rag._chat_retrieve("docker compose 启动")
+    context, docs = await rag.context_builder.build(chunks)
+    assert [d.yuque_id for d in docs] == [1] and "docker compose up" in context
+
+    # 正文未变的再次写入会覆盖旧 payload，仍保持精简
+    await rag.upsert_doc_to_vector_db(doc)
+    points, _ = rag.client.scroll(rag.collection_name, limit=10, with_payload=True)
+    assert all("page_content" not in p.payload for p in points)
@@ -0,0 +1,39 @@
+from app.services.snippet import SnippetEngine, extract_terms, get_snippet_engine
+
+
+def test_extract_terms_splits_chinese_into_bigrams():
+    terms = extract_terms("部署流程 Docker a")
+    assert terms["部署流程"] == terms["部署"] == terms["流程"] == 0
+    assert terms["docker"] == 1
+    assert "a" not in terms
+
+
+def test_chinese_query_without_spaces_is_highlighted():
+    text = "无关内容。" * 20 + "本文介绍部署的整体流程。" + "其他内容。" * 60
+    snippet = SnippetEngine("部署流程").snippet(text)
+    assert "<mark>部署</mark>" in snippet
+    assert "<mark>流程</mark>" in snippet
+    assert snippet.startswith("...") and snippet.endswith("...")
+
+
+def test_picks_window_covering_most_terms():
+    # 第一个命中只有 "docker"，后面的段落同时包含 docker 与 监控
+    text = "docker 开头。" + "填充文字。" * 60 + "使用 Docker 搭建监控。" + "结尾。" * 60
+    snippet = SnippetEngine("docker 监控").snippet(text)
+    assert "<mark>Docker</mark>" in snippet
+    assert "<mark>监控</mark>" in snippet
+
+
+def test_case_insensitive_and_regex_special_chars():
+    snippet = SnippetEngine("c++").snippet("Use C++ and c++ together")
+    assert snippet == "Use <mark>C++</mark> and <mark>c++</mark> together"
+
+
+def test_no_match_returns_prefix():
+    text = "abc" * 100
+    assert SnippetEngine("xyz").snippet(text) == text[:200] + "..."
+    assert SnippetEngine("").snippet(text) == text[:200] + "..."
+
+
+def test_engine_is_cached_per_query():
+    assert get_snippet_engine("部署 流程") is get_snippet_engine("部署 流程")
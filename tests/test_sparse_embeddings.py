@@ -0,0 +1,68 @@
+import zlib
+
+import pytest
+from qdrant_client import models
+
+from app.core.config import settings
+from app.models.schemas import Doc
+from app.services.rag_service import DENSE_VECTOR_NAME, SPARSE_VECTOR_NAME, RAGService
+from app.services.sparse_embeddings import LexicalSparseEmbeddings
+
+
+def test_sparse_vectors_use_stable_term_ids():
+    query = LexicalSparseEmbeddings().embed_query("部署流程 API")
+    # 中文按 bigram、英文按单词切分，维度为 CRC32，跨进程稳定
+    terms = ["部署", "署流", "流程", "api"]
+    assert query.indices == sorted(zlib.crc32(t.encode("utf-8")) for t in terms)
+    assert query.values == [1.0] * 4
+    assert LexicalSparseEmbeddings().embed_query("部署流程 API") == query
+
+    # 文档侧为饱和词频：tf=2 时 2 * (k1 + 1) / (2 + k1)
+    doc = LexicalSparseEmbeddings(k1=1.2).embed_documents(["部署 部署 api"])[0]
+    weights = dict(zip(doc.indices, doc.values))
+    assert weights[zlib.crc32("部署".encode("utf-8"))] == pytest.approx(2 * 2.2 / 3.2)
+    assert weights[zlib.crc32(b"api")] == pytest.approx(1.0)
+    assert doc.indices == sorted(set(doc.indices))
+
+
+@pytest.mark.rag_settings(QDRANT_HYBRID_SEARCH=True)
+def test_hybrid_mode_requires_sparse_collection(rag, monkeypatch):
+    assert rag.hybrid_mode
+    assert rag._collection_has_sparse(rag.collection_name)
+    assert rag._collection_has_named_dense(rag.collection_name)
+
+    # 旧集合只有匿名 dense 向量：回退到客户端混合检索
+    rag.client.create_collection(
+        "legacy_docs", vectors_config=models.VectorParams(size=64, distance=models.Distance.COSINE)
+    )
+    monkeypatch.setattr(settings, "QDRANT_COLLECTION_NAME", "legacy_docs")
+    legacy = RAGService(embeddings=rag.embeddings, client=rag.client)
+    assert not legacy._collection_has_sparse("legacy_docs")
+    assert not legacy._collection_has_named_dense("legacy_docs")
+    assert not legacy.hybrid_mode
+
+
+@pytest.mark.asyncio
+@pytest.mark.rag_settings(QDRANT_HYBRID_SEARCH=True, DUPLICATE_COLLAPSE=False)
+async def test_native_hybrid_search_with_repo_filter(mock_db, rag):
+    docs = [
+        Doc(uuid="u1", yuque_id=1, slug="deploy", repo_id=1, title="部署指南", type="DOC",
+            body="<p>执行 docker compose up 部署服务。</p>"),
+        Doc(uuid="u2", yuque_id=2, slug="backup", repo_id=1, title="备份手册", type="DOC",
+            body="<p>使用 mongodump 备份数据库。</p>"),
+        Doc(uuid="u3", yuque_id=3, slug="backup-ops", repo_id=2, title="运维备份", type="DOC",
+            body="<p>每晚 mongodump 备份数据库到对象存储。</p>"),
+    ]
+    for doc in docs:
+        await doc.insert()
+        await rag.upsert_doc_to_vector_db(doc)
+    points, _ = rag.client.scroll(rag.collection_name, limit=10, with_vectors=True)
+    assert all({DENSE_VECTOR_NAME, SPARSE_VECTOR_NAME} <= set(p.vector) for p in points)
+
+    results = await rag._native_hybrid_search("mongodump 备份数据库", limit=5)
+    assert {r["slug"] for r in results[:2]} == {"backup", "backup-ops"}
+    assert all(r["source_type"] == "hybrid" for r in results)
+
+    filtered = await rag._native_hybrid_search("mongodump 备份数据库", limit=5, repo_id=1)
+    assert filtered[0]["slug"] == "backup"
+    assert {r["repo_id"] for r in filtered} == {1}
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from app.core.config import settings
+from app.services.query_rewrite import needs_rewrite, query_similarity
+from app.services.rag_service import RAGService
+
+
+def test_needs_rewrite_heuristic():
+    assert not needs_rewrite("如何部署 Kubernetes 集群")
+    assert not needs_rewrite("How do I configure nginx reverse proxy")
+    assert needs_rewrite("它支持哪些参数")
+    assert needs_rewrite("为什么？")
+    assert needs_rewrite("那生产环境呢")
+    assert needs_rewrite("what about staging")
+
+
+def test_query_similarity():
+    assert query_similarity("Kubernetes 集群如何部署", "如何部署 Kubernetes 集群") > 0.8
+    assert query_similarity("它支持哪些参数", "Redis 支持哪些配置参数") < 0.8
+
+
+def make_rag(rewrite: str, events: list):
+    # 不连接 Qdrant / OpenAI：替换历史、改写模型、检索与上下文构建
+    rag = RAGService.__new__(RAGService)
+
+    class History:
+        async def load(self, session_id):
+            return [HumanMessage(content="Redis 怎么配置"), AIMessage(content="修改 redis.conf")]
+
+    async def fake_llm(prompt):
+        events.append("rewrite:start")
+        await asyncio.sleep(0.02)
+        events.append("rewrite:end")
+        return rewrite
+
+    async def retrieve(query, k, repo_id=None, mmr_lambda=1.0, fetch_k=None):
+        events.append(f"retrieve:{query}")
+        await asyncio.sleep(0.01)
+        return []
+
+    class Builder:
+        async def build(self, results):
+            return "", []
+
+    rag.history = History()
+    rag.llm = RunnableLambda(fake_llm)
+    rag._retrieve = retrieve
+    rag.context_builder = Builder()
+    return rag
+
+
+@pytest.mark.asyncio
+async def test_speculative_results_reused_when_rewrite_is_near_identical(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_SPECULATIVE_RETRIEVAL", True)
+    events = []
+    rag = make_rag("Redis 集群怎么部署", events)
+
+    prepared = await rag._prepare_chat("那 Redis 集群怎么部署", session_id="s1")
+
+    assert prepared["inputs"]["input"] == "Redis 集群怎么部署"
+    # 检索与改写并行开始，且只检索了一次 (复用原问题的结果)
+    assert events.index("retrieve:那 Redis 集群怎么部署") < events.index("rewrite:end")
+    assert [e for e in events if e.startswith("retrieve:")] == ["retrieve:那 Redis 集群怎么部署"]
+
+
+@pytest.mark.asyncio
+async def test_rewritten_query_is_retrieved_when_it_differs(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_SPECULATIVE_RETRIEVAL", True)
+    events = []
+    rag = make_rag("Redis 支持哪些配置参数", events)
+
+    await rag._prepare_chat("它支持哪些参数", session_id="s1")
+
+    assert events[-1] == "retrieve:Redis 支持哪些配置参数"
+
+
+@pytest.mark.asyncio
+async def test_self_contained_query_skips_rewrite(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_SPECULATIVE_RETRIEVAL", True)
+    events = []
+    rag = make_rag("unused", events)
+
+    prepared = await rag._prepare_chat("如何部署 Kubernetes 集群", session_id="s1")
+
+    assert events == ["retrieve:如何部署 Kubernetes 集群"]
+    assert prepared["inputs"]["input"] == "如何部署 Kubernetes 集群"
@@ -0,0 +1,44 @@
+import pytest
+
+from app.models.schemas import Doc
+from app.services import doc_events, summarizer
+from app.services.summarizer import content_fingerprint, extractive_summary
+
+BODY = (
+    "<h2>背景</h2><p>今天天气不错。备份策略决定了数据库故障后的恢复时间。</p>"
+    "<pre>mysqldump --all-databases > backup.sql</pre>"
+    "<p>我们每天凌晨对数据库做全量备份，每小时做增量备份。备份文件保留三十天。</p>"
+    "<p>附录：相关同事的联系方式见通讯录。</p>"
+)
+
+
+def test_extractive_summary_prefers_central_sentences():
+    summary = extractive_summary("数据库备份策略", BODY, max_chars=60)
+    assert "备份策略决定了数据库故障后的恢复时间" in summary
+    assert "mysqldump" not in summary # 代码块不参与摘要
+    assert len(summary) <= 63
+    # 选中的句子保持原文顺序
+    assert summary.index("备份策略") < summary.index("全量备份")
+    assert extractive_summary("空", "") == ""
+
+
+@pytest.mark.asyncio
+async def test_summary_computed_once_per_fingerprint(mock_db, monkeypatch):
+    doc = Doc(uuid="a", yuque_id=1, slug="backup", repo_id=1, title="数据库备份策略", type="DOC", body=BODY)
+    await doc.insert()
+    await doc_events.doc_saved(doc)
+
+    stored = await Doc.find_one(Doc.yuque_id == 1)
+    assert stored.summary and stored.summary_source == "extractive"
+    assert stored.summary_fingerprint == content_fingerprint(doc.title, BODY)
+
+    # 同步重新写入相同内容 (构造的对象不含摘要字段) 时不重复计算
+    calls = []
+    monkeypatch.setattr(summarizer, "extractive_summary", lambda *args: calls.append(args) or "")
+    again = Doc(uuid="a", yuque_id=1, slug="backup", repo_id=1, title="数据库备份策略", type="DOC", body=BODY)
+    assert await summarizer.summarize_doc(again) is False
+    assert calls == [] and again.summary == stored.summary
+
+    again.body = BODY + "<p>新增一段内容。</p>"
+    assert await summarizer.summarize_doc(again) is True
+    assert len(calls) == 1
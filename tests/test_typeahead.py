@@ -0,0 +1,95 @@
+import math
+
+import pytest
+
+from app.models.schemas import Doc, Member, Repo
+from app.services import doc_events, typeahead
+from app.services.typeahead import TypeaheadIndex, get_typeahead_index, rebuild_typeahead_index
+
+
+def make_index() -> TypeaheadIndex:
+    # Beanie 文档模型需在 init_beanie (mock_db) 之后才能实例化
+    index = TypeaheadIndex()
+    index.add_repo(Repo(yuque_id=1, name="运维手册", slug="ops", user_id=1))
+    index.add_doc(Doc(uuid="a", yuque_id=10, slug="deploy", repo_id=1, title="Kubernetes 部署指南", type="DOC", read_count=5))
+    index.add_doc(Doc(uuid="b", yuque_id=11, slug="deploy-old", repo_id=2, title="部署流程 (旧)", type="DOC", read_count=50))
+    index.add_doc(Doc(uuid="c", yuque_id=None, slug="dir", repo_id=1, title="部署目录", type="TITLE"))
+    index.add_member(Member(yuque_id=7, login="zhangsan", name="张三"))
+    return index
+
+
+def ids(results) -> list:
+    return [(r["type"], r["id"]) for r in results]
+
+
+@pytest.mark.asyncio
+async def test_prefix_word_and_cjk_infix_matches(mock_db):
+    index = make_index()
+    assert ids(index.suggest("kube")) == [("doc", 10)]
+    assert ids(index.suggest("部署")) == [("doc", 11), ("doc", 10)] # 从开头匹配优先，TITLE 节点不收录
+    assert ids(index.suggest("指南")) == [("doc", 10)]
+    assert index.suggest("kube")[0]["repo_name"] == "运维手册"
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(typeahead.lazy_pinyin is None, reason="pypinyin not installed")
+async def test_pinyin_and_initials(mock_db):
+    index = make_index()
+    assert ids(index.suggest("bushu")) == [("doc", 11), ("doc", 10)]
+    assert ids(index.suggest("zhangs")) == [("member", 7)]
+    assert ids(index.suggest("ywsc")) == [("repo", 1)]
+
+
+@pytest.mark.asyncio
+async def test_filters_and_updates(mock_db):
+    index = make_index()
+    assert ids(index.suggest("部署", types={"doc"}, repo_id=1)) == [("doc", 10)]
+
+    index.add_doc(Doc(uuid="a", yuque_id=10, slug="deploy", repo_id=1, title="Helm 发布指南", type="DOC"))
+    assert ids(index.suggest("kube")) == []
+    assert ids(index.suggest("helm")) == [("doc", 10)]
+    index.remove("doc", 10)
+    assert index.suggest("helm") == []
+
+
+class CountingBucket(list):
+    """记录查询时读取的锚点数"""
+    reads = 0
+
+    def __getitem__(self, i):
+        CountingBucket.reads += 1
+        return super().__getitem__(i)
+
+
+def test_lookup_work_is_bounded():
+    index = TypeaheadIndex()
+    index.begin_bulk()
+    for i in range(5000):
+        index.add("doc", i, f"第{i}号服务部署手册 service-{i}", {}, repo_id=1, weight=i)
+    index.end_bulk()
+    index._buckets = {c: CountingBucket(bucket) for c, bucket in index._buckets.items()}
+
+    for query in ("部署", "服务", "service", "bushu", "第1", "第42号"):
+        CountingBucket.reads = 0
+        assert index.suggest(query)
+        # 二分定位 + 至多 MAX_SCAN 个锚点，与条目数无关
+        bucket = index._buckets[query[0]]
+        assert CountingBucket.reads <= index.MAX_SCAN + math.ceil(math.log2(len(bucket))) + 1
+    assert CountingBucket.reads < 200 # 长前缀只扫描少量锚点
+
+
+@pytest.mark.asyncio
+async def test_rebuild_and_incremental_events(mock_db):
+    await Repo(yuque_id=1, name="运维手册", slug="ops", user_id=1).insert()
+    await Doc(uuid="a", yuque_id=10, slug="deploy", repo_id=1, title="部署指南", type="DOC").insert()
+    await Member(yuque_id=7, login="zhangsan", name="张三").insert()
+
+    index = await rebuild_typeahead_index()
+    assert index.ready and get_typeahead_index() is index
+    assert len(index) == 3
+
+    new_doc = Doc(uuid="b", yuque_id=11, slug="backup", repo_id=1, title="备份策略", type="DOC")
+    await doc_events.doc_saved(new_doc)
+    assert ids(index.suggest("备份")) == [("doc", 11)]
+    await doc_events.doc_removed(new_doc)
+    assert index.suggest("备份") == []
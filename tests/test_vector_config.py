@@ -0,0 +1,31 @@
+from qdrant_client import QdrantClient, models
+
+from app.core.config import settings
+from app.services import vector_config
+
+
+def test_sync_collection_config_applies_quantization_and_on_disk(monkeypatch):
+    client = QdrantClient(":memory:")
+    client.create_collection("docs", vectors_config=models.VectorParams(size=1536, distance=models.Distance.COSINE))
+    monkeypatch.setattr(settings, "QDRANT_QUANTIZATION", "scalar")
+    monkeypatch.setattr(settings, "QDRANT_VECTORS_ON_DISK", True)
+
+    updates = []
+    monkeypatch.setattr(client, "update_collection", lambda **kwargs: updates.append(kwargs))
+
+    assert vector_config.sync_collection_config(client, "docs") is True
+    assert isinstance(updates[0]["quantization_config"], models.ScalarQuantization)
+    assert updates[0]["vectors_config"][""].on_disk is True
+    assert vector_config.search_params().quantization.rescore is True
+    # 基准测试按参数覆盖 oversampling，其余与线上一致
+    assert vector_config.search_params("binary", oversampling=4.0).quantization.oversampling == 4.0
+    assert vector_config.search_params("") is None
+
+
+def test_sync_collection_config_rejects_dimension_change(monkeypatch):
+    client = QdrantClient(":memory:")
+    client.create_collection("docs", vectors_config=models.VectorParams(size=1536, distance=models.Distance.COSINE))
+    monkeypatch.setattr(settings, "EMBEDDING_DIMENSIONS", 512)
+
+    assert vector_config.sync_collection_config(client, "docs") is False
+    assert vector_config.dense_vector_params().size == 512
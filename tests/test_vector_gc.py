@@ -0,0 +1,35 @@
+import pytest
+
+from app.models.schemas import Doc, DocChunk
+from app.services import vector_gc
+
+
+def doc_ids(rag) -> set:
+    points, _ = rag.client.scroll(rag.collection_name, limit=100, with_payload=True)
+    return {p.payload["metadata"]["doc_id"] for p in points}
+
+
+@pytest.mark.asyncio
+async def test_orphan_vectors_are_deleted(mock_db, rag):
+    for i in range(1, 6):
+        doc = Doc(uuid=f"u{i}", yuque_id=i, slug=f"d{i}", repo_id=1, title=f"文档{i}", type="DOC",
+                  body=f"<p>第{i}篇文档的正文</p>")
+        await doc.insert()
+        await rag.upsert_doc_to_vector_db(doc)
+    # 模拟只删了 MongoDB、向量删除失败的文档，以及有正文却没有向量的文档
+    for i in (2, 4):
+        await (await Doc.find_one(Doc.yuque_id == i)).delete()
+    await Doc(uuid="u9", yuque_id=9, slug="d9", repo_id=1, title="未向量化", type="DOC", body="<p>x</p>").insert()
+
+    dry = await vector_gc.OrphanVectorCollector(rag, page_size=2, dry_run=True).run()
+    assert dry["orphan_docs"] == 2 and dry["deleted_points"] == 0
+    assert doc_ids(rag) == {1, 2, 3, 4, 5}
+
+    report = await vector_gc.OrphanVectorCollector(rag, page_size=2).run()
+    assert report["status"] == "done"
+    assert report["scanned_docs"] == 5 and report["orphan_docs"] == 2
+    assert report["deleted_points"] == report["orphan_points"] > 0
+    assert report["missing_docs"] == 1 and report["missing_sample"] == [9]
+    assert doc_ids(rag) == {1, 3, 5}
+    assert await DocChunk.find({"doc_id": {"$in": [2, 4]}}).count() == 0
+    assert vector_gc.get_gc_report() is report